@@ -0,0 +1,72 @@
+"""Benchmark of completion generation on synthetic command trees.
+
+Generation should scale linearly, so the time per command stays about the same
+when the tree grows. Run with ``python benchmarks/bench_generation.py``.
+"""
+
+import argparse
+import time
+
+from zcompy import Command, Option
+
+
+def synthetic_command(num_nodes: int, width: int = 10) -> Command:
+    """Command tree with num_nodes commands, every command has `width` sub-commands.
+
+    With a width of 1, the root has num_nodes / 2 sub-commands with one sub-command each.
+    """
+    root = Command("tool", "Synthetic tool")
+    if width == 1:
+        for idx in range(num_nodes // 2):
+            cmd = Command(f"cmd{idx}", f"Command {idx}")
+            cmd.add_sub_commands(Command("leaf", "Leaf command"))
+            cmd.sub_commands[0].add_options(Option((f"--opt{idx}", "-o"), "An option"))
+            root.add_sub_commands(cmd)
+        return root
+
+    queue, count, head = [root], 1, 0
+    while count < num_nodes:
+        parent = queue[head]
+        head += 1
+        for idx in range(min(width, num_nodes - count)):
+            cmd = Command(f"cmd{idx}", f"Command {count}")
+            cmd.add_options(Option((f"--opt{idx}", "-o"), "An option"))
+            parent.add_sub_commands(cmd)
+            queue.append(cmd)
+            count += 1
+    return root
+
+
+def bench(num_nodes: int, backend: str, width: int) -> float:
+    """Seconds to generate the completion source of a tree with num_nodes commands."""
+    cmd = synthetic_command(num_nodes, width)
+    start = time.perf_counter()
+    cmd.complete_source(as_file=True, backend=backend)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--backend", default="nested", choices=["nested", "table"])
+    parser.add_argument("--width", type=int, default=10, help="Sub-commands of every command.")
+    parser.add_argument(
+        "--max-ratio", type=float, default=3.0,
+        help="Fail if the time per command of the largest tree exceeds the smallest by this ratio.",
+    )
+    args = parser.parse_args()
+
+    per_node = []
+    for size in args.sizes:
+        elapsed = bench(size, args.backend, args.width)
+        per_node.append(elapsed / size)
+        print(f"{size:>8} commands: {elapsed:8.3f}s, {elapsed / size * 1e6:6.1f}us per command")
+
+    ratio = per_node[-1] / per_node[0]
+    print(f"time per command ratio: {ratio:.2f}")
+    if ratio > args.max_ratio:
+        raise SystemExit(f"Generation is not linear, ratio {ratio:.2f} > {args.max_ratio}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark of zsh reading the output of completion commands in every output protocol.
+
+The command is `cat` of a file with the lines of the protocol, so only the ingestion in zsh
+is timed, including `_describe` or `compadd -d` adding the matches. An interactive zsh with
+compinit runs in a pseudo-terminal, and the completion is triggered with <TAB> on a dummy
+command, so the functions run in a real completion context.
+Run with ``python benchmarks/bench_ingest.py``, zsh must be installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import os
+import pty
+import select
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+
+from zcompy.utils import OUTPUT_PROTOCOLS, write_completion_items, zsh_completion_function
+
+ZSHRC = """
+autoload -Uz compinit && compinit -u -D
+zmodload zsh/datetime
+{func_source}
+_zcompy_bench_all() {{
+  local start=$EPOCHREALTIME
+  repeat {repeat} _zcompy_bench
+  print -r -- $(( (EPOCHREALTIME - start) * 1000 / {repeat} )) > {result_file}
+}}
+compdef _zcompy_bench_all zcompy-bench
+"""
+
+
+def write_items(file_name: str, num_lines: int, protocol: str):
+    items = ((f"candidate-{idx}", f"Description of candidate {idx}") for idx in range(num_lines))
+    with open(file_name, "w") as f, contextlib.redirect_stdout(f):
+        write_completion_items(items, protocol)
+
+
+def complete_in_pty(zsh: str, zdotdir: str, result_file: str, timeout: float = 600):
+    """Start an interactive zsh reading `.zshrc` of zdotdir and complete `zcompy-bench`."""
+    master, slave = pty.openpty()
+    env = dict(os.environ, ZDOTDIR=zdotdir, TERM="xterm")
+    process = subprocess.Popen(
+        [zsh, "-i"], stdin=slave, stdout=slave, stderr=slave, env=env, start_new_session=True,
+    )
+    os.close(slave)
+    os.write(master, b"zcompy-bench \t")
+    deadline = time.monotonic() + timeout
+    try:
+        while not (os.path.exists(result_file) and os.path.getsize(result_file)):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"zsh didn't complete in {timeout}s")
+            # drain the terminal, zsh blocks once its output buffer is full
+            if select.select([master], [], [], 0.1)[0]:
+                with contextlib.suppress(OSError):
+                    os.read(master, 65536)
+    finally:
+        process.kill()
+        process.wait()
+        os.close(master)
+
+
+def bench(zsh: str, num_lines: int, protocol: str, repeat: int, tmp_dir: str) -> float:
+    """Milliseconds zsh takes to read and add num_lines lines of protocol."""
+    file_name = os.path.join(tmp_dir, f"{protocol}_{num_lines}.txt")
+    write_items(file_name, num_lines, protocol)
+    func_source = zsh_completion_function("_zcompy_bench", f"cat {file_name}", protocol=protocol)
+    zdotdir = os.path.join(tmp_dir, f"zdotdir_{protocol}_{num_lines}")
+    os.makedirs(zdotdir)
+    result_file = os.path.join(zdotdir, "result")
+    with open(os.path.join(zdotdir, ".zshrc"), "w") as f:
+        f.write(ZSHRC.format(
+            func_source=func_source, repeat=repeat, result_file=shlex.quote(result_file)
+        ))
+    complete_in_pty(zsh, zdotdir, result_file)
+    with open(result_file) as f:
+        return float(f.read().strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of every completion.")
+    args = parser.parse_args()
+
+    zsh = shutil.which("zsh")
+    if zsh is None:
+        print("zsh is not installed, skip ingestion benchmark")
+        return
+
+    print(f"{'lines':>8} " + " ".join(f"{x:>10}" for x in OUTPUT_PROTOCOLS) + "  (ms)")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_lines in args.lines:
+            times = [bench(zsh, num_lines, x, args.repeat, tmp_dir) for x in OUTPUT_PROTOCOLS]
+            print(f"{num_lines:>8} " + " ".join(f"{x:>10.1f}" for x in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark of the memory used by command trees converted from CLI frameworks.
+
+Memory is measured with tracemalloc, only objects created by the conversion are counted.
+Run with ``python benchmarks/bench_memory.py``, set PYTHONPATH to an older checkout of
+zcompy to compare.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import tracemalloc
+
+from zcompy import Files
+from zcompy.parser_command import ParserCommand
+
+
+def names_of_entries():
+    return ["foo", "bar"]
+
+
+def synthetic_parser(num_commands: int, num_options: int) -> argparse.ArgumentParser:
+    """Parser with num_commands sub-commands, each of them has num_options options."""
+    parser = argparse.ArgumentParser(prog="tool")
+    subparsers = parser.add_subparsers()
+    for idx in range(num_commands):
+        sub_parser = subparsers.add_parser(f"cmd{idx}", help=f"Command {idx}")
+        sub_parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+        sub_parser.add_argument("--input", "-i", type=str, help="Input file")
+        sub_parser.add_argument("--name", type=str, help="Name of the entry")
+        for opt_idx in range(num_options - 3):
+            sub_parser.add_argument(f"--opt{opt_idx}", choices=["a", "b", "c"], help="An option")
+    return parser
+
+
+def measure(func) -> tuple[int, object]:
+    """Bytes still allocated by func when it returns, and the return value of it."""
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = func()
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return current - start, result
+
+
+def bench_parser(num_commands: int, num_options: int) -> int:
+    parser = synthetic_parser(num_commands, num_options)
+
+    def convert():
+        parser_command = ParserCommand(parser)
+        parser_command.add_action_for_options("--input", action=Files(pattern="*.txt"))
+        parser_command.add_action_for_options("--name", action=names_of_entries)
+        return parser_command.to_command()
+
+    size, _ = measure(convert)
+    return size
+
+
+def bench_flags(num_flags: int) -> int:
+    from absl import flags
+
+    from zcompy.absl_command import AbslFlagsCommand
+
+    flag_values = flags.FlagValues()
+    for idx in range(num_flags):
+        flags.DEFINE_integer(f"flag{idx}", 0, f"Flag {idx}", flag_values=flag_values)
+    size, _ = measure(lambda: AbslFlagsCommand("tool", flag_values).to_command())
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", type=int, default=5000, help="Sub-commands of the CLI.")
+    parser.add_argument("--options", type=int, default=10, help="Options of every sub-command.")
+    parser.add_argument("--flags", type=int, default=50000, help="Flags of the absl CLI.")
+    args = parser.parse_args()
+
+    size = bench_parser(args.commands, args.options)
+    num_options = args.commands * args.options
+    print(
+        f"argparse {args.commands} commands, {num_options} options: "
+        f"{size / 2**20:7.1f} MiB, {size / num_options:6.0f} bytes per option"
+    )
+
+    try:
+        size = bench_flags(args.flags)
+    except ImportError:
+        print("absl is not installed, skip flags benchmark")
+    else:
+        print(
+            f"absl {args.flags} flags: {size / 2**20:7.1f} MiB, "
+            f"{size / args.flags:6.0f} bytes per flag"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,7 @@ from zcompy.action import Files, GitBranches
 from zcompy.option import Option
 
 
-def test_deep_nested_command():
-    """Test that subcommand names are returned in correct order."""
+def create_nested_command():
     cmd = Command("test", "Test command")
     cmd.add_options(Option("--verbose", "Enable verbose output"))
     cmd.add_options(Option("--config", "Config file", complete_func=Files()))
@@ -36,7 +35,12 @@ def test_deep_nested_command():
     sub1.add_sub_commands([sub1a, sub1b])
     sub1a.add_sub_commands([sub1a1, sub1a2])
     sub1a1.add_sub_commands(leaf1)
+    return cmd
+
 
+def test_deep_nested_command():
+    """Test that subcommand names are returned in correct order."""
+    cmd = create_nested_command()
     source = cmd.complete_source(as_file=False)
     with open(os.path.join(os.path.dirname(__file__), "_test"), "r") as f:
         answer = f.read()
@@ -45,3 +49,82 @@ def test_deep_nested_command():
     answer = [x for x in answer.splitlines() if x.strip()][1:-1]
     for x, y in zip(content, answer):
         assert x == y, f"Expected: {x}, but got: {y}"
+
+
+def test_split_nested_command(tmp_path):
+    cmd = create_nested_command()
+    cmd.completion_entry(output_dir=str(tmp_path), split=True)
+
+    main_source = (tmp_path / "_test").read_text()
+    assert "\n_test() {" in main_source
+    assert "_test_sub1() {" not in main_source
+    autoload_line = next(x for x in main_source.splitlines() if x.startswith("autoload -Uz"))
+
+    autoload = cmd.autoload_functions()
+    assert sorted(autoload_line.split()[2:]) == sorted(autoload)
+    for name, content in autoload.items():
+        assert (tmp_path / name).read_text() == content
+        assert content.startswith("#autoload\n")
+
+    # autoloaded bodies define the same functions as the single file output
+    functions = dict(cmd.main_functions())
+    for name, content in autoload.items():
+        body = content.split("\n", 2)[2].rstrip("\n")
+        assert functions[name].strip() == f"{name}() {{\n{body}\n}}"
+
+
+def test_split_without_nested_sub_commands():
+    cmd = Command("flat", "Flat command")
+    cmd.add_sub_commands(Command("run", "Run it"))
+    assert cmd.autoload_functions() == {}
+    assert cmd.complete_source(split=True) == cmd.complete_source()
+
+
+def create_repeated_command():
+    def common_options():
+        return [
+            Option(("--verbose", "-v"), "Verbose output"),
+            Option(("--config", "-c"), "Config file", complete_func=Files()),
+        ]
+
+    cmd = Command("rep", "Repeated command", options=common_options())
+    for group in ("alpha", "beta", "gamma"):
+        group_cmd = Command(group, f"Group {group}", options=common_options())
+        group_cmd.add_sub_commands([
+            Command(x, f"Command {x}", options=common_options()) for x in ("get", "set")
+        ])
+        cmd.add_sub_commands(group_cmd)
+    cmd.add_sub_commands(Command("other", "Other", options=[Option("--all", "All")]))
+    return cmd
+
+
+def test_dedup_nested_command():
+    cmd = create_repeated_command()
+    source = cmd.complete_source(as_file=True, dedup=True)
+    assert len(source) * 2 < len(cmd.complete_source(as_file=True))
+
+    functions = dict(cmd.main_functions(dedup=True))
+    assert list(functions) == [
+        "_rep_subcommands", "_rep__args_0", "_rep_alpha_subcommands", "_rep_alpha", "_rep",
+    ]
+    leaf = cmd.get_sub_command("alpha").get_sub_command("get")
+    assert functions["_rep__args_0"] == (
+        f"\n_rep__args_0() {{\n{leaf.arguments_with_options(indent_length=1)}\n}}\n"
+    )
+    assert functions["_rep_alpha"].count("          _rep__args_0\n") == 2
+    assert functions["_rep"].count("          _rep_alpha\n") == 3
+    assert "'(--all)'--all'[All]'" in functions["_rep"]  # unique blocks stay inline
+
+    # nothing shared, nothing changes
+    cmd = create_nested_command()
+    assert cmd.complete_source(as_file=True, dedup=True) == cmd.complete_source(as_file=True)
+
+
+def test_dedup_split_nested_command(tmp_path):
+    cmd = create_repeated_command()
+    cmd.completion_entry(output_dir=str(tmp_path), split=True, dedup=True)
+    main_source = (tmp_path / "_rep").read_text()
+    assert "autoload -Uz _rep__args_0 _rep_alpha_subcommands _rep_alpha\n" in main_source
+    for name in ("_rep__args_0", "_rep_alpha_subcommands", "_rep_alpha"):
+        assert (tmp_path / name).read_text().startswith("#autoload\n")
+    assert not (tmp_path / "_rep_beta").exists()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import os
+import re
+
+import pytest
+from test_mytool import create_mytool_command
+from test_mytool_complex import create_mytool_complex_command
+from test_nested_command import create_nested_command
+
+from zcompy.table_backend import command_tables
+
+
+def shell_words(text: str) -> list[str]:
+    """Split one word of `_arguments` spec source, with quote removal and brace expansion."""
+    words, quoted = [""], False
+    idx = 0
+    while idx < len(text):
+        char = text[idx]
+        if char == "'":
+            quoted = not quoted
+        elif char == "\\" and not quoted:
+            idx += 1
+            words = [w + text[idx] for w in words]
+        elif char == "{" and not quoted:
+            end = text.index("}", idx)
+            alternatives = text[idx + 1:end].split(",")
+            words = [w + alt for w in words for alt in alternatives]
+            idx = end
+        else:
+            words = [w + char for w in words]
+        idx += 1
+    return words
+
+
+def parse_nested_fixture(file_name: str, root: str):
+    """Parse specs and sub-commands of every command path from a nested completion file."""
+    with open(os.path.join(os.path.dirname(__file__), file_name)) as f:
+        lines = f.read().splitlines()
+
+    specs, subcmds = {}, {}
+    func_path, case_label, current = None, None, None
+    for line in lines:
+        func_match = re.match(r"^_(\w+)\(\) \{$", line)
+        if func_match:
+            func_path = " ".join(func_match.group(1).split("_"))
+            case_label = None
+            continue
+        stripped = line.strip()
+        if current is not None:
+            word = stripped.rstrip("\\").strip()
+            if word not in ("'1: :->cmds'", "'*:: :->args'"):
+                current.extend(shell_words(word))
+            if not stripped.endswith("\\"):
+                current = None
+            continue
+        label_match = re.match(r"^(\S+)\)$", stripped)
+        if label_match and label_match.group(1) not in ("cmds", "args"):
+            case_label = label_match.group(1)
+        elif stripped.startswith("_arguments"):
+            path = f"{func_path} {case_label}" if case_label else func_path
+            current = specs.setdefault(path, [])
+            if not stripped.endswith("\\"):
+                current = None
+        elif stripped.startswith('"') and func_path.endswith(" subcommands"):
+            path = func_path[:-len(" subcommands")]
+            subcmds.setdefault(path, []).append(stripped.strip('"'))
+    specs = {k: v for k, v in specs.items() if v}
+    return specs, subcmds
+
+
+@pytest.mark.parametrize("create_command, fixture", [
+    (create_mytool_command, "_mytool"),
+    (create_mytool_complex_command, "_mytool_complex"),
+    (create_nested_command, "_test"),
+])
+def test_table_backend_matches_nested(create_command, fixture):
+    cmd = create_command()
+    expected_specs, expected_subcmds = parse_nested_fixture(fixture, cmd.name)
+    specs, subcmds = command_tables(cmd)
+    assert specs == expected_specs
+    assert subcmds == expected_subcmds
+
+
+def test_table_backend_source():
+    cmd = create_nested_command()
+    source = cmd.complete_source(backend="table")
+
+    assert source.count("_arguments") == 2  # only in the generic dispatcher
+    assert "typeset -gA _test_specs _test_subcmds" in source
+    assert "  $'test sub1 sub1a sub1a1' $'(--server)--server[Deployment server]'" in source
+    subcmds = "$'sub1a1:Level 3 sub1a1 command\\nsub1a2:Level 3 sub1a2 command'"
+    assert f"  $'test sub1 sub1a' {subcmds}" in source
+    assert "_git_branches() {" in source
+    assert source.rstrip().endswith("_test_dispatch $'test'\n}")
+
+    with pytest.raises(AssertionError):
+        cmd.complete_source(backend="unknown")
@@ -1,6 +1,18 @@
+import os
+
 import pytest
 
-from zcompy.action import Hosts, OSEnv, ProcessID, URLs, UserNames
+from zcompy import Command, Option
+from zcompy.action import (
+    GitBranches,
+    GitCommits,
+    Hosts,
+    IndexedChoices,
+    OSEnv,
+    ProcessID,
+    URLs,
+    UserNames,
+)
 
 
 @pytest.mark.parametrize("cls, expected_type_hint, expected_action_source", [
@@ -14,3 +26,87 @@ def test_simple_action_type(cls, expected_type_hint, expected_action_source):
     instance = cls()
     assert instance.type_hint() == expected_type_hint
     assert instance.action_source() == expected_action_source
+
+
+def test_indexed_choices(tmp_path):
+    choices = {f"region-{idx:05d}": f"Region {idx}" for idx in range(50000)}
+    choices["eu:west"] = ""
+    action = IndexedChoices(choices, "regions", path=str(tmp_path), max_results=20)
+    assert action.type_hint() == "Choices"
+    assert action.action_source() == "_zcompy_choices_regions"
+
+    source = action.zsh_func_source()
+    assert "region-00001" not in source
+    assert f"local index={tmp_path / 'zcompy_choices_regions'} " in source
+    assert "LC_ALL=C look -- $prefix $index | head -n 20" in source
+
+    index_file = str(tmp_path / "zcompy_choices_regions")
+    lines = action.generated_files()[index_file].splitlines()
+    assert len(lines) == 50001
+    assert lines[0] == "eu\\:west"
+    assert lines[1] == "region-00000:Region 0"
+    assert lines == sorted(lines)
+
+    cmd = Command("tool", options=[Option("--region", "Region", complete_func=action)])
+    assert "'(--region)'--region'[Region]:Choices:_zcompy_choices_regions'" in cmd.complete_source()
+    assert not os.path.exists(index_file)  # rendering doesn't write the index
+
+    report = cmd.completion_entry(output_dir=str(tmp_path / "completion"))
+    assert index_file in report.written
+    assert not action.write_index()  # unchanged index is not written again
+
+    with pytest.raises(AssertionError):
+        IndexedChoices(("a", "b"), "bad name", path=str(tmp_path))
+
+
+def test_git_branches_cached():
+    assert GitBranches().zsh_helper_sources() == []
+    assert "_values 'branch' $branches" in GitBranches().zsh_func_source()
+
+    action = GitBranches(tags=True, cached=True, max_results=50)
+    assert action.action_source() == "_git_branches_and_tags_cached_50"
+    source = action.zsh_func_source()
+    assert "__zcompy_git_refs refs/heads refs/tags\n" in source
+    assert "branches=(${${(M)reply:#refs/heads/${(b)PREFIX}*}#refs/heads/})" in source
+    assert "tags=(${tags[1,50]})" in source
+    assert "git for-each-ref" not in source
+
+    cmd = Command("tool", positional_args=[action, GitBranches(cached=True)])
+    helpers = [x for x in cmd.shell_source_used_by_options() if "__zcompy_git_refs() {" in x]
+    assert len(helpers) == 1
+
+    source = GitBranches(remote=True, max_results=5).zsh_func_source()
+    assert "--count=5" in source
+    assert '"refs/remotes/$PREFIX*" "refs/remotes/$PREFIX*/**"' in source
+    assert "_wanted branches expl 'remote branch' compadd -a branches" in source
+
+    with pytest.raises(AssertionError):
+        GitBranches(max_results=0)
+
+
+def test_git_commits_cached():
+    assert GitCommits().action_source() == "_git_commits"
+    assert GitCommits().zsh_helper_sources() == []
+
+    action = GitCommits(num_commits=50, cached=True, ref="main", depends_on=("--branch", "-b"))
+    func_name = action.action_source()
+    assert func_name.startswith("_git_commits_cached_")
+    assert func_name != GitCommits(cached=True, ref="dev").action_source()
+    source = action.zsh_func_source()
+    assert "local ref=main\n" in source
+    assert "[[ -n $b_value ]] && ref=$b_value\n  [[ $ref == -* ]] && return 1\n" in source
+    assert "if __zcompy_git_rev $ref; then" in source
+    assert "log -n 50 --format='%h:%s' $ref --" in source
+    assert "commits=(${(M)commits:#${(b)PREFIX}*})" in source
+    assert "__zcompy_git_rev() {" in action.zsh_helper_sources()[0]
+
+    cmd = Command("tool", options=[Option("--commit", "Commit", complete_func=action)])
+    assert f"'(--commit)'--commit'[Commit]:GitCommits:{func_name}'" in cmd.complete_source()
+
+    source = GitCommits(ref="main", full_hash=True).zsh_func_source()
+    assert "__zcompy_git_rev" not in source
+    assert "--format='%H:%s' $ref --" in source
+    assert "[[ $ref == -* ]]" not in source
+
+    with pytest.raises(AssertionError):
+        GitCommits(ref="--output=/tmp/x")
@@ -0,0 +1,137 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+
+from zcompy import Command, Completion, Option
+from zcompy.batch import Target, generate_all, load_manifest
+
+MODULES = {
+    "batch_argparse": '''
+import argparse
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="argtool", description="Argparse tool")
+    parser.add_argument("--mode", choices=["a", "b"], help="Mode")
+    sub = parser.add_subparsers()
+    sub.add_parser("run", help="Run it").add_subparsers().add_parser("now", help="Now")
+    return parser
+''',
+    "batch_click": '''
+import click
+
+
+@click.command()
+@click.option("--count", default=1, help="Count")
+def clicktool(count):
+    """Click tool."""
+''',
+    "batch_fire": '''
+def add(x, y=1):
+    return x + y
+
+
+COMMANDS = {"add": add}
+''',
+    "batch_slow": '''
+import time
+
+time.sleep(30)
+''',
+}
+
+
+def write_manifest(tmp_path, targets):
+    for name, source in MODULES.items():
+        (tmp_path / f"{name}.py").write_text(source)
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps({
+        "output_dir": str(tmp_path / "completion"),
+        "python_path": ["."],
+        "targets": targets,
+    }))
+    return str(manifest)
+
+
+def test_generate_all(tmp_path):
+    manifest = write_manifest(tmp_path, [
+        {"target": "batch_argparse:build_parser", "split": True},
+        {"target": "batch_click:clicktool", "type": "click"},
+        {"target": "batch_fire:COMMANDS", "type": "fire", "name": "firetool"},
+        {"target": "batch_slow:missing", "name": "slowtool"},
+        {"target": "batch_missing:parser"},
+    ])
+    settings, targets = load_manifest(manifest)
+    assert targets[0].python_path == [os.path.join(str(tmp_path), ".")]
+
+    results = generate_all(targets, settings["output_dir"], jobs=3, timeout=2)
+    assert [x.name for x in results] == ["argtool", "clicktool", "firetool", None, None]
+    assert "timeout" in results[3].error
+    assert "ModuleNotFoundError" in results[4].error
+
+    output_dir = tmp_path / "completion"
+    assert sorted(x for x in os.listdir(output_dir) if not x.startswith(".")) == [
+        "_argtool", "_argtool_run", "_argtool_run_subcommands", "_clicktool", "_firetool",
+    ]
+    assert "'(--count)'--count'[Count]:Integer:(1)'" in (output_dir / "_clicktool").read_text()
+
+    results = generate_all(targets[:3], settings["output_dir"], jobs=3, timeout=10)
+    assert all(x.report.written == [] for x in results)
+
+
+def test_main(tmp_path):
+    manifest = write_manifest(tmp_path, [{"target": "batch_argparse:build_parser"}])
+    output_dir = tmp_path / "out"
+    process = subprocess.run(
+        [sys.executable, "-m", "zcompy", manifest, "-o", str(output_dir), "-j", "1"],
+        capture_output=True, text=True,
+    )
+    assert process.returncode == 0, process.stderr
+    assert "argtool: 1 written, 0 unchanged, 0 removed" in process.stdout
+    assert (output_dir / "_argtool").exists()
+
+    process = subprocess.run(
+        [sys.executable, "-m", "zcompy", write_manifest(tmp_path, ["batch_missing:parser"])],
+        capture_output=True, text=True,
+    )
+    assert process.returncode == 1
+    assert "FAILED batch_missing:parser" in process.stderr
+
+
+def test_target_name_override(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    (tmp_path / "batch_argparse.py").write_text(MODULES["batch_argparse"])
+    target = Target("batch_argparse:build_parser", name="renamed", python_path=[str(tmp_path)])
+    name, files = target.render()
+    assert name == "renamed"
+    assert list(files) == ["_renamed"]
+    sys.modules.pop("batch_argparse", None)
+
+
+def batch_names():
+    return ["a", "b"]
+
+
+def test_generate_python_files(tmp_path, monkeypatch):
+    func_dir = tmp_path / "funcs"
+
+    def build_command(self):
+        completion = Completion(batch_names, shell_embed=False, path=str(func_dir))
+        return Command("pytool", options=[Option("--name", complete_func=completion)])
+
+    monkeypatch.setattr(Target, "_build_command", build_command)
+    name, files = Target("unused:parser").render()
+    assert not func_dir.exists()  # rendering doesn't write the script
+    assert files[str(func_dir / "batch_names")].startswith("#!/usr/bin/env python3\n")
+
+    if multiprocessing.get_start_method() != "fork":
+        return  # the patched target only exists in this process
+    output_dir = tmp_path / "completion"
+    (result,) = generate_all([Target("unused:parser")], str(output_dir), jobs=1)
+    assert sorted(result.report.written) == [
+        str(output_dir / "_pytool"), str(func_dir / "batch_names"),
+    ]
+    assert os.access(func_dir / "batch_names", os.X_OK)
+    assert os.path.exists(func_dir / ".zcompy-manifest.json")
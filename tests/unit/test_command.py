@@ -1,4 +1,7 @@
-from zcompy.action import Files, ProcessID, URLs
+import io
+import os
+
+from zcompy.action import Completion, Files, ProcessID, URLs
 from zcompy.command import Command
 from zcompy.option import Option
 
@@ -238,6 +241,56 @@ def test_add_action_for_options_multiple_actions():
     assert verbose_option.complete_func is None
 
 
+def test_name_index_lookup():
+    command = Command("cmd", options=[Option(("--file", "-f")), Option("--all")])
+    command.add_options(Option(("--verbose", "-v")))
+    command.add_sub_commands([Command("add"), Command("rm")])
+
+    assert command.get_option("-f") is command.options[0]
+    assert command.get_option("--all") is command.options[1]
+    assert command.get_option("-v") is command.options[2]
+    assert command.get_option("--missing") is None
+    assert command.get_sub_command("rm") is command.sub_commands[1]
+    assert command.get_sub_command("missing") is None
+
+    # lists changed directly and renamed items are indexed again
+    command.sub_commands.append(Command("mv"))
+    assert command.get_sub_command("mv") is command.sub_commands[2]
+    command.sub_commands = [Command("ls")]
+    assert command.get_sub_command("add") is None
+    assert command.get_sub_command("ls") is command.sub_commands[0]
+    command.sub_commands[0].name = "list"
+    assert command.get_sub_command("ls") is None
+    command.options[1].names = ("--everything",)
+    assert command.get_option("--all") is None
+    assert command.get_option("--everything") is command.options[1]
+
+    # indexes are not part of equality
+    other = Command("cmd", options=list(command.options), sub_commands=[Command("list")])
+    assert other == command
+
+    # items replaced in place are checked on hits, new names need `invalidate`
+    command.sub_commands[0] = Command("b")
+    assert command.get_sub_command("list") is None
+    assert command.get_sub_command("b") is command.sub_commands[0]
+    command.options[0] = Option("--new")
+    assert command.get_option("--new") is None
+    command.invalidate()
+    assert command.get_option("-f") is None
+    command.add_action_for_options("--new", action=Files())
+    assert command.options[0].complete_func == Files()
+
+
+def test_python_completions_shared():
+    def list_names():
+        return ["a", "b"]
+
+    completion = Completion(list_names)
+    command = Command("cmd", options=[Option("--a", complete_func=completion)])
+    command.add_sub_commands(Command("sub", options=[Option("--b", complete_func=completion)]))
+    assert command.python_completions() == [completion]
+
+
 def test_repeat_positional_args():
     """Test adding repeat positional arguments."""
     answer = r"""
@@ -316,3 +369,118 @@ _sub1() {
     answer = [x for x in sub_cmd.splitlines() if x.strip()]
     for x, y in zip(src, answer):
         assert x == y, f"Mismatch at line:\nExpected: {y}\nGot: {x}"
+
+
+def test_deep_command_tree_generation():
+    """Generation doesn't recurse per level, so very deep trees work."""
+    depth = 1500
+    cmd = Command("a", "Deep command")
+    current = cmd
+    for _ in range(depth):
+        sub_cmd = Command("a", "Deeper command")
+        sub_cmd.add_options(Option("--flag", "A flag"))
+        current.add_sub_commands(sub_cmd)
+        current = sub_cmd
+
+    assert cmd.command_depth() == depth
+    names = [name for name, _ in cmd.main_functions()]
+    assert len(names) == 2 * depth
+    assert names[:2] == ["_a_subcommands", "_a_a_subcommands"]
+    assert names[-2:] == ["_a_a", "_a"]
+
+
+def test_iter_source_and_write_source(tmp_path):
+    cmd = Command("tool", "A tool")
+    build = Command("build", "Build it")
+    build.add_sub_commands(Command("all", "Build all"))
+    build.add_options(Option("--file", "Input file", complete_func=Files()))
+    cmd.add_sub_commands([build, Command("test", "Test it")])
+
+    for backend in ("nested", "table"):
+        chunks = list(cmd.iter_source(as_file=True, backend=backend))
+        assert len(chunks) > 2
+        assert "".join(chunks) == cmd.complete_source(as_file=True, backend=backend)
+
+    buffer = io.StringIO()
+    assert cmd.write_source(buffer)
+    assert buffer.getvalue() == cmd.complete_source(as_file=True)
+
+    file_name = str(tmp_path / "_tool")
+    assert cmd.write_source(file_name)
+    assert not cmd.write_source(file_name)  # unchanged content is not written again
+    assert open(file_name).read() == cmd.complete_source(as_file=True)
+    assert os.listdir(tmp_path) == ["_tool"]
+
+
+def make_fingerprint_tree(sub_names=("build", "test")) -> Command:
+    cmd = Command("tool", "A tool")
+    for name in sub_names:
+        sub_cmd = Command(name, f"Run {name}")
+        sub_cmd.add_options(Option("--file", "Input file", complete_func=Files(pattern="*.py")))
+        cmd.add_sub_commands(sub_cmd)
+    return cmd
+
+
+def test_fingerprint():
+    cmd = make_fingerprint_tree()
+    fingerprint = cmd.fingerprint()
+    assert fingerprint == cmd.fingerprint() == make_fingerprint_tree().fingerprint()
+
+    cmd.get_sub_command("build").add_options(Option("--verbose", "Verbose output"))
+    assert cmd.fingerprint() != fingerprint
+    fingerprint = cmd.fingerprint()
+
+    cmd.get_sub_command("build").description = "Build it"
+    assert cmd.fingerprint() != fingerprint
+    fingerprint = cmd.fingerprint()
+
+    # changes of options and in-place changes of lists need `invalidate`
+    sub_cmd = cmd.get_sub_command("test")
+    sub_cmd.get_option("--file").description = "Test file"
+    assert cmd.fingerprint() == fingerprint
+    sub_cmd.invalidate()
+    assert cmd.fingerprint() != fingerprint
+    fingerprint = cmd.fingerprint()
+
+    sub_fingerprint = sub_cmd.fingerprint()
+    sub_cmd.options.append(Option("--zz"))
+    assert sub_cmd.fingerprint() != sub_fingerprint  # the lengths of lists are checked
+    assert cmd.fingerprint() != fingerprint
+
+    # the generated completion depends on the order of sub-commands, equality doesn't
+    reordered = make_fingerprint_tree(("test", "build"))
+    assert reordered.fingerprint() != make_fingerprint_tree().fingerprint()
+    assert reordered == make_fingerprint_tree()
+    assert reordered != make_fingerprint_tree(("test", "run"))
+
+    other, tree = make_fingerprint_tree(), make_fingerprint_tree()
+    assert other.fingerprint() == tree.fingerprint() and other == tree
+    other.options.append(Option("--zz"))
+    assert other != tree
+
+
+def test_complete_source_cache(tmp_path):
+    cmd = make_fingerprint_tree()
+    source = cmd.complete_source(as_file=True)
+    assert cmd.complete_source(as_file=True) is source
+    assert cmd.complete_source(as_file=True, backend="table") != source
+
+    cmd.get_sub_command("build").add_options(Option("--verbose", "Verbose output"))
+    changed = cmd.complete_source(as_file=True)
+    assert "--verbose" in changed and "--verbose" not in source
+
+    sub_cmd = cmd.get_sub_command("test")
+    sub_cmd.options.append(Option("--zz"))
+    sub_cmd.invalidate()
+    assert "--zz" in cmd.complete_source(as_file=True)
+
+    # a cached source still writes the python files it runs
+    def name_choices():
+        return ["a", "b"]
+
+    completion = Completion(name_choices, shell_embed=False, path=str(tmp_path))
+    sub_cmd.add_options(Option("--name", complete_func=completion))
+    cmd.complete_source(as_file=True)
+    os.remove(tmp_path / "name_choices")
+    cmd.complete_source(as_file=True)
+    assert os.path.exists(tmp_path / "name_choices")
@@ -1,6 +1,7 @@
 import pytest
 
-from zcompy import Completion, Files
+from zcompy import Completion, DependentCompletion, Files
+from zcompy.utils import zsh_cache_helper_source
 
 
 def test_completion_creation_with_function():
@@ -117,6 +118,9 @@ def test_completion_write_python(tmp_path):
 
     # This would create a file, so we'll just test it doesn't crash
     assert hasattr(completion, "write_python")
+    assert completion.write_python()
+    assert not completion.write_python()  # unchanged script is not rewritten
+    assert open(tmp_path / "test_func").read() == completion.python_file_source()
 
 
 def test_completion_with_lambda_function():
@@ -205,3 +209,112 @@ def test_completion_shell_code_with_complex_function():
     result = completion.action_source()
 
     assert result == "_complex_completion_function"
+
+
+def test_completion_cache_ttl():
+    """Test cached Completion/DependentCompletion call the producer through the cache helper."""
+
+    def cached_func():
+        print("choice")
+
+    def cached_depend(config):
+        print(config)
+
+    completion = Completion(cached_func, cache_ttl=30)
+    assert "done < <(__zcompy_cached 30 _cached_func __cached_func)" in completion.zsh_func_source()
+    assert completion.zsh_helper_sources() == [zsh_cache_helper_source()]
+
+    completion = DependentCompletion(
+        cached_depend, depends_on="--config", cache_ttl=30, cache_key="configs",
+    )
+    result = completion.zsh_func_source()
+    assert 'done < <(__zcompy_cached 30 configs __cached_depend "$config_value")' in result
+
+    assert Completion(cached_func).zsh_helper_sources() == []
+    with pytest.raises(AssertionError):
+        Completion(cached_func, cache_ttl=-1)
+
+    # expired entries of other args, like every prefix of prefix_aware, are removed
+    assert "expired=( ${cache_file:h}/$key_file(|%0_*)(N.ms+$age) )" in zsh_cache_helper_source()
+
+
+def test_completion_timeout():
+    """Test Completion with latency budget falls back to the cached result."""
+
+    def slow_func():
+        print("choice")
+
+    completion = Completion(slow_func, timeout_ms=200)
+    result = completion.zsh_func_source()
+    assert "done < <(__zcompy_cached -t 200 0 _slow_func __slow_func)" in result
+    assert completion.zsh_helper_sources() == [zsh_cache_helper_source()]
+
+    completion = Completion(slow_func, timeout_ms=200, cache_ttl=60)
+    result = completion.zsh_func_source()
+    assert "done < <(__zcompy_cached -t 200 60 _slow_func __slow_func)" in result
+
+    with pytest.raises(AssertionError):
+        Completion(slow_func, timeout_ms=0)
+
+
+def test_completion_prefix_aware():
+    """Test prefix aware Completion/DependentCompletion get the prefix and the limit."""
+
+    def catalog(prefix, limit):
+        print(prefix, limit)
+
+    def depend_catalog(config, prefix, limit):
+        print(config, prefix, limit)
+
+    completion = Completion(catalog, prefix_aware=True, max_results=50)
+    assert 'done < <(__catalog "$PREFIX" 50)' in completion.zsh_func_source()
+    assert 'done < <(__catalog)' in Completion(catalog).zsh_func_source()
+
+    completion = DependentCompletion(
+        depend_catalog, depends_on="--config", prefix_aware=True, cache_ttl=30,
+    )
+    result = completion.zsh_func_source()
+    assert 'done < <(__zcompy_cached 30 _depend_catalog __depend_catalog "$config_value" ' \
+        '"$PREFIX" 100)' in result
+
+    with pytest.raises(AssertionError):
+        Completion(catalog, prefix_aware=True, max_results=0)
+
+
+def test_completion_bulk():
+    """Test generator functions are read at once, bulk overrides the detection."""
+
+    def gen_func():
+        yield "choice"
+
+    def list_func():
+        return ["choice"]
+
+    completion = Completion(gen_func)
+    assert completion.is_bulk()
+    result = completion.zsh_func_source()
+    assert 'choices=(${(f)"$(__gen_func)"})' in result
+    assert 'write_completion_items(gen_func(), "describe")' in result
+    assert "while IFS= read" not in result
+
+    assert not Completion(list_func).is_bulk()
+    assert Completion(list_func, bulk=True).is_bulk()
+    assert "while IFS= read" in Completion(gen_func, bulk=False).zsh_func_source()
+
+
+def test_completion_protocol():
+    """Test the tsv protocol is written by the function and read with compadd."""
+
+    def gen_func():
+        yield ("choice", "A choice")
+
+    completion = Completion(gen_func, protocol="tsv")
+    assert completion.output_protocol() == "tsv"
+    result = completion.zsh_func_source()
+    assert 'write_completion_items(gen_func(), "tsv")' in result
+    assert "compadd -l -d displays -a values" in result
+
+    assert Completion(gen_func).output_protocol() == "describe"
+    assert Completion(["choice"]).output_protocol() == "lines"
+    with pytest.raises(AssertionError):
+        Completion(gen_func, protocol="json")
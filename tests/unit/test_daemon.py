@@ -0,0 +1,148 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from zcompy import Command, Completion, DependentCompletion, Option
+from zcompy.daemon import CompletionDaemon, register_function
+from zcompy.utils import func_key
+
+
+def daemon_words():
+    for word in ("alpha", "beta"):
+        print(f"{word} {word} word")
+
+
+def daemon_depend(prefix):
+    print(f"{prefix}_value")
+
+
+def daemon_context():
+    import os
+
+    print(os.getcwd(), os.environ.get("ZCOMPY_TEST_VALUE"))
+
+
+def daemon_hang():
+    import time
+
+    time.sleep(60)
+
+
+def request(socket_path, *fields, cwd="/", env=()):
+    fields = [cwd, str(len(env)), *env, *fields]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(f"{len(fields)}\n".encode())
+        client.sendall(b"".join(x.encode() + b"\0" for x in fields))
+        client.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            chunks.append(data)
+    return b"".join(chunks).decode()
+
+
+def test_daemon_run_registered_function(tmp_path):
+    register_function(daemon_words, daemon_dir=str(tmp_path))
+    register_function(daemon_depend, daemon_dir=str(tmp_path))
+
+    daemon = CompletionDaemon(str(tmp_path))
+    words_key = func_key(daemon_words)
+    assert words_key.endswith("test_daemon.daemon_words")
+    assert daemon.run(words_key, []) == "alpha alpha word\nbeta beta word\n"
+    assert daemon.run(func_key(daemon_depend), ["x"]) == "x_value\n"
+    # compiled function is reused while its source is unchanged
+    assert daemon.load(words_key) is daemon.load(words_key)
+    with pytest.raises(ValueError):
+        daemon.load("../daemon_words")
+
+
+def test_daemon_socket(tmp_path):
+    register_function(daemon_depend, daemon_dir=str(tmp_path))
+    register_function(daemon_context, daemon_dir=str(tmp_path))
+    daemon = CompletionDaemon(str(tmp_path))
+    server = daemon.make_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        output = request(daemon.socket_path, func_key(daemon_depend), "y")
+        assert output == "OK\ny_value\n\x1e\n"
+        assert request(daemon.socket_path, "not_registered").startswith("ERR")
+        # a running daemon keeps its socket
+        with pytest.raises(RuntimeError, match="already serving"):
+            CompletionDaemon(str(tmp_path)).make_server()
+        # functions run in the directory and environment of the shell
+        output = request(
+            daemon.socket_path, func_key(daemon_context),
+            cwd=str(tmp_path), env=["ZCOMPY_TEST_VALUE=a\nb=c"],
+        )
+        assert output == f"OK\n{tmp_path} a\nb=c\n\x1e\n"
+        assert os.getcwd() != str(tmp_path)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # the socket of a dead daemon is replaced
+    assert os.path.exists(daemon.socket_path)
+    CompletionDaemon(str(tmp_path)).make_server().server_close()
+
+
+def test_daemon_hung_function(tmp_path):
+    register_function(daemon_hang, daemon_dir=str(tmp_path))
+    register_function(daemon_depend, daemon_dir=str(tmp_path))
+    daemon = CompletionDaemon(str(tmp_path), timeout=1)
+    server = daemon.make_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(daemon.socket_path)
+            client.sendall(f"3\n/\x000\x00{func_key(daemon_hang)}\x00".encode())
+            # other requests are served meanwhile, the hung one is killed
+            output = request(daemon.socket_path, func_key(daemon_depend), "y")
+            assert output == "OK\ny_value\n\x1e\n"
+            client.settimeout(10)
+            assert client.recv(4096) == b""
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_daemon_zsh_source(tmp_path, monkeypatch):
+    monkeypatch.setenv("ZCOMPY_DAEMON_DIR", str(tmp_path / "daemon"))
+    cmd = Command("tool")
+    cmd.add_options([
+        Option("--word", complete_func=Completion(daemon_words, daemon=True)),
+        Option(
+            "--depend",
+            complete_func=DependentCompletion(daemon_depend, depends_on="--word", daemon=True),
+        ),
+    ])
+    source = cmd.complete_source()
+    assert not (tmp_path / "daemon").exists()  # rendering doesn't register functions
+
+    words_key, depend_key = func_key(daemon_words), func_key(daemon_depend)
+    assert source.count("__zcompy_daemon() {") == 1
+    assert f'__zcompy_daemon {words_key} "$@" && return\n  python3 -c' in source
+    assert f'__zcompy_daemon {depend_key} "$@" && return\n  local arg1_value' in source
+
+    cmd.completion_entry(output_dir=str(tmp_path / "completion"))
+    func_dir = tmp_path / "daemon" / "functions"
+    assert sorted(os.listdir(func_dir)) == sorted(
+        [f"{words_key}.py", f"{depend_key}.py", ".zcompy-manifest.json"]
+    )
+
+
+def daemon_bulk(prefix):
+    yield f"{prefix}_value"
+    yield ("other", "Other value")
+
+
+def test_daemon_bulk_function(tmp_path):
+    register_function(daemon_bulk, daemon_dir=str(tmp_path), bulk=True)
+    daemon = CompletionDaemon(str(tmp_path))
+    assert daemon.run(func_key(daemon_bulk), ["x"]) == "x_value\nother:Other value\n"
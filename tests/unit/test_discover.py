@@ -0,0 +1,104 @@
+import json
+
+from zcompy.discover import CACHE_NAME, capture_command, console_scripts, discover
+
+MODULE_SOURCE = '''
+import argparse
+
+import click
+import fire
+
+
+def argparse_main():
+    parser = argparse.ArgumentParser(description="Argparse tool")
+    parser.add_argument("--mode", choices=["a", "b"], help="Mode")
+    args = parser.parse_args()
+    raise RuntimeError(f"should not run with {args}")
+
+
+@click.command()
+@click.option("--count", default=1, help="Count")
+def click_main(count):
+    raise RuntimeError("should not run")
+
+
+def add(x, y=1):
+    return x + y
+
+
+def fire_main():
+    fire.Fire({"add": add})
+
+
+def plain_main():
+    print("no framework")
+'''
+
+ENTRY_POINTS = """[console_scripts]
+zc-argtool = zcompy_fake_cli:argparse_main
+zc-clicktool = zcompy_fake_cli:click_main
+zc-firetool = zcompy_fake_cli:fire_main
+zc-plain = zcompy_fake_cli:plain_main
+"""
+
+
+def install_fake_dist(path, version="1.0", entry_points=ENTRY_POINTS):
+    """A distribution with console scripts, found by importlib.metadata through sys.path."""
+    for x in path.glob("*.dist-info"):
+        for file in x.iterdir():
+            file.unlink()
+        x.rmdir()
+    dist_info = path / f"zcompy_fake_cli-{version}.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(
+        f"Metadata-Version: 2.1\nName: zcompy-fake-cli\nVersion: {version}\n"
+    )
+    (dist_info / "entry_points.txt").write_text(entry_points)
+    (path / "zcompy_fake_cli.py").write_text(MODULE_SOURCE)
+
+
+def test_capture_command(tmp_path, monkeypatch):
+    install_fake_dist(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    command = capture_command("zcompy_fake_cli:argparse_main", "zc-argtool")
+    assert command.name == "zc-argtool"
+    assert [x.names for x in command.options] == [("--mode",)]
+
+    command = capture_command("zcompy_fake_cli:click_main", "zc-clicktool")
+    assert [x.names for x in command.options] == [["--count"]]
+
+    command = capture_command("zcompy_fake_cli:fire_main", "zc-firetool")
+    assert [x.name for x in command.sub_commands] == ["add"]
+
+
+def test_discover(tmp_path, monkeypatch):
+    install_fake_dist(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    output_dir = tmp_path / "completion"
+
+    scripts = console_scripts(include=["zcompy-fake-*"])
+    assert [x.name for x in scripts] == ["zc-argtool", "zc-clicktool", "zc-firetool", "zc-plain"]
+
+    results = discover(str(output_dir), include=["zcompy-fake-*"], timeout=20)
+    assert [x.name for x in results] == ["zc-argtool", "zc-clicktool", "zc-firetool", None]
+    assert "without using a supported CLI framework" in results[3].error
+    assert (output_dir / "_zc-argtool").exists()
+    cache = json.loads((output_dir / CACHE_NAME).read_text())
+    assert cache["zcompy-fake-cli==1.0"]["zc-clicktool"] == "ok"
+
+    # generated scripts of an unchanged distribution are skipped, failed ones are retried
+    results = discover(str(output_dir), include=["zcompy-fake-*"], timeout=20)
+    assert [x.target.name for x in results] == ["zc-plain"]
+    cache = json.loads((output_dir / CACHE_NAME).read_text())
+    assert cache["zcompy-fake-cli==1.0"]["zc-clicktool"] == "ok"
+    assert cache["zcompy-fake-cli==1.0"]["zc-plain"] != "ok"
+
+    # a new version without zc-firetool regenerates and removes the completion of it
+    entry_points = ENTRY_POINTS.replace("zc-firetool = zcompy_fake_cli:fire_main\n", "")
+    install_fake_dist(tmp_path, version="2.0", entry_points=entry_points)
+    results = discover(str(output_dir), include=["zcompy-fake-*"], timeout=20)
+    assert [x.name for x in results] == ["zc-argtool", "zc-clicktool", None]
+    assert all(x.report.written == [] for x in results if x.report)
+    assert not (output_dir / "_zc-firetool").exists()
+    assert list(json.loads((output_dir / CACHE_NAME).read_text())) == ["zcompy-fake-cli==2.0"]
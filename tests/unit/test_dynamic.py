@@ -0,0 +1,98 @@
+import argparse
+import subprocess
+import sys
+
+from zcompy import Command, Completion, Option
+from zcompy.batch import Target
+from zcompy.dynamic import completion_source, dynamic_stub, resolve_command, resolve_parser
+from zcompy.parser_command import ParserCommand
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="dyn")
+    parser.add_argument("--out", type=str, help="Output")
+    parser.add_argument("-v", action="store_true", help="Verbose")
+    sub = parser.add_subparsers()
+    run = sub.add_parser("run", help="Run it")
+    run.add_argument("--mode", choices=["a", "b"], help="Mode")
+    run.add_subparsers().add_parser("now", help="Now")
+    sub.add_parser("stop", help="Stop it")
+    return parser
+
+
+def test_resolve_command():
+    command = ParserCommand(build_parser()).to_command()
+    assert resolve_command(command, []) == (command, 1)
+    assert resolve_command(command, ["-v"]) == (command, 1)
+
+    run = command.get_sub_command("run")
+    assert resolve_command(command, ["-v", "run"]) == (run, 3)
+    assert resolve_command(command, ["run", "--mode", "a"]) == (run, 2)
+    assert resolve_command(command, ["run", "unknown"]) == (run, 2)
+    assert resolve_command(command, ["run", "now"]) == (run.get_sub_command("now"), 3)
+
+    # value of an option is not a sub-command
+    assert resolve_command(command, ["--out", "run"]) == (command, 1)
+    assert resolve_command(command, ["--out=x", "run"]) == (run, 3)
+
+
+def test_resolve_parser_is_lazy():
+    command, position = resolve_parser(build_parser(), ["run"])
+    assert (command.name, position) == ("run", 2)
+    assert [x.names for x in command.options] == [("--mode",)]
+    now = command.get_sub_command("now")
+    assert now.description == "Now" and now.options == []
+
+    root, _ = resolve_parser(build_parser(), [], name="mydyn")
+    assert root.name == "mydyn"
+    # sub-commands of the root only have names and descriptions
+    assert [(x.name, x.options, x.sub_commands) for x in root.sub_commands] == [
+        ("run", [], []), ("stop", [], []),
+    ]
+    assert resolve_parser(build_parser(), ["run", "now"])[0] == now
+
+
+def test_completion_source():
+    command = Command("tool", options=[Option("--all", description="All")])
+    command.add_sub_commands([Command("add", description="Add"), Command("rm")])
+
+    source = completion_source(command)
+    assert "words=" not in source
+    assert '"add:Add"' in source and '"rm:"' in source
+    assert "'1: :->cmds'" in source
+    assert source.endswith("[[ $state == cmds ]] && _zcompy_dynamic_subcommands\n")
+
+    leaf = Command("add", options=[
+        Option("--color", complete_func=Completion(func=("red", "blue")), type="color"),
+    ])
+    source = completion_source(leaf, position=3)
+    assert source.startswith('words=("${(@)words[3,-1]}")\n(( CURRENT -= 2 ))\n')
+    assert source.endswith("'(--color)'--color'[]:color:(red blue)'\n")
+
+
+def test_dynamic_stub(tmp_path):
+    (tmp_path / "dyn_cli.py").write_text(
+        "import argparse\n\n"
+        "print('importing dyn_cli')\n\n\n"
+        "def build_parser():\n"
+        "    parser = argparse.ArgumentParser(prog='dyn')\n"
+        "    parser.add_subparsers().add_parser('run').add_argument('--fast')\n"
+        "    return parser\n"
+    )
+    target = Target("dyn_cli:build_parser", python_path=[str(tmp_path)], dynamic=True)
+    name, files = target.render()
+    assert name == "dyn" and list(files) == ["_dyn"]
+    stub = files["_dyn"]
+    assert stub.startswith("#compdef dyn\n")
+    assert f"--python-path {tmp_path} dyn_cli:build_parser --" in stub
+    assert stub == dynamic_stub(target, "dyn")
+
+    output = subprocess.run(
+        [sys.executable, "-m", "zcompy.dynamic", "--python-path", str(tmp_path),
+         "dyn_cli:build_parser", "--", "run", "--fast", "x"],
+        capture_output=True, text=True, check=True,
+    )
+    assert "importing dyn_cli" in output.stderr
+    output = output.stdout
+    assert output.startswith('words=("${(@)words[2,-1]}")\n')
+    assert "'(--fast)'--fast'[]'" in output
@@ -0,0 +1,109 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+from zcompy import Command, Completion, DependentCompletion, Option
+from zcompy.helper_module import HelperModule, imported_modules
+
+
+def helper_words():
+    import os  # noqa: F401
+
+    for word in ("alpha", "beta"):
+        print(word)
+
+
+def helper_depend(prefix):
+    print(f"{prefix}_value")
+
+
+def helper_third_party():
+    import click  # noqa: F401
+
+    print("click")
+
+
+def run_module(path, name, *args):
+    env = dict(os.environ, PYTHONPATH=path)
+    result = subprocess.run(
+        [sys.executable, "-m", name, *args], capture_output=True, text=True, env=env,
+    )
+    return result.stdout
+
+
+def test_helper_module_write(tmp_path):
+    helper = HelperModule("my-tool funcs", str(tmp_path))
+    helper.add(helper_words)
+    helper.add(helper_depend)
+    assert helper.name == "my_tool_funcs"
+
+    file_name = helper.write()
+    assert os.path.exists(importlib.util.cache_from_source(file_name))
+    assert run_module(str(tmp_path), helper.name, "helper_words") == "alpha\nbeta\n"
+    assert run_module(str(tmp_path), helper.name, "helper_depend", "x") == "x_value\n"
+
+
+def test_helper_module_duplicated_name(tmp_path):
+    helper = HelperModule("funcs", str(tmp_path))
+    helper.add(helper_words)
+    helper.add(helper_words)
+
+    def make_func():
+        def helper_words():
+            pass
+        return helper_words
+
+    with pytest.raises(ValueError):
+        helper.add(make_func())
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="stdlib module names are needed")
+def test_helper_module_python_flags(tmp_path):
+    helper = HelperModule("funcs", str(tmp_path))
+    helper.add(helper_words)
+    assert helper.python_flags() == "-S"
+    shell_code, name = helper.shell_source(helper_words)
+    assert name == "__helper_words"
+    path = str(tmp_path)
+    assert f'PYTHONPATH={path}${{PYTHONPATH:+:$PYTHONPATH}} python3 -S -m funcs helper_words "$@"' in shell_code  # noqa
+
+    helper.add(helper_third_party)
+    assert helper.python_flags() == ""
+
+
+def test_imported_modules():
+    source = "import os.path\nfrom json import loads\nfrom . import local\nimport click as c\n"
+    assert imported_modules(source) == {"os", "json", "click"}
+
+
+def test_command_use_helper_module(tmp_path):
+    cmd = Command("tool")
+    cmd.add_options([
+        Option("--word", complete_func=Completion(helper_words)),
+        Option("--depend", complete_func=DependentCompletion(helper_depend, depends_on="--word")),
+    ])
+    cmd.completion_entry(str(tmp_path), helper_module=True)
+
+    assert os.path.exists(tmp_path / "zcompy_tool.py")
+    with open(tmp_path / "_tool") as f:
+        content = f.read()
+    assert "python3 -c" not in content
+    assert "-m zcompy_tool helper_words" in content
+    assert "-m zcompy_tool helper_depend" in content
+
+
+def helper_bulk(prefix):
+    return [f"{prefix}_value", ("other", "Other value")]
+
+
+def test_helper_module_bulk(tmp_path):
+    helper = HelperModule("funcs", str(tmp_path))
+    helper.add(helper_words)
+    helper.add(helper_bulk, bulk=True)
+    helper.write()
+    assert run_module(str(tmp_path), helper.name, "helper_words") == "alpha\nbeta\n"
+    output = run_module(str(tmp_path), helper.name, "helper_bulk", "x")
+    assert output == "x_value\nother:Other value\n"
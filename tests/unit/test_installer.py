@@ -0,0 +1,127 @@
+import json
+import os
+
+from zcompy import Command, Completion, Option
+from zcompy.installer import MANIFEST_NAME, Installer
+
+
+def test_installer_write_and_skip(tmp_path):
+    installer = Installer(str(tmp_path), owner="tool")
+    assert installer.write("_tool", "content")
+    assert installer.write("script", iter(["#!/bin/sh", "\n"]), executable=True)
+    installer.finish()
+    assert os.access(tmp_path / "script", os.X_OK)
+
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())
+    assert manifest["files"]["_tool"]["owner"] == "tool"
+    assert len(manifest["files"]["_tool"]["sha256"]) == 64
+
+    installer = Installer(str(tmp_path), owner="tool")
+    assert not installer.write("_tool", "content")
+    assert installer.write("script", "#!/bin/bash\n")
+    report = installer.finish()
+    assert report.written == [str(tmp_path / "script")]
+    assert report.skipped == [str(tmp_path / "_tool")]
+    assert report.removed == []
+
+
+def test_installer_trusts_manifest(tmp_path, monkeypatch):
+    installer = Installer(str(tmp_path), owner="tool")
+    installer.write("_tool", "content")
+    installer.finish()
+
+    def no_compare(*args, **kwargs):
+        raise AssertionError("unchanged file is read again")
+
+    monkeypatch.setattr("zcompy.utils.filecmp.cmp", no_compare)
+    installer = Installer(str(tmp_path), owner="tool")
+    assert not installer.write("_tool", "content")
+    monkeypatch.undo()
+    installer.finish()
+
+    # a file modified after the install is compared and replaced
+    (tmp_path / "_tool").write_text("edited by hand")
+    assert Installer(str(tmp_path), owner="tool").write("_tool", "content")
+    assert (tmp_path / "_tool").read_text() == "content"
+
+
+def test_installer_remove_orphaned_files(tmp_path):
+    installer = Installer(str(tmp_path), owner="tool")
+    installer.write("_tool", "tool")
+    installer.write("_tool_old", "old")
+    installer.finish()
+    (tmp_path / "_tool_old.zwc").write_text("wordcode")
+
+    other = Installer(str(tmp_path), owner="other")
+    other.write("_other", "other")
+    other.finish()
+
+    installer = Installer(str(tmp_path), owner="tool")
+    installer.write("_tool", "tool")
+    report = installer.finish()
+    assert sorted(report.removed) == [str(tmp_path / "_tool_old"), str(tmp_path / "_tool_old.zwc")]
+    assert sorted(os.listdir(tmp_path)) == [MANIFEST_NAME, "_other", "_tool"]
+
+
+def func_words():
+    print("alpha")
+
+
+def test_completion_entry_incremental(tmp_path, capsys):
+    output_dir, func_dir = tmp_path / "completion", tmp_path / "functions"
+    output_dir.mkdir()
+
+    def create_command(with_sub: bool):
+        cmd = Command("tool", "A tool")
+        build = Command("build", "Build it")
+        build.add_sub_commands(Command("all", "Build all"))
+        cmd.add_sub_commands(build)
+        if with_sub:
+            deploy = Command("deploy", "Deploy it")
+            deploy.add_sub_commands(Command("prod", "Deploy to prod"))
+            cmd.add_sub_commands(deploy)
+        cmd.add_options(Option("--word", "A word", complete_func=Completion(
+            func_words, shell_embed=False, path=str(func_dir),
+        )))
+        return cmd
+
+    report = create_command(True).completion_entry(str(output_dir), split=True)
+    assert sorted(os.path.basename(x) for x in report.written) == [
+        "_tool", "_tool_build", "_tool_build_subcommands",
+        "_tool_deploy", "_tool_deploy_subcommands", "func_words",
+    ]
+    assert os.access(func_dir / "func_words", os.X_OK)
+
+    report = create_command(True).completion_entry(str(output_dir), split=True)
+    assert report.written == [] and report.removed == []
+    assert len(report.skipped) == 6
+    assert "Source file created" not in capsys.readouterr().out
+
+    report = create_command(False).completion_entry(str(output_dir), split=True)
+    assert [os.path.basename(x) for x in report.written] == ["_tool"]
+    assert sorted(os.path.basename(x) for x in report.removed) == [
+        "_tool_deploy", "_tool_deploy_subcommands",
+    ]
+    assert not (output_dir / "_tool_deploy").exists()
+
+
+def test_completion_entry_compile(tmp_path, monkeypatch, capsys):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_zsh = bin_dir / "zsh"
+    fake_zsh.write_text('#!/bin/sh\nshift 4\nfor f in "$@"; do : > "$f.zwc"; done\n')
+    fake_zsh.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir))
+    output_dir = tmp_path / "completion"
+
+    Command("tool").completion_entry(str(output_dir), compile_zwc=True)
+    assert f"Compiled wordcode at: {output_dir / '_tool.zwc'}" in capsys.readouterr().out
+    Command("tool").completion_entry(str(output_dir), compile_zwc=True)
+    assert "Wordcode is up to date." in capsys.readouterr().out
+
+    fake_zsh.write_text("#!/bin/sh\nexit 1\n")
+    changed = Command("tool", options=[Option("--new", "New option")])
+    changed.completion_entry(str(output_dir), compile_zwc=True)
+    captured = capsys.readouterr()
+    assert "Compiled wordcode" not in captured.out
+    assert "Failed to compile completion files" in captured.err
@@ -1,3 +1,5 @@
+import sys
+
 import pytest
 
 from zcompy import Completion, Files, Option
@@ -83,3 +85,12 @@ def test_option_with_allow_repeat(flags, description, allow_repeat, expected):
     option = Option(flags, description, allow_repeat=allow_repeat)
     result = option.to_complete_argument()
     assert result == expected
+
+
+def test_option_is_compact():
+    option = Option(["--file", "".join(["-", "f"])], "File", complete_func=Files())
+    assert option.names == ["--file", "-f"]
+    assert option.names[1] is sys.intern("-f")
+    if sys.version_info >= (3, 10):
+        assert not hasattr(option, "__dict__")
+        assert not hasattr(option.complete_func, "__dict__")
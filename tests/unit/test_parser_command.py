@@ -380,3 +380,25 @@ _maincmd
     source_lines = [x for x in source.splitlines() if x][1:-1]
     for x, y in zip(gen_lines, source_lines):
         assert x == y
+
+
+def test_choice_completions_are_shared():
+    parser = ArgumentParser(prog="tool")
+    parser.add_argument("--input", type=str)
+    parser.add_argument("--color", choices=["red", "blue"])
+    sub_parser = parser.add_subparsers().add_parser("run")
+    sub_parser.add_argument("--input", type=str)
+    sub_parser.add_argument("--color", choices=["red", "blue"])
+
+    files = Files(pattern="*.txt")
+    parser_command = ParserCommand(parser)
+    parser_command.add_action_for_options("--input", action=files)
+    command = parser_command.to_command()
+    run = command.get_sub_command("run")
+
+    # actions given by the user are copied, changing one option doesn't change the others
+    input_func = command.get_option("--input").complete_func
+    assert input_func == files and input_func is not files
+    input_func.pattern = "*.py"
+    assert run.get_option("--input").complete_func == files
+    assert command.get_option("--color").complete_func is run.get_option("--color").complete_func
@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+
+import pytest
+
+from zcompy import Command, Completion, DependentCompletion, Files, Option
+from zcompy.action import GitBranches, ProcessID
+from zcompy.action.extend_action import MultiCompletions
+from zcompy.batch import Target
+from zcompy.serialize import command_from_dict, command_to_dict, dumps, load_cached, loads
+
+
+def names_of_entries():
+    return ["foo", "bar"]
+
+
+def files_of_branch(branch):
+    return [f"{branch}.txt"]
+
+
+def make_command() -> Command:
+    choices = Completion(("auto", "always", "never"))
+    cmd = Command("tool", "A tool", positional_args=[Files(pattern="*.py")])
+    cmd.add_options([
+        Option(("--color", "-c"), "Color", complete_func=choices),
+        Option("--verbose", "Verbose output", allow_repeat=True),
+    ])
+    run = Command("run", "Run it", repeat_pos_args=ProcessID())
+    run.add_options([
+        Option("--color", "Color", complete_func=choices),
+        Option("--branch", "Branch", complete_func=GitBranches(tags=True)),
+        Option("--entry", "Entry", type="Entry", complete_func=Completion(names_of_entries)),
+        Option("--file", "File", complete_func=DependentCompletion(
+            files_of_branch, depends_on="--branch"
+        )),
+        Option("--any", "Any", complete_func=MultiCompletions([Files(), GitBranches()])),
+    ])
+    cmd.add_sub_commands([run, Command("stop")])
+    return cmd
+
+
+def test_round_trip():
+    cmd = make_command()
+    data = cmd.to_dict()
+    assert data["sub_commands"][1] == {"name": "stop"}
+    assert Command.from_dict(json.loads(json.dumps(data))) == cmd
+
+    loaded = loads(dumps(cmd))
+    assert loaded == cmd
+    assert loaded.fingerprint() == cmd.fingerprint()
+    assert loaded.complete_source() == cmd.complete_source()
+    # shared actions stay shared
+    run = loaded.get_sub_command("run")
+    assert loaded.get_option("--color").complete_func is run.get_option("--color").complete_func
+    assert run.get_option("--entry").complete_func.func is names_of_entries
+
+
+def test_nested_function_is_rejected():
+    def nested():
+        return []
+
+    cmd = Command("tool", options=[Option("--entry", "Entry", complete_func=Completion(nested))])
+    with pytest.raises(ValueError, match="module level"):
+        command_to_dict(cmd)
+
+
+def test_deep_command_round_trip():
+    cmd = current = Command("a")
+    for _ in range(1500):
+        current.add_sub_commands(Command("a"))
+        current = current.sub_commands[0]
+    assert command_from_dict(command_to_dict(cmd)) == cmd
+
+
+def test_load_cached(tmp_path):
+    cache_file = str(tmp_path / "cache" / "tool.marshal")
+    source = tmp_path / "tool.txt"
+    source.write_text("v1")
+    builds = []
+
+    def build():
+        builds.append(source.read_text())
+        return make_command()
+
+    assert load_cached(cache_file, build, files=[str(source)]) == make_command()
+    assert load_cached(cache_file, build, files=[str(source)]) == make_command()
+    assert builds == ["v1"]
+
+    source.write_text("v2.0")
+    load_cached(cache_file, build, files=[str(source)])
+    assert builds == ["v1", "v2.0"]
+
+
+def test_target_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    module = tmp_path / "cached_cli.py"
+    module.write_text(
+        "import argparse\n\n"
+        "def build_parser():\n"
+        "    parser = argparse.ArgumentParser(prog='cached')\n"
+        "    parser.add_argument('--mode', choices=['a', 'b'], help='Mode')\n"
+        "    return parser\n"
+    )
+    target = Target(
+        "cached_cli:build_parser", python_path=[str(tmp_path)], cache_dir=str(tmp_path / "cache")
+    )
+    command = target.to_command()
+    assert len(os.listdir(tmp_path / "cache")) == 1
+
+    sys.modules.pop("cached_cli")
+    assert target.to_command() == command
+    assert "cached_cli" not in sys.modules  # loaded without importing the CLI
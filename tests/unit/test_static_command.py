@@ -0,0 +1,157 @@
+import importlib.util
+
+import pytest
+
+from zcompy.click_command import ClickCommand
+from zcompy.parser_command import ParserCommand
+from zcompy.static_command import StaticCommand, UnresolvableError
+
+ARGPARSE_SOURCE = '''
+import argparse
+import os
+
+MODES = ["fast", "slow"]
+
+
+def parse_size(value):
+    return int(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="trainer", description="Train models", formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
+    parser.add_argument("--mode", choices=MODES, default=os.environ.get("MODE"), help="Run mode")
+    parser.add_argument("--tag", action="append", help="Tag " + "values")
+    sub = parser.add_subparsers(dest="cmd")
+    sub.required = True
+    fit = sub.add_parser("fit", help="Fit a model", aliases=["train"])
+    group = fit.add_argument_group("data")
+    group.add_argument("--size", type=parse_size, help=f"Batch size of {MODES[0]}")
+    group.add_argument("--epochs", type=int, help="Epochs")
+    exclusive = fit.add_mutually_exclusive_group()
+    exclusive.add_argument("--gpu", action="store_true", help="Use GPU")
+    exclusive.add_argument("--cpu", action="store_false", help="Use CPU")
+    evaluate = sub.add_parser("eval", description="Evaluate a model")
+    eval_sub = evaluate.add_subparsers()
+    eval_sub.add_parser("quick", help="Quick eval").add_argument("--n", type=float, help="N")
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if not args.cmd:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+CLICK_SOURCE = """
+import click
+from click import option
+
+LEVELS = ("low", "high")
+
+
+@click.group()
+@click.option("--debug/--no-debug", default=False, help="Debug mode")
+def cli(debug):
+    '''Tool entry.'''
+
+
+@cli.command()
+@option("--count", default=1, help="Number of greetings.")
+@click.option("--level", type=click.Choice(LEVELS), help="Level")
+@click.option("--path", type=click.Path(exists=False), multiple=True, help="Paths")
+@click.argument("name")
+@click.pass_context
+def hello(ctx, count, level, path, name):
+    '''Say hello.
+
+    Multi-line docstring.
+    '''
+    click.echo(name)
+
+
+@click.command(name="bye-bye")
+@click.option("--loud", is_flag=True, help="Loud", callback=lambda ctx, param, value: value)
+@click.version_option("1.0")
+def bye(loud):
+    pass
+
+
+cli.add_command(bye)
+
+if __name__ == "__main__":
+    cli()
+"""
+
+
+def write_sources(tmp_path, name, source):
+    """Write the CLI source, and a copy that fails on import like a heavy dependency."""
+    live_file = tmp_path / f"{name}.py"
+    live_file.write_text(source)
+    static_file = tmp_path / f"{name}_static.py"
+    static_file.write_text("import zcompy_missing_heavy_dependency\n" + source)
+
+    spec = importlib.util.spec_from_file_location(name, live_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module, str(static_file)
+
+
+def test_static_argparse(tmp_path):
+    module, static_file = write_sources(tmp_path, "cli_argparse", ARGPARSE_SOURCE)
+    expected = ParserCommand(module.build_parser()).to_command()
+
+    command = StaticCommand(static_file, fallback=False).to_command()
+    assert command == expected
+    assert [x.name for x in command.sub_commands] == ["fit", "train", "eval"]
+    assert command.complete_source() == expected.complete_source()
+
+    command = StaticCommand(static_file, target="build_parser", fallback=False).to_command()
+    assert command == expected
+
+
+@pytest.mark.parametrize("target", ["cli", "hello", "bye"])
+def test_static_click(tmp_path, target):
+    module, static_file = write_sources(tmp_path, "cli_click", CLICK_SOURCE)
+    expected = ClickCommand(getattr(module, target)).to_command()
+
+    command = StaticCommand(static_file, target=target, fallback=False).to_command()
+    assert command == expected
+    assert command.complete_source() == expected.complete_source()
+
+
+def test_static_click_root(tmp_path):
+    _, static_file = write_sources(tmp_path, "cli_click", CLICK_SOURCE)
+    assert StaticCommand(static_file, fallback=False).static_cli().name == "cli"
+
+
+UNRESOLVABLE_SOURCE = '''
+import argparse
+
+
+def add_common(parser):
+    parser.add_argument("--config", help="Config file")
+
+
+parser = argparse.ArgumentParser(prog="tool")
+add_common(parser)
+'''
+
+
+def test_static_fallback_to_import(tmp_path):
+    source_file = tmp_path / "cli_unresolvable.py"
+    source_file.write_text(UNRESOLVABLE_SOURCE)
+
+    with pytest.raises(UnresolvableError):
+        StaticCommand(str(source_file), fallback=False).to_command()
+
+    command = StaticCommand(str(source_file)).to_command()
+    assert command.name == "tool"
+    assert [x.names for x in command.options] == [("--config",)]
@@ -1,10 +1,19 @@
+import os
+import subprocess
+import sys
+
 import pytest
 
 from zcompy.utils import (
+    func_key,
     pattern_to_glob,
     python_func_as_shell_source,
+    python_func_source,
     source_by_options_denpendency,
     source_by_options_existence,
+    write_chunks,
+    write_if_changed,
+    zsh_compile,
     zsh_completion_function,
 )
 
@@ -120,3 +129,126 @@ def test_py_func_as_shell(func, expected, ignore):
     src, name = python_func_as_shell_source(func, ignore)
     assert src.strip() == expected[0].strip()
     assert name == expected[1]
+
+
+_F_SHELL_CACHE = r"""
+f() {
+  local -a choices
+  local line opt msg
+  local a_value
+  a_value=${opt_args[-a]:-${opt_args[--full]}}
+
+  while IFS= read -r line; do
+    opt="${line%% *}"
+    msg="${line#* }"
+    choices+=("$opt:$msg")
+  done < <(__zcompy_cached 60 f __f "$a_value")
+  _describe -t choices 'choices' choices
+}
+"""
+
+
+@pytest.mark.parametrize("cache_key, expected_key", [
+    (None, "f"),
+    ("inventory", "inventory"),
+    ("my key", "'my key'"),
+])
+def test_zsh_com_func_cache(cache_key, expected_key):
+    src = zsh_completion_function(
+        "f", "__f", ("-a", "--full"), cache_ttl=60, cache_key=cache_key,
+    )
+    answer = _F_SHELL_CACHE.replace("__zcompy_cached 60 f", f"__zcompy_cached 60 {expected_key}")
+    assert src.strip() == answer.strip()
+
+
+def test_write_if_changed(tmp_path):
+    file_name = str(tmp_path / "_tool")
+    assert write_if_changed(file_name, "a")
+    assert not write_if_changed(file_name, "a")
+    assert write_if_changed(file_name, "b")
+    assert open(file_name).read() == "b"
+
+
+def test_zsh_compile_without_zsh(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    file_name = tmp_path / "_tool"
+    file_name.write_text("_tool() {}\n")
+    assert zsh_compile([str(file_name)]) == []
+    assert not (tmp_path / "_tool.zwc").exists()
+
+
+def test_zsh_compile_only_outdated(tmp_path, monkeypatch):
+    # fake zsh which logs the compiled files
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_zsh = bin_dir / "zsh"
+    fake_zsh.write_text(
+        '#!/bin/sh\nshift 4\nfor f in "$@"; do echo "$f" >> "$f.log"; : > "$f.zwc"; done\n'
+    )
+    fake_zsh.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir))
+
+    file_name = str(tmp_path / "_tool")
+    write_if_changed(file_name, "_tool() {}\n")
+    assert zsh_compile([file_name]) == [f"{file_name}.zwc"]
+    assert zsh_compile([file_name]) == []
+
+    os.utime(f"{file_name}.zwc", (0, 0))  # source is newer than the wordcode
+    assert zsh_compile([file_name]) == [f"{file_name}.zwc"]
+    assert open(f"{file_name}.log").read().count(file_name) == 2
+
+
+def test_write_chunks_is_atomic(tmp_path):
+    file_name = str(tmp_path / "_tool")
+    write_if_changed(file_name, "old")
+
+    def broken_chunks():
+        yield "new"
+        raise RuntimeError("generation failed")
+
+    with pytest.raises(RuntimeError):
+        write_chunks(file_name, broken_chunks())
+    assert open(file_name).read() == "old"
+    assert os.listdir(tmp_path) == ["_tool"]
+    assert write_chunks(file_name, iter(["ne", "w"]))
+    assert open(file_name).read() == "new"
+
+
+def bulk_items(prefix):
+    yield f"{prefix}:1"
+    yield (f"{prefix}2", "second\nitem")
+
+
+@pytest.mark.parametrize("protocol, expected", [
+    ("describe", "x\\:1\nx2:second item\n"),
+    ("tsv", "x:1\nx2\tsecond item\n"),
+])
+def test_python_func_source_bulk(tmp_path, protocol, expected):
+    script = tmp_path / "bulk_items.py"
+    script.write_text(python_func_source(bulk_items, bulk=True, protocol=protocol))
+    result = subprocess.run(
+        [sys.executable, str(script), "x"], capture_output=True, text=True, check=True
+    )
+    assert result.stdout == expected
+
+
+def test_zsh_com_func_bulk():
+    src = zsh_completion_function("f", "__f", "--full", protocol="describe")
+    assert 'choices=(${(f)"$(__f "$full_value")"})' in src
+    assert "while IFS= read" not in src
+
+
+def test_zsh_com_func_tsv():
+    src = zsh_completion_function("f", "__f", protocol="tsv")
+    assert 'lines=(${(f)"$(__f)"})' in src
+    # quoted, so that an empty value doesn't shift the displays against the values
+    assert '''values=("${(@)lines%%$'\\t'*}")''' in src
+    assert "compadd -l -d displays -a values" in src
+    assert "_describe" not in src
+
+
+def test_func_key():
+    namespace = {"__name__": "other_cli"}
+    exec("def bulk_items(prefix):\n    return []\n", namespace)
+    assert func_key(namespace["bulk_items"]) == "other_cli.bulk_items"
+    assert func_key(bulk_items) != func_key(namespace["bulk_items"])
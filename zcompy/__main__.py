@@ -0,0 +1,76 @@
+"""Command line entry of zcompy, generate the completions listed in a manifest."""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+from .batch import generate_all, load_manifest
+from .discover import discover
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="zcompy", description="Generate zsh completions of the CLIs in a JSON manifest.",
+    )
+    parser.add_argument("manifest", nargs="?", help="JSON manifest of the targets to generate.")
+    parser.add_argument(
+        "--discover", action="store_true",
+        help="Generate completions of the console scripts of installed distributions.",
+    )
+    parser.add_argument(
+        "--include", nargs="+", default=None,
+        help="Glob patterns of distribution names to discover, default to all.",
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default=None,
+        help="Directory to install completions, overrides output_dir of the manifest.",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="Number of worker processes.",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="Seconds to wait for every target.",
+    )
+    parser.add_argument(
+        "--compile-zwc", action="store_true", help="Compile completions to zsh wordcode.",
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.discover:
+        results = discover(
+            output_dir=args.output_dir or "~/.zsh/Completion",
+            include=args.include,
+            jobs=args.jobs,
+            timeout=args.timeout or 30,
+            compile_zwc=args.compile_zwc,
+        )
+    elif args.manifest:
+        settings, targets = load_manifest(args.manifest)
+        results = generate_all(
+            targets,
+            output_dir=args.output_dir or settings.get("output_dir", "~/.zsh/Completion"),
+            jobs=args.jobs or settings.get("jobs"),
+            timeout=args.timeout or settings.get("timeout", 60),
+            compile_zwc=args.compile_zwc or settings.get("compile_zwc", False),
+        )
+    else:
+        parser.error("either a manifest or --discover is required")
+
+    failed = 0
+    for result in results:
+        if result.error is not None:
+            failed += 1
+            print(f"FAILED {result.target.target}: {result.error}", file=sys.stderr)
+        else:
+            print(f"{result.name}: {result.report.summary()}")
+    print(f"{len(results) - failed} generated, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
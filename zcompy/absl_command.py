@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from absl.flags import FLAGS, FlagValues
 
@@ -28,6 +28,10 @@ def alias_of(flag) -> str:
 class AbslFlagsCommand:
     name: str
     flags: FlagValues = None
+    # completions with the same choices are shared by their options
+    _completions: dict[tuple[str, ...], Completion] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     def __post_init__(self):
         self.name = "_".join(self.name.split())  # ensure no space in name
@@ -38,21 +42,20 @@ class AbslFlagsCommand:
         """Convert ABSL flags to a Command object with completion support."""
         command = Command(name=self.name, description="Command with flag-based completion")
 
-        alias_mapping = {}
+        aliases = {}  # flag name -> alias option names
+        for flag_name in self.flags:
+            flag = self.flags[flag_name]
+            if is_alias_flag(flag):
+                aliases.setdefault(alias_of(flag), []).append(f"-{flag_name}")
+
         for flag_name in self.flags:
             flag = self.flags[flag_name]
             if is_alias_flag(flag):
-                alias_mapping[f"-{flag_name}"] = f"--{alias_of(flag)}"
                 continue
             option = self.create_option_from_flag(flag)
+            option.names = tuple(option.names) + tuple(aliases.get(flag.name, ()))
             command.add_options(option)
 
-        # add alias in option
-        for alias, original in alias_mapping.items():
-            for opt in command.options:
-                if original in tuple(opt.names):
-                    opt.names = tuple(opt.names) + (alias,)
-
         return command
 
     def create_option_from_flag(self, flag) -> Option:
@@ -63,6 +66,8 @@ class AbslFlagsCommand:
         if all(x in flag_help for x in ["<", ">", "|", ":"]):  # for enum option
             flag_help = flag_help.split(":", maxsplit=1)[1].strip()
         completion = self._get_completion_for_flag(flag)
+        if completion is not None:
+            completion = self._completions.setdefault(completion.func, completion)
 
         return Option(
             names=tuple(option_names),
@@ -1,5 +1,12 @@
 from .action import Action, Default, Files, Hosts, OSEnv, ProcessID, SimpleAction, URLs, UserNames
-from .extend_action import Completion, DependentCompletion, ExtendAction, GitBranches, GitCommits
+from .extend_action import (
+    Completion,
+    DependentCompletion,
+    ExtendAction,
+    GitBranches,
+    GitCommits,
+    IndexedChoices,
+)
 
 __all__ = [
     "Action",
@@ -9,6 +16,7 @@ __all__ = [
     "Files",
     "GitCommits",
     "GitBranches",
+    "IndexedChoices",
     "URLs",
     "OSEnv",
     "ProcessID",
@@ -1,9 +1,8 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
 
-from zcompy.utils import pattern_to_glob
+from zcompy.utils import pattern_to_glob, slots_dataclass
 
 __all__ = [
     "Action",
@@ -21,6 +20,8 @@ __all__ = [
 class Action(ABC):
     """Base class for actions that can be performed by commands."""
 
+    __slots__ = ()
+
     @abstractmethod
     def type_hint(self) -> str:
         pass
@@ -30,7 +31,7 @@ class Action(ABC):
         pass
 
 
-@dataclass
+@slots_dataclass
 class SimpleAction(Action):
 
     hint: str
@@ -43,7 +44,7 @@ class SimpleAction(Action):
         return self.cmd_source
 
 
-@dataclass
+@slots_dataclass
 class Files(Action):
     # pattern/ignore_pattern example: "*.txt" or ("*.txt", "*.md")
     pattern: str | tuple[str] | None = None
@@ -70,21 +71,21 @@ class Files(Action):
         return source.strip()
 
 
-@dataclass
+@slots_dataclass
 class Default(SimpleAction):
     """Default action for commands without specific actions."""
     hint: str = "Default"
     cmd_source: str = "_default"
 
 
-@dataclass
+@slots_dataclass
 class URLs(SimpleAction):
     """Action to represent a URL."""
     hint: str = "URLs"
     cmd_source: str = "_urls"
 
 
-@dataclass
+@slots_dataclass
 class OSEnv(SimpleAction):
     """Action to represent an OS environment variable."""
 
@@ -92,7 +93,7 @@ class OSEnv(SimpleAction):
     cmd_source: str = "_parameters"
 
 
-@dataclass
+@slots_dataclass
 class ProcessID(SimpleAction):
     """Action to represent a process ID."""
 
@@ -100,7 +101,7 @@ class ProcessID(SimpleAction):
     cmd_source: str = "_pids"
 
 
-@dataclass
+@slots_dataclass
 class UserNames(SimpleAction):
     """Action to represent a user name."""
 
@@ -108,7 +109,7 @@ class UserNames(SimpleAction):
     cmd_source: str = "_users"
 
 
-@dataclass
+@slots_dataclass
 class Hosts(SimpleAction):
     """Action to represent a host name."""
     hint: str = "Host name"
@@ -1,16 +1,28 @@
 from __future__ import annotations
 
+import contextlib
+import hashlib
+import inspect
 import os
+import shlex
 from abc import abstractmethod
-from dataclasses import dataclass
 from typing import Callable
 
+from zcompy.daemon import daemon_client_source, registered_file, registered_source
+from zcompy.helper_module import HelperModule
 from zcompy.utils import (
+    OUTPUT_PROTOCOLS,
     chmod_execute,
+    func_key,
     is_lambda_func,
     python_func_as_shell_source,
     python_func_source,
+    slots_dataclass,
+    source_by_options_denpendency,
+    write_if_changed,
+    zsh_cache_helper_source,
     zsh_completion_function,
+    zsh_git_refs_helper_source,
 )
 
 from .action import Action
@@ -21,20 +33,48 @@ __all__ = [
     "CustomShell",
     "GitBranches",
     "GitCommits",
+    "IndexedChoices",
     "PidDetails",
     "DependentCompletion",
+    "python_files_deferred",
 ]
 
+# True while the caller installs the python files of completions, see `python_files_deferred`
+_python_files_deferred = False
 
-@dataclass
+
+@contextlib.contextmanager
+def python_files_deferred():
+    """Render completions without writing their python files, the caller installs them."""
+    global _python_files_deferred
+    deferred, _python_files_deferred = _python_files_deferred, True
+    try:
+        yield
+    finally:
+        _python_files_deferred = deferred
+
+
+@slots_dataclass
 class ExtendAction(Action):
 
     @abstractmethod
     def zsh_func_source(self) -> str:
         pass
 
+    def zsh_helper_sources(self) -> list[str]:
+        """Shared zsh functions used by `zsh_func_source`, emitted once per script."""
+        return []
+
+    def generated_files(self) -> dict[str, str]:
+        """Files read on completion besides the script, keyed by their absolute paths.
+
+        They are written by `Command.completion_entry` and `zcompy.batch.generate_all`,
+        rendering the source never writes them.
+        """
+        return {}
 
-@dataclass
+
+@slots_dataclass
 class CustomShell(ExtendAction):
 
     func_name: str
@@ -51,12 +91,21 @@ class CustomShell(ExtendAction):
         return zsh_completion_function(self.func_name, self.cmd)
 
 
-@dataclass
+@slots_dataclass
 class GitBranches(ExtendAction):
     tags: bool = False
     # if tags is set, then also show tags
     remote: bool = False
     # if remote is True, only shows remote branches
+    cached: bool = False
+    # if True, refs are cached in the shell until the refs of the repository change
+    max_results: int | None = None
+    # if set, only the first max_results refs of every kind starting with the word are shown
+
+    def __post_init__(self):
+        assert self.max_results is None or self.max_results > 0, (
+            "max_results must be a positive number."
+        )
 
     def type_hint(self) -> str:
         return "GitRemoteBranches" if self.remote else "GitBranches"
@@ -66,14 +115,24 @@ class GitBranches(ExtendAction):
 
     def zsh_func_name(self) -> str:
         if self.remote:
-            return "git_remote_branches"
+            name = "git_remote_branches"
         elif self.tags:
-            return "git_branches_and_tags"
+            name = "git_branches_and_tags"
         else:
-            return "git_branches"
+            name = "git_branches"
+        if self.cached:
+            name += "_cached"
+        if self.max_results is not None:
+            name += f"_{self.max_results}"
+        return name
+
+    def zsh_helper_sources(self) -> list[str]:
+        return [zsh_git_refs_helper_source()] if self.cached else []
 
     def zsh_func_source(self) -> str:
-        if self.remote:
+        if self.cached or self.max_results is not None:
+            return self._filtered_source()
+        elif self.remote:
             return self._remote_branches_source()
         elif self.tags:
             return self._branches_and_tags_source()
@@ -108,26 +167,127 @@ _{self.zsh_func_name()}() {{
 }}
 """
 
+    def _ref_kinds(self) -> list[tuple[str, str, str]]:
+        """(variable, description, namespace) of every kind of shown refs."""
+        if self.remote:
+            return [("branches", "remote branch", "refs/remotes")]
+        kinds = [("branches", "branch", "refs/heads")]
+        if self.tags:
+            kinds.append(("tags", "tag", "refs/tags"))
+        return kinds
+
+    def _filtered_source(self) -> str:
+        """Source reading refs from the cache of `__zcompy_git_refs` or a filtered git call.
+
+        Refs are added by compadd, which is much faster than `_values` for many refs.
+        """
+        kinds = self._ref_kinds()
+        variables = " ".join(x for x, _, _ in kinds)
+        lines = []
+        if self.cached:
+            variables += " reply"
+            lines.append(f"__zcompy_git_refs {' '.join(x for _, _, x in kinds)}")
+        for var, _, namespace in kinds:
+            if self.cached:
+                prefix = "" if self.max_results is None else "${(b)PREFIX}"
+                lines.append(f"{var}=(${{${{(M)reply:#{namespace}/{prefix}*}}#{namespace}/}})")
+                if self.max_results is not None:
+                    lines.append(f"{var}=(${{{var}[1,{self.max_results}]}})")
+            else:
+                # * of the patterns doesn't match /, but ** does
+                git_cmd = (
+                    f"git for-each-ref --count={self.max_results} --format='%(refname:short)' "
+                    f"\"{namespace}/$PREFIX*\" \"{namespace}/$PREFIX*/**\""
+                )
+                lines.append(f'{var}=(${{(f)"$({git_cmd} 2>/dev/null)"}})')
+        for var, desc, _ in kinds:
+            lines.append(f"_wanted {var} expl '{desc}' compadd -a {var} && ret=0")
+        body = "".join(f"  {x}\n" for x in lines)
+        return f"""
+_{self.zsh_func_name()}() {{
+  local -a expl {variables}
+  local ret=1
+{body}  return ret
+}}
+"""
 
-@dataclass
+
+@slots_dataclass
 class GitCommits(ExtendAction):
 
     num_commits: int = 20
     full_hash: bool = False
+    cached: bool = False
+    # if True, commits are cached in the shell until the resolved sha of the ref changes
+    ref: str | None = None
+    # ref or branch to list the commits of, default to HEAD
+    depends_on: str | tuple[str, ...] | None = None
+    # option naming the ref, for example "--branch", ref is used if the option is not given
+
+    def __post_init__(self):
+        assert not (self.ref or "").startswith("-"), "ref must not start with '-'."
 
     def type_hint(self) -> str:
         return "GitCommits"
 
     def action_source(self) -> str:
-        return "_git_commits"
+        if not (self.cached or self.ref or self.depends_on):
+            return "_git_commits"
+        # functions of different refs or options must not share the name
+        config = repr((self.num_commits, self.full_hash, self.ref, self.depends_on))
+        digest = hashlib.sha1(config.encode()).hexdigest()[:8]
+        return f"_git_commits{'_cached' if self.cached else ''}_{digest}"
+
+    def zsh_helper_sources(self) -> list[str]:
+        return [zsh_git_refs_helper_source()] if self.cached else []
 
     def zsh_func_source(self) -> str:
         func_name = self.action_source()
-        cmd = f"git log --oneline -n {self.num_commits} --format='%h %s'"
-        return zsh_completion_function(func_name, cmd)
+        if func_name == "_git_commits":
+            cmd = f"git log --oneline -n {self.num_commits} --format='%h %s'"
+            return zsh_completion_function(func_name, cmd)
+        return self._scoped_source(func_name)
+
+    def _scoped_source(self, func_name: str) -> str:
+        """Source listing commits of ref as `_describe` entries filtered by the typed hash."""
+        hash_format = "%H" if self.full_hash else "%h"
+        git_log = f"log -n {self.num_commits} --format='{hash_format}:%s' $ref --"
+        lines = [f"local ref={shlex.quote(self.ref or 'HEAD')}"]
+        if self.depends_on:
+            src, name = source_by_options_denpendency(self.depends_on)
+            lines += [f"local {name}", src, f"[[ -n ${name} ]] && ref=${name}"]
+            # a value like `--output=file` would be parsed as an option of git log
+            lines.append("[[ $ref == -* ]] && return 1")
+        if self.cached:
+            # entries are the rev of ref and the commits of it, one per repository and ref
+            cache = f"_zcompy_cache{func_name}"
+            lines += [
+                "local entry",
+                f"typeset -gA {cache}",
+                "if __zcompy_git_rev $ref; then",
+                f"  entry=${{{cache}[$reply[1] $ref]}}",
+                "  if [[ ${entry%%$'\\n'*} != \"$REPLY\" ]]; then",
+                f"    entry=$REPLY$'\\n'$(git --git-dir=$reply[1] {git_log} 2>/dev/null)",
+                f"    {cache}[$reply[1] $ref]=$entry",
+                "  fi",
+                "  commits=(${(f)entry#*$'\\n'})",
+                "else",
+                f'  commits=(${{(f)"$(git {git_log} 2>/dev/null)"}})',
+                "fi",
+            ]
+        else:
+            lines.append(f'commits=(${{(f)"$(git {git_log} 2>/dev/null)"}})')
+        lines.append("commits=(${(M)commits:#${(b)PREFIX}*})")
+        body = "".join(f"  {x}\n" for x in lines)
+        return f"""
+{func_name}() {{
+  local -a commits
+{body}  _describe -t commits 'commit' commits
+}}
+"""
 
 
-@dataclass
+@slots_dataclass
 class PidDetails(ExtendAction):
 
     user: bool = False
@@ -148,7 +308,93 @@ class PidDetails(ExtendAction):
         return zsh_completion_function(func_name, cmd)
 
 
-@dataclass
+@slots_dataclass
+class IndexedChoices(ExtendAction):
+    """Choices looked up by prefix in a sorted index file, for very long lists of choices.
+
+    Unlike choices of `Completion`, they are not inlined into the script. The index is
+    written when the completion is generated, and searched with `look(1)`, which does a
+    binary search over the memory-mapped file. zsh filters the index itself if look is
+    not installed.
+    """
+
+    choices: tuple[str, ...] | dict[str, str]
+    # choices, or a dict mapping choices to their descriptions
+    name: str
+    # name of the index, the completion function is `_zcompy_choices_{name}`
+    path: str | None = None
+    # directory to write the index, default to the ZCOMPY_FUNC_SAVE_PATH environment variable
+    max_results: int = 100
+    # the most choices shown on one completion
+    hint: str = "Choices"
+
+    def __post_init__(self):
+        assert self.name.isidentifier(), "name must be a valid identifier."
+        assert self.max_results > 0, "max_results must be a positive number."
+        if not self.path:
+            self.path = os.environ.get("ZCOMPY_FUNC_SAVE_PATH", None)
+        assert self.path is not None, (
+            "Path to save the index must be specified. "
+            "Set it explicitly or use the ZCOMPY_FUNC_SAVE_PATH environment variable."
+        )
+
+    def type_hint(self) -> str:
+        return self.hint
+
+    def action_source(self) -> str:
+        return f"_zcompy_choices_{self.name}"
+
+    def index_file(self) -> str:
+        return os.path.join(os.path.expanduser(self.path), f"zcompy_choices_{self.name}")
+
+    def index_source(self) -> str:
+        """Content of the index, one `_describe` entry per line in byte order."""
+        if isinstance(self.choices, dict):
+            items = self.choices.items()
+        else:
+            items = ((x, "") for x in self.choices)
+        lines = []
+        for choice, desc in items:
+            assert "\n" not in choice, f"Choice {choice!r} contains a newline."
+            line = choice.replace(":", r"\:")
+            if desc:
+                line += ":" + " ".join(desc.splitlines())
+            lines.append(line)
+        lines.sort(key=lambda x: x.encode())  # the order of `LC_ALL=C look`
+        return "".join(f"{x}\n" for x in lines)
+
+    def generated_files(self) -> dict[str, str]:
+        return {self.index_file(): self.index_source()}
+
+    def write_index(self) -> bool:
+        """Write the index, unless it is unchanged.
+
+        Returns:
+            True if the file is written.
+        """
+        file_name = self.index_file()
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        return write_if_changed(file_name, self.index_source())
+
+    def zsh_func_source(self) -> str:
+        return f"""
+{self.action_source()}() {{
+  local index={shlex.quote(self.index_file())} prefix=${{PREFIX//:/\\\\:}}
+  local -a choices
+  if [[ -z $prefix ]]; then
+    choices=(${{(f)"$(head -n {self.max_results} $index)"}})
+  elif (( $+commands[look] )); then
+    choices=(${{(f)"$(LC_ALL=C look -- $prefix $index | head -n {self.max_results})"}})
+  else
+    choices=(${{(M)${{(f)"$(<$index)"}}:#${{(b)prefix}}*}})
+    choices=(${{choices[1,{self.max_results}]}})
+  fi
+  _describe -t choices {shlex.quote(self.hint)} choices
+}}
+"""
+
+
+@slots_dataclass
 class Completion(ExtendAction):
     """Class to represent a completion with its attributes."""
 
@@ -162,6 +408,26 @@ class Completion(ExtendAction):
     # if shell_embed is False, the path to save the shell file
     ignore_exception: bool = False
     # if set to True, exceptions of func will be redirected to /dev/null
+    daemon: bool = False
+    # if True, func is served by the zcompy daemon and falls back to python3 if it's down
+    cache_ttl: int | None = None
+    # seconds to reuse the output of func from the on-disk cache, None means no cache
+    cache_key: str | None = None
+    # name of the cache entry, default to the name of func
+    timeout_ms: int | None = None
+    # latency budget of func, the last cached result is used if func doesn't finish in time
+    helper_module: HelperModule | None = None
+    # if set, func is called from the precompiled helper module, see `Command.use_helper_module`
+    prefix_aware: bool = False
+    # if True, the word being completed and max_results are passed as the last two args of func
+    max_results: int = 100
+    # the most entries func should print if prefix_aware is True
+    bulk: bool | None = None
+    # if True, func returns or yields the items instead of printing them, which are written
+    # and read at once, see `write_completion_items`. None means True for generator functions.
+    protocol: str | None = None
+    # output format of func, see `zsh_completion_function`. "tsv" is the fastest to read.
+    # None means "describe" for bulk functions and "lines" otherwise.
 
     def __post_init__(self):
         if is_lambda_func(self.func):
@@ -172,6 +438,17 @@ class Completion(ExtendAction):
             assert isinstance(shell_embed, str)
             self.shell_embed = shell_embed.lower() == "true" or shell_embed == "1"
 
+        daemon = os.environ.get("ZCOMPY_DAEMON", False)
+        if daemon:
+            self.daemon = daemon.lower() == "true" or daemon == "1"
+
+        if self.cache_ttl is not None:
+            assert self.cache_ttl >= 0, "cache_ttl must be a non-negative number of seconds."
+        if self.timeout_ms is not None:
+            assert self.timeout_ms > 0, "timeout_ms must be a positive number of milliseconds."
+        assert self.max_results > 0, "max_results must be a positive number."
+        assert self.protocol in (None, *OUTPUT_PROTOCOLS), f"Unknown protocol: {self.protocol}"
+
         if callable(self.func) and not self.shell_embed:
             # specify the path to save the function
             if not self.path:
@@ -192,40 +469,99 @@ class Completion(ExtendAction):
         if isinstance(self.func, (tuple, list)):  # _values
             return "(" + " ".join(self.func) + ")"
         elif callable(self.func):
-            if not self.shell_embed:
+            if not (self.shell_embed or _python_files_deferred):
                 self.write_python()
             return f"_{self.func.__name__}"
         elif isinstance(self.func, Action):
             return self.func.action_source()
 
-    def write_python(self):
+    def is_bulk(self) -> bool:
+        """Whether func returns its items, see `bulk`."""
+        if self.bulk is not None:
+            return self.bulk
+        return inspect.isgeneratorfunction(self.func)
+
+    def output_protocol(self) -> str:
+        """Output format of func, see `protocol`."""
+        if self.protocol is not None:
+            return self.protocol
+        return "describe" if self.is_bulk() else "lines"
+
+    def python_file_source(self) -> str:
+        """Source of the executable script written by `write_python`."""
         assert callable(self.func), "Function must be callable."
+        source = python_func_source(self.func, self.is_bulk(), self.output_protocol())
+        return f"#!/usr/bin/env python3\n\n{source}"
+
+    def python_file(self) -> str:
+        """Path of the executable script written by `write_python`."""
         assert isinstance(self.path, str), "Path must be specified to write."
-        func_name = self.func.__name__
-        real_path = os.path.expanduser(self.path)
-        file_name = os.path.join(real_path, f"{func_name}")
-        func_source = python_func_source(self.func)
-        file_source = f"#!/usr/bin/env python3\n\n{func_source}"
+        return os.path.join(os.path.expanduser(self.path), self.func.__name__)
+
+    def write_python(self) -> bool:
+        """Write func as an executable script in path, unless the script is unchanged.
 
-        with open(file_name, "w") as f:
-            f.write(file_source)
+        Returns:
+            True if the file is written.
+        """
+        assert callable(self.func), "Function must be callable."
+        file_name = self.python_file()
+        written = write_if_changed(file_name, self.python_file_source())
         chmod_execute(file_name)  # add executed
-        print(f"Source file created at: {file_name}")
+        if written:
+            print(f"Source file created at: {file_name}")
+        return written
+
+    def python_shell_source(self) -> tuple[str, str]:
+        """Shell code to run func and the command name to call it with."""
+        func_name = self.func.__name__
+        if self.helper_module is not None:
+            return self.helper_module.shell_source(self.func, self.ignore_exception, self.daemon)
+        elif self.shell_embed:
+            return python_func_as_shell_source(
+                self.func, self.ignore_exception, self.daemon, self.is_bulk(),
+                self.output_protocol(),
+            )
+        elif self.daemon:
+            shell_code = f"""__{func_name}() {{
+  __zcompy_daemon {shlex.quote(func_key(self.func))} "$@" && return
+  {func_name} "$@"
+}}
+"""
+            return shell_code, f"__{func_name}"
+        return "", func_name
+
+    def zsh_helper_sources(self) -> list[str]:
+        if not callable(self.func):
+            return []
+        helper_sources = []
+        if self.daemon:
+            helper_sources.append(daemon_client_source())
+        if self.cache_ttl is not None or self.timeout_ms is not None:
+            helper_sources.append(zsh_cache_helper_source())
+        return helper_sources
+
+    def generated_files(self) -> dict[str, str]:
+        if not (callable(self.func) and self.daemon):
+            return {}
+        source = registered_source(self.func, self.is_bulk(), self.output_protocol())
+        return {registered_file(self.func): source}
 
     def zsh_func_source(self) -> str:
         if not callable(self.func):
             return ""
 
-        func_name = self.func.__name__
-
-        shell_code, cmd_name = "", func_name
-        if self.shell_embed:
-            shell_code, cmd_name = python_func_as_shell_source(self.func, self.ignore_exception)
-
-        return shell_code + zsh_completion_function(f"_{func_name}", cmd_name)
+        shell_code, cmd_name = self.python_shell_source()
+        comp_src = zsh_completion_function(
+            f"_{self.func.__name__}", cmd_name,
+            cache_ttl=self.cache_ttl, cache_key=self.cache_key, timeout_ms=self.timeout_ms,
+            max_results=self.max_results if self.prefix_aware else None,
+            protocol=self.output_protocol(),
+        )
+        return shell_code + comp_src
 
 
-@dataclass
+@slots_dataclass
 class DependentCompletion(Completion):
     """Action to represent a completion that depends on another action."""
     func: Callable
@@ -239,7 +575,7 @@ class DependentCompletion(Completion):
     # the value `1`/`0` will be a args in the completion function.
 
     def __post_init__(self):
-        super().__post_init__()
+        Completion.__post_init__(self)
         assert callable(self.func), "Function must be callable."
         assert self.depends_on or self.exist_depends_on, "Option must depend on another option."
 
@@ -247,20 +583,21 @@ class DependentCompletion(Completion):
         return "Depend option Completion"
 
     def zsh_func_source(self) -> str:
-        func_name = self.func.__name__
-        shell_code, cmd_name = "", func_name
-        if self.shell_embed:
-            shell_code, cmd_name = python_func_as_shell_source(self.func, self.ignore_exception)
-
+        shell_code, cmd_name = self.python_shell_source()
         comp_src = zsh_completion_function(
-            f"_{func_name}", cmd_name,
+            f"_{self.func.__name__}", cmd_name,
             options_dependency=self.depends_on,
             exist_dependency=self.exist_depends_on,
+            cache_ttl=self.cache_ttl,
+            cache_key=self.cache_key,
+            timeout_ms=self.timeout_ms,
+            max_results=self.max_results if self.prefix_aware else None,
+            protocol=self.output_protocol(),
         )
         return shell_code + comp_src
 
 
-@dataclass
+@slots_dataclass
 class MultiCompletions(Completion):
     """Action to represent multiple completions for one option."""
 
@@ -285,3 +622,15 @@ class MultiCompletions(Completion):
 
     def zsh_func_source(self) -> str:
         return "\n".join([x.zsh_func_source() if isinstance(x, Completion) else "" for x in self.func])
+
+    def zsh_helper_sources(self) -> list[str]:
+        return [
+            src for x in self.func if isinstance(x, ExtendAction) for src in x.zsh_helper_sources()
+        ]
+
+    def generated_files(self) -> dict[str, str]:
+        files = {}
+        for x in self.func:
+            if isinstance(x, ExtendAction):
+                files.update(x.generated_files())
+        return files
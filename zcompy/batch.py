@@ -0,0 +1,281 @@
+"""Generate the completions of many CLIs in parallel.
+
+Every target is imported and converted in its own worker process with a timeout, so a
+slow or broken CLI can't block or crash the others. The generated files are written by
+the `Installer`, unchanged files are kept as they are.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from multiprocessing.connection import wait
+from typing import Any
+
+from .action.extend_action import python_files_deferred
+from .command import Command
+from .installer import Installer, InstallReport
+from .utils import zsh_compile
+
+__all__ = ["Target", "TargetResult", "generate_all", "load_manifest"]
+
+TARGET_TYPES = ("argparse", "click", "fire", "absl", "static", "entry_point")
+
+
+def import_object(target: str) -> Any:
+    """Import `module:attr`, attr could be dotted. The module itself if attr is omitted."""
+    module_name, _, attr = target.partition(":")
+    obj = importlib.import_module(module_name)
+    for name in filter(None, attr.split(".")):
+        obj = getattr(obj, name)
+    return obj
+
+
+@dataclass
+class Target:
+    """A CLI to generate completion for.
+
+    target is `module:attr` of a parser (or a function returning it), a click command,
+    a fire object, or `module[:flags]` of absl flags. For the static type, it is
+    `path/to/cli.py[:name]`, see `StaticCommand`. For the entry_point type, it is the
+    `module:function` of a console script, see `discover.capture_command`.
+    """
+
+    target: str
+    type: str = "argparse"
+    name: str | None = None
+    # name of the command, default to the one of the CLI
+    backend: str = "nested"
+    split: bool = False
+    dedup: bool = False
+    sort_completion: bool = True
+    python_path: list[str] = field(default_factory=list)
+    # directories added to sys.path before importing target
+    dynamic: bool = False
+    # install a stub resolving the active sub-command on completion, see `zcompy.dynamic`
+    cache_dir: str | None = None
+    # directory to cache the converted command, see `zcompy.serialize.load_cached`
+
+    def __post_init__(self):
+        assert self.type in TARGET_TYPES, f"Unknown target type: {self.type}"
+
+    def to_command(self) -> Command:
+        """Convert the target, or load it from the cache if its sources are unchanged."""
+        sys.path[:0] = self.python_path
+        if not self.cache_dir:
+            return self._build_command()
+
+        from .serialize import load_cached
+        key = json.dumps([self.target, self.type, self.name, self.python_path])
+        file_name = f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.marshal"
+        cache_file = os.path.join(os.path.expanduser(self.cache_dir), file_name)
+        if self.type == "static":
+            modules, files = [], [self.target.partition(":")[0]]
+        else:
+            modules, files = [self.target.partition(":")[0]], []
+        return load_cached(cache_file, self._build_command, modules=modules, files=files)
+
+    def _build_command(self) -> Command:
+        if self.type == "static":
+            from .static_command import StaticCommand
+            path, _, name = self.target.partition(":")
+            command = StaticCommand(path, target=name or None).to_command()
+        elif self.type == "entry_point":
+            from .discover import capture_command
+            command = capture_command(self.target, self.name or self.target.split(":")[-1])
+        elif self.type == "argparse":
+            from .parser_command import ParserCommand
+            parser = import_object(self.target)
+            parser = parser if hasattr(parser, "parse_args") else parser()
+            command = ParserCommand(parser).to_command()
+        elif self.type == "click":
+            from .click_command import ClickCommand
+            command = ClickCommand(import_object(self.target), name=self.name).to_command()
+        elif self.type == "fire":
+            from .fire_command import FireCommand
+            name = self.name or self.target.split(":")[-1].split(".")[-1]
+            command = FireCommand(name, obj=import_object(self.target)).to_command()
+        else:
+            from .absl_command import AbslFlagsCommand
+            module_name, _, attr = self.target.partition(":")
+            module = importlib.import_module(module_name)
+            flags = getattr(module, attr) if attr else None
+            name = self.name or module_name.split(".")[-1]
+            command = AbslFlagsCommand(name, flags).to_command()
+
+        if self.name:
+            command.name = self.name
+        return command
+
+    def render(self) -> tuple[str, dict[str, str]]:
+        """Name of the command and the content of its completion files.
+
+        Files are keyed by their paths relative to the output directory, or by absolute
+        paths for files read on completion elsewhere, see `Command.generated_files` and
+        `Command.python_files`. Rendering doesn't write any file, files starting with `#!`
+        are scripts to install as executables.
+        """
+        if self.dynamic:
+            from .dynamic import dynamic_stub, resolve_target
+            name = self.name or resolve_target(self, [])[0].name
+            return name, {f"_{name}": dynamic_stub(self, name)}
+
+        command = self.to_command()
+        split = self.split and self.backend == "nested"
+        with python_files_deferred():  # installed by `generate_all` with the other files
+            files = {f"_{command.name}": command.complete_source(
+                as_file=True, sort_completion=self.sort_completion, backend=self.backend,
+                split=split, dedup=self.dedup,
+            )}
+            if split:
+                files.update(command.autoload_functions(dedup=self.dedup))
+        files.update(command.python_files())
+        files.update(command.generated_files())
+        return command.name, files
+
+
+@dataclass
+class TargetResult:
+    target: Target
+    name: str | None = None
+    error: str | None = None
+    report: InstallReport | None = None
+
+
+def _render_worker(target: Target, conn):
+    try:
+        conn.send(("ok", target.render()))
+    except Exception as e:  # KeyboardInterrupt and SystemExit stop the worker
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def render_all(targets: list[Target], jobs: int | None = None, timeout: float = 60):
+    """Render targets in worker processes, one process per target.
+
+    Yields:
+        (index of target, ("ok", (name, files)) or ("error", message)) in completion order.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    ctx = multiprocessing.get_context()
+    pending = list(enumerate(targets))[::-1]
+    running = {}  # connection -> (index, process, deadline)
+
+    while pending or running:
+        while pending and len(running) < jobs:
+            idx, target = pending.pop()
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=_render_worker, args=(target, send_conn), daemon=True)
+            process.start()
+            send_conn.close()
+            running[recv_conn] = (idx, process, time.monotonic() + timeout)
+
+        next_deadline = min(deadline for _, _, deadline in running.values())
+        ready = wait(list(running), timeout=max(0, next_deadline - time.monotonic()))
+        for conn in ready:
+            idx, process, _ = running.pop(conn)
+            try:
+                result = conn.recv()
+            except EOFError:
+                result = ("error", f"worker exited with code {process.exitcode}")
+            conn.close()
+            process.join()
+            yield idx, result
+
+        now = time.monotonic()
+        for conn, (idx, process, deadline) in list(running.items()):
+            if deadline <= now and conn not in ready:
+                del running[conn]
+                process.kill()
+                process.join()
+                conn.close()
+                yield idx, ("error", f"timeout after {timeout}s")
+
+
+def generate_all(
+    targets: list[Target],
+    output_dir: str = "~/.zsh/Completion",
+    jobs: int | None = None,
+    timeout: float = 60,
+    compile_zwc: bool = False,
+) -> list[TargetResult]:
+    """Generate and install the completions of all targets.
+
+    Args:
+        targets: CLIs to generate completion for.
+        output_dir: Directory to install the completion files.
+        jobs: Number of worker processes, default to the number of CPUs.
+        timeout: Seconds to wait for a target to be imported and rendered.
+        compile_zwc: If True, also compile the installed files to `.zwc` wordcode.
+
+    Returns:
+        A result for every target, in the order of targets.
+    """
+    output_dir = os.path.expanduser(output_dir)
+    results = [TargetResult(x) for x in targets]
+    for idx, (status, value) in render_all(targets, jobs=jobs, timeout=timeout):
+        result = results[idx]
+        if status == "error":
+            result.error = value
+            continue
+        result.name, files = value
+        installers: dict[str, Installer] = {}
+        for file_name, content in files.items():
+            file_dir, name = os.path.split(os.path.join(output_dir, file_name))
+            if file_dir not in installers:
+                installers[file_dir] = Installer(file_dir, owner=result.name)
+            installers[file_dir].write(name, content, executable=content.startswith("#!"))
+        result.report = InstallReport()
+        for installer in installers.values():
+            result.report.update(installer.finish())
+        if compile_zwc and shutil.which("zsh"):
+            zsh_files = [x for x in files if not os.path.isabs(x)]
+            try:
+                zsh_compile([os.path.join(output_dir, x) for x in zsh_files])
+            except subprocess.CalledProcessError as e:
+                result.error = f"zcompile failed: {e}"
+    return results
+
+
+def load_manifest(path: str) -> tuple[dict[str, Any], list[Target]]:
+    """Load a JSON manifest of targets.
+
+    .. code-block:: json
+        {
+          "output_dir": "~/.zsh/Completion",
+          "python_path": ["src"],
+          "cache_dir": "~/.cache/zcompy",
+          "targets": [
+            {"target": "mytool.cli:build_parser", "name": "mytool"},
+            {"target": "other.cli:main", "type": "click"}
+          ]
+        }
+
+    Relative python_path entries and cache_dir are relative to the manifest. Returns
+    settings of the manifest (everything but targets) and the targets.
+    """
+    with open(path, "r") as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    python_path = [os.path.join(base_dir, x) for x in manifest.pop("python_path", [])]
+    cache_dir = manifest.pop("cache_dir", None)
+    if cache_dir:
+        cache_dir = os.path.join(base_dir, os.path.expanduser(cache_dir))
+    targets = []
+    for spec in manifest.pop("targets"):
+        if isinstance(spec, str):
+            spec = {"target": spec}
+        spec.setdefault("python_path", python_path)
+        spec.setdefault("cache_dir", cache_dir)
+        targets.append(Target(**spec))
+    return manifest, targets
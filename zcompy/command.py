@@ -1,15 +1,30 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass, field
-
-from .action import Action, ExtendAction
+import shutil
+import subprocess
+import sys
+from collections import Counter
+from dataclasses import field, fields
+from typing import IO, Iterator
+
+from .action import Action, Completion, ExtendAction
+from .action.extend_action import MultiCompletions
+from .fingerprint import node_digest
+from .helper_module import HelperModule
+from .installer import Installer, InstallReport
 from .option import Option
+from .table_backend import iter_table_completion_function
+from .utils import slots_dataclass, write_chunks, zsh_compile
 
 __all__ = ["Command"]
 
 
-@dataclass
+def _option_names(option: Option) -> tuple[str, ...]:
+    return (option.names,) if isinstance(option.names, str) else tuple(option.names)
+
+
+@slots_dataclass
 class Command:
     """Class to represent a command with sub-commands and options."""
 
@@ -24,25 +39,95 @@ class Command:
     sub_commands: list[Command] = field(default_factory=list)
     positional_args: list[Action] = field(default_factory=list)
     repeat_pos_args: Action | None = None
+    # name indexes of sub_commands and options, see `_name_index`
+    _indexes: dict[str, tuple] = field(default_factory=dict, init=False, repr=False)
+    # (list stamp, fingerprint) of this command, see `fingerprint` and `invalidate`
+    _fingerprint: tuple | None = field(default=None, init=False, repr=False)
+    # commands whose cached fingerprints include this one, see `invalidate`
+    _parents: list[Command] | None = field(default=None, init=False, repr=False)
+    # (options, fingerprint, source, python completions) of the last `complete_source`
+    _source_cache: tuple | None = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.name = sys.intern(self.name)  # names of sub-commands repeat across the tree
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name[0] != "_" and getattr(self, "_fingerprint", None) is not None:
+            self._drop_fingerprints()
+
+    def _name_index(self, attr: str, rebuild: bool = False) -> dict[str, int]:
+        """Positions of `options` or `sub_commands` by name, the first one wins on duplicates.
+
+        The index is kept up to date by `add_options` and `add_sub_commands`, and rebuilt
+        if the list is replaced or resized directly. Items replaced or renamed in place are
+        only caught by `_find` if their old name is looked up, call `invalidate` after such
+        changes.
+        """
+        items = getattr(self, attr)
+        cached = self._indexes.get(attr)
+        if not rebuild and cached is not None and cached[0] is items and cached[1] == len(items):
+            return cached[2]
+        index = {}
+        self._update_index(index, attr, items)
+        self._indexes[attr] = (items, len(items), index)
+        return index
+
+    def _update_index(self, index: dict, attr: str, new_items: list, start: int = 0):
+        if attr == "options":
+            for pos, opt in enumerate(new_items, start):
+                for name in _option_names(opt):
+                    index.setdefault(name, pos)
+        else:
+            for pos, cmd in enumerate(new_items, start):
+                index.setdefault(cmd.name, pos)
+
+    def _find(self, attr: str, name: str):
+        """Item of `options` or `sub_commands` with the given name, None if there is none.
+
+        A miss is trusted while the list isn't replaced or resized. A hit is checked against
+        the list, and the index is rebuilt once if the item was replaced or renamed.
+        """
+        items = getattr(self, attr)
+        index = self._name_index(attr)
+        for rebuilt in (False, True):
+            pos = index.get(name)
+            if pos is None:
+                return None
+            item = items[pos]
+            if name in (_option_names(item) if attr == "options" else (item.name,)):
+                return item
+            if not rebuilt:
+                index = self._name_index(attr, rebuild=True)
+        return None
+
+    def _add_items(self, attr: str, new_items: list):
+        index = self._name_index(attr)
+        items = getattr(self, attr)
+        start = len(items)
+        items.extend(new_items)
+        self._update_index(index, attr, new_items, start)
+        self._indexes[attr] = (items, len(items), index)
+        self._drop_fingerprints()
 
     def add_options(self, options: Option | list[Option]):
         """Add an option to this command."""
-        if isinstance(options, Option):
-            self.options.append(options)
-        else:
-            self.options.extend(options)
+        self._add_items("options", [options] if isinstance(options, Option) else options)
+
+    def get_option(self, name: str) -> Option | None:
+        """Option of this command with the given name, like `--file`."""
+        return self._find("options", name)
 
     def apply_on_command(self, func):
         """Apply a function to this command and all sub-commands."""
-        func(self)
-        for sub_cmd in self.sub_commands:
-            sub_cmd.apply_on_command(func)
+        stack = [self]
+        while stack:
+            cmd = stack.pop()
+            func(cmd)
+            stack.extend(reversed(cmd.sub_commands))
 
     def get_sub_command(self, name: str) -> Command | None:
-        for sub_cmd in self.sub_commands:
-            if sub_cmd.name == name:
-                return sub_cmd
-        return None
+        return self._find("sub_commands", name)
 
     def add_positional_args(self, action: Action | list[Action]):
         """Add a positional argument to this command."""
@@ -50,13 +135,13 @@ class Command:
             self.positional_args.append(action)
         else:
             self.positional_args.extend(action)
+        self._drop_fingerprints()
 
     def add_sub_commands(self, sub_command: Command | list[Command]):
         """Add a sub-command to this command."""
-        if isinstance(sub_command, Command):
-            self.sub_commands.append(sub_command)
-        else:
-            self.sub_commands.extend(sub_command)
+        self._add_items(
+            "sub_commands", [sub_command] if isinstance(sub_command, Command) else sub_command
+        )
 
     def add_action_for_options(self, *options, action: Action, recursive: bool = False):
         """Add an action for the given options.
@@ -69,31 +154,162 @@ class Command:
         .. code-block:: python
             command.add_action_for_options("--file", "--output", action=action)
         """
-        target_options = set(options)
-
-        for option in self.options:
-            names = {option.names} if isinstance(option.names, str) else set(option.names)
-            if names & target_options:
-                option.complete_func = action
+        def add_action(cmd: Command):
+            for name in options:
+                option = cmd.get_option(name)
+                if option is not None:
+                    option.complete_func = action
+                    cmd._drop_fingerprints()
 
         if recursive:  # add to sub-commands if recursive
-            for sub_command in self.sub_commands:
-                sub_command.add_action_for_options(*options, action=action, recursive=True)
+            self.apply_on_command(add_action)
+        else:
+            add_action(self)
+
+    def python_completions(self) -> list[Completion]:
+        """Completions of this command and all sub-commands that call a Python function.
+
+        Completions shared by several options are listed once.
+        """
+        completions = {}
+
+        def collect(action):
+            if isinstance(action, MultiCompletions):
+                for x in action.func:
+                    collect(x)
+            elif isinstance(action, Completion) and callable(action.func):
+                completions.setdefault(id(action), action)
+
+        def collect_command(cmd: Command):
+            for opt in cmd.options:
+                collect(opt.complete_func)
+            for action in [*cmd.positional_args, cmd.repeat_pos_args]:
+                collect(action)
+
+        self.apply_on_command(collect_command)
+        return list(completions.values())
+
+    def use_helper_module(
+        self, path: str, name: str | None = None, write: bool = True
+    ) -> HelperModule:
+        """Call all Python completions of the command tree from one precompiled module.
+
+        Args:
+            path: Directory to write the module.
+            name: Name of the module, default to `zcompy_<command name>`.
+            write: If False, the module is not written, the caller must write it.
+        """
+        helper = HelperModule(name or f"zcompy_{self.name}", path)
+        completions = self.python_completions()
+        for completion in completions:
+            helper.add(
+                completion.func, bulk=completion.is_bulk(), protocol=completion.output_protocol()
+            )
+        for completion in completions:
+            completion.helper_module = helper
+        if write:
+            helper.write()
+        return helper
+
+    def _list_stamp(self) -> tuple:
+        return (
+            id(self.options), len(self.options), id(self.sub_commands), len(self.sub_commands),
+            id(self.positional_args), len(self.positional_args),
+        )
+
+    def _cached_fingerprint(self) -> str | None:
+        cached = self._fingerprint
+        if cached is not None and cached[0] == self._list_stamp():
+            return cached[1]
+        return None
+
+    def invalidate(self):
+        """Drop the name indexes and cached fingerprints after changes the command can't see.
+
+        Changes through the `add_*` methods and attributes of the command are tracked. Call
+        it after replacing items of lists in place like `command.options[0] = option`, or
+        setting attributes of options directly. Fingerprints of the commands containing
+        this one are dropped too.
+        """
+        self._indexes.clear()
+        self._drop_fingerprints()
+
+    def _drop_fingerprints(self):
+        stack = [self]
+        while stack:
+            cmd = stack.pop()
+            cmd._fingerprint = None
+            if cmd._parents:
+                stack.extend(x for x in cmd._parents if x._fingerprint is not None)
+
+    def fingerprint(self) -> str:
+        """Stable structural hash of this command tree, as a hex string.
+
+        Trees with the same fingerprint generate the same completion, so it could be used
+        to skip regeneration of unchanged trees, also across processes. Fingerprints of the
+        command and all sub-commands are cached until `invalidate` is called, or the
+        lengths of their lists change. See `zcompy.fingerprint.node_digest`.
+        """
+        stack = [(self, False)]
+        while stack:
+            cmd, visited = stack.pop()
+            if not visited:
+                if cmd._cached_fingerprint() is None:
+                    if cmd._fingerprint is not None:  # lists resized in place
+                        cmd._drop_fingerprints()
+                    stack.append((cmd, True))
+                    stack.extend((x, False) for x in cmd.sub_commands)
+                continue
+            children = []
+            for x in cmd.sub_commands:
+                children.append(x._fingerprint[1])
+                if x._parents is None:
+                    x._parents = [cmd]
+                elif all(p is not cmd for p in x._parents):
+                    x._parents.append(cmd)
+            cmd._fingerprint = (cmd._list_stamp(), node_digest(cmd, children))
+        return self._fingerprint[1]
+
+    def to_dict(self) -> dict:
+        """Plain data of this command tree, JSON serializable, see `zcompy.serialize`."""
+        from .serialize import command_to_dict
+        return command_to_dict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Command:
+        """Command tree from the data of `to_dict`."""
+        from .serialize import command_from_dict
+        return command_from_dict(data)
+
+    def command_depths(self) -> dict[int, int]:
+        """Depth of this command and all sub-commands, keyed by `id` of the command.
+
+        Depths are computed in one post-order pass, so it is linear in the tree size.
+        """
+        depths = {}
+        stack = [(self, False)]
+        while stack:
+            cmd, visited = stack.pop()
+            if visited:
+                depths[id(cmd)] = 1 + max(depths[id(x)] for x in cmd.sub_commands)
+            elif cmd.sub_commands:
+                stack.append((cmd, True))
+                stack.extend((x, False) for x in cmd.sub_commands)
+            else:
+                depths[id(cmd)] = 0
+        return depths
 
     def command_depth(self) -> int:
         """Calculate the depth of the command based on sub-commands."""
-        if not self.sub_commands:
-            return 0
-        return 1 + max(sub_cmd.command_depth() for sub_cmd in self.sub_commands)
+        return self.command_depths()[id(self)]
 
     def should_complete(self) -> bool:
         """Determine if this command should have completion.
 
         If a command has options or sub-commands, it should have completion.
         """
-        has_subcmd = self.command_depth() > 0
         has_options = self.options or self.repeat_pos_args or self.positional_args
-        return has_options or has_subcmd
+        return bool(has_options or self.sub_commands)
 
     def subcommand_completion(self, func_name: str | None = None) -> str:
         """Generate completion code for sub-commands."""
@@ -123,24 +339,56 @@ _{func_name}_subcommands() {{
         Generate shell source used by option.
         For example, options might use python/git command to generate completion.
         """
-        shell_source = [
-            x.complete_func.zsh_func_source()
-            for x in self.options if isinstance(x.complete_func, ExtendAction)
-        ]
-        shell_source.extend([
-            x.zsh_func_source() for x in [*self.positional_args, self.repeat_pos_args]
-            if isinstance(x, ExtendAction)
-        ])
+        actions = []
+
+        def collect(cmd: Command):
+            actions.extend(
+                x.complete_func for x in cmd.options if isinstance(x.complete_func, ExtendAction)
+            )
+            actions.extend(
+                x for x in [*cmd.positional_args, cmd.repeat_pos_args]
+                if isinstance(x, ExtendAction)
+            )
 
         if recursive:
-            for subcmd in self.sub_commands:
-                sub_cmd_source = subcmd.shell_source_used_by_options(recursive=True)
-                shell_source.extend(sub_cmd_source)
+            self.apply_on_command(collect)
+        else:
+            collect(self)
+
+        actions = list({id(x): x for x in actions}.values())  # actions could be shared
+        shell_source = {x.zsh_func_source() for x in actions}
+        for x in actions:
+            shell_source.update(x.zsh_helper_sources())
 
         # deduplicate, since set is unordered, we sort it to have a consistent order
-        deduped_source = sorted(x for x in (set(shell_source)) if x)
+        deduped_source = sorted(x for x in shell_source if x)
         return deduped_source
 
+    def python_files(self) -> dict[str, str]:
+        """Executable scripts of the Python completions not embedded in the script.
+
+        Keyed by their absolute paths, see `Completion.write_python`.
+        """
+        completions = (x for x in self.python_completions() if not x.shell_embed)
+        return {x.python_file(): x.python_file_source() for x in completions}
+
+    def generated_files(self) -> dict[str, str]:
+        """Files read on completion besides the script, keyed by their absolute paths.
+
+        Like the registered functions of the daemon, see `ExtendAction.generated_files`.
+        """
+        files = {}
+
+        def collect(cmd: Command):
+            actions = [x.complete_func for x in cmd.options]
+            actions += [*cmd.positional_args, cmd.repeat_pos_args]
+            for x in actions:
+                if isinstance(x, ExtendAction):
+                    files.update(x.generated_files())
+
+        self.apply_on_command(collect)
+        return files
+
     def arguments_with_options(self, indent_length=0, context_flag: bool = False) -> str:
         """Generate the argument source with options for command."""
         assert len(self.sub_commands) == 0, "Only used when there are no sub-commands."
@@ -173,15 +421,32 @@ _{func_name}_subcommands() {{
         source_lines = ["_arguments -C"] + [indent + x for x in source_lines]
         return f" {zsh_line}".join([indent * indent_length + x for x in source_lines])
 
-    def generate_main_function(self, func_name: str | None = None) -> str:
-        assert len(self.sub_commands) > 0, "Main function generation requires sub-commands."
-        if func_name is None:
-            func_name = self.name
+    def _main_function(
+        self, func_name: str, depths: dict[int, int], calls: dict[int, str] | None = None
+    ) -> str:
+        """zsh function that dispatches the sub-commands of this command.
 
-        subcmd_comp_code = self.subcommand_completion(func_name=func_name)
+        Args:
+            calls: Functions completing sub-commands, keyed by `id` of the sub-command.
+                Used for deduplicated sub-commands, see `iter_main_functions`.
+        """
         arg_subcommand = self.arguments_with_subcommands(indent_length=1)
         indent = "  "
-        main_function = f"""
+        case_statements = []
+        for subcmd in self.sub_commands:
+            case_statements.append(f"{indent * 4}{subcmd.name})\n")
+            if calls and id(subcmd) in calls:
+                case_statements.append(f"{indent * 5}{calls[id(subcmd)]}")
+            elif subcmd.should_complete():
+                if depths[id(subcmd)] == 0:
+                    argument_src = subcmd.arguments_with_options(indent_length=5, context_flag=False)  # noqa
+                    case_statements.append(argument_src)
+                else:
+                    case_statements.append(f"{indent * 5}_{func_name}_{subcmd.name}")
+            case_statements.append(f"\n{indent * 5};;\n")
+        case_section = "".join(case_statements)
+
+        return f"""
 _{func_name}() {{
   local state
 
@@ -191,23 +456,7 @@ _{func_name}() {{
     cmds)
       _{func_name}_subcommands
       ;;
-"""
-        case_statements = []
-        for subcmd in self.sub_commands:
-            case_statements.append(f"{indent * 4}{subcmd.name})\n")
-            subcmd_depth = subcmd.command_depth()
-            if subcmd.should_complete():
-                if subcmd_depth == 0:
-                    argument_src = subcmd.arguments_with_options(indent_length=5, context_flag=False)  # noqa
-                    case_statements.append(argument_src)
-                else:
-                    subcmd_func_name = f"{func_name}_{subcmd.name}"
-                    main_function = subcmd.generate_main_function(subcmd_func_name) + "\n" + main_function  # noqa
-                    case_statements.append(f"{indent * 5}_{subcmd_func_name}")
-            case_statements.append(f"\n{indent * 5};;\n")
-        case_section = "".join(case_statements)
 
-        main_function += f"""
     args)
       case $words[1] in
 {case_section}
@@ -216,7 +465,143 @@ _{func_name}() {{
   esac
 }}
 """
-        return subcmd_comp_code + "\n" + main_function
+
+    def structure_ids(self) -> dict[int, int]:
+        """Id of the completion structure of this command and all sub-commands.
+
+        Commands have the same structure id if their generated functions only differ in
+        function names, i.e. they have the same options and their sub-commands have the
+        same names, descriptions and structure ids. Computed in one post-order pass.
+
+        Returns:
+            Structure ids keyed by `id` of the command.
+        """
+        keys, ids = {}, {}
+        stack = [(self, False)]
+        while stack:
+            cmd, visited = stack.pop()
+            if cmd.sub_commands and not visited:
+                stack.append((cmd, True))
+                stack.extend((x, False) for x in cmd.sub_commands)
+                continue
+            if cmd.sub_commands:
+                key = (
+                    tuple(opt.to_complete_argument() for opt in cmd.options),
+                    tuple((x.name, x.description, ids[id(x)]) for x in cmd.sub_commands),
+                )
+            else:
+                key = cmd.arguments_with_options()
+            ids[id(cmd)] = keys.setdefault(key, len(keys))
+        return ids
+
+    def _shared_leaf_functions(
+        self, func_name: str, depths: dict[int, int], structure: dict[int, int]
+    ) -> tuple[dict[int, str], list[tuple[str, str]]]:
+        """Functions of the option blocks used by several sub-commands without sub-commands.
+
+        Returns:
+            Function calls keyed by `id` of the sub-command, and (name, source) of functions.
+        """
+        leaves = []
+        self.apply_on_command(lambda cmd: leaves.extend(
+            x for x in cmd.sub_commands if depths[id(x)] == 0 and x.should_complete()
+        ))
+        counts = Counter(structure[id(x)] for x in leaves)
+
+        calls, names, functions = {}, {}, []
+        for leaf in leaves:
+            structure_id = structure[id(leaf)]
+            if counts[structure_id] < 2:
+                continue
+            if structure_id not in names:  # numbered in order of first use
+                name = names[structure_id] = f"_{func_name}__args_{len(names)}"
+                content = leaf.arguments_with_options(indent_length=1)
+                functions.append((name, f"\n{name}() {{\n{content}\n}}\n"))
+            calls[id(leaf)] = names[structure_id]
+        return calls, functions
+
+    def iter_main_functions(
+        self, func_name: str | None = None, dedup: bool = False
+    ) -> Iterator[tuple[str, str]]:
+        """Generate zsh functions of the completion for a command with sub-commands.
+
+        Functions of a command are its `_subcommands` function, the functions of its nested
+        sub-commands in reversed order, then its main function. The tree is walked once
+        with an explicit stack, so deep trees don't hit the recursion limit.
+
+        Args:
+            func_name: Name of the main function without the leading `_`.
+            dedup: If True, option blocks shared by several sub-commands are emitted once
+                as functions after the first `_subcommands` function, and sub-trees with
+                the same structure (see `structure_ids`) call the functions of the first one.
+
+        Yields:
+            (function name, function source), `_<func_name>` is the last one.
+        """
+        assert len(self.sub_commands) > 0, "Main function generation requires sub-commands."
+        if func_name is None:
+            func_name = self.name
+        depths = self.command_depths()
+        calls, shared_functions, owners = {}, [], {}
+        if dedup:
+            structure = self.structure_ids()
+            calls, shared_functions = self._shared_leaf_functions(func_name, depths, structure)
+
+        stack = [(self, func_name, False)]
+        while stack:
+            cmd, name, visited = stack.pop()
+            if visited:
+                yield f"_{name}", cmd._main_function(name, depths, calls)
+                continue
+            subcmd_comp_code = cmd.subcommand_completion(func_name=name)
+            yield f"_{name}_subcommands", subcmd_comp_code
+            if shared_functions:
+                yield from shared_functions
+                shared_functions = []
+            stack.append((cmd, name, True))
+            for x in cmd.sub_commands:
+                if depths[id(x)] == 0:
+                    continue
+                sub_name = f"{name}_{x.name}"
+                if dedup:
+                    structure_id = structure[id(x)]
+                    if structure_id in owners:  # same as a sub-tree already generated
+                        calls[id(x)] = f"_{owners[structure_id]}"
+                        continue
+                    owners[structure_id] = sub_name
+                stack.append((x, sub_name, False))
+
+    def main_functions(
+        self, func_name: str | None = None, dedup: bool = False
+    ) -> list[tuple[str, str]]:
+        """List of (function name, function source), see `iter_main_functions`."""
+        return list(self.iter_main_functions(func_name, dedup=dedup))
+
+    def generate_main_function(self, func_name: str | None = None, dedup: bool = False) -> str:
+        return "\n".join(source for _, source in self.main_functions(func_name, dedup=dedup))
+
+    def autoload_functions(self, dedup: bool = False) -> dict[str, str]:
+        """Functions of nested sub-commands as the content of autoloadable fpath files.
+
+        The file of a function holds only its body, zsh loads it on the first call.
+        """
+        if not self.sub_commands:
+            return {}
+        functions = self.main_functions(dedup=dedup)[1:-1]
+        autoload = {}
+        for name, source in functions:
+            body = source.strip().splitlines()[1:-1]
+            autoload[name] = "\n".join(["#autoload", "", *body]) + "\n"
+        return autoload
+
+    def generate_split_function(self, dedup: bool = False) -> str:
+        """Main functions of the nested backend, sub-command functions are autoloaded."""
+        functions = self.main_functions(dedup=dedup)
+        autoload_names = " ".join(name for name, _ in functions[1:-1])
+        sources = [functions[0][1], functions[-1][1]]
+        if autoload_names:
+            sources.insert(0, f"autoload -Uz {autoload_names}\n")
+        return "\n".join(sources)
 
     def generate_non_subcommand_completion(self) -> str:
         shell_source = self.shell_source_used_by_options()
@@ -224,58 +609,245 @@ _{func_name}() {{
         source_to_write = f"_{self.name}() {{\n{content}\n}}"
         return "\n\n".join(shell_source + [source_to_write])
 
-    def generate_completion_function(self) -> str:
-        """Generate the main completion function for current command."""
+    def iter_completion_function(
+        self, backend: str = "nested", split: bool = False, dedup: bool = False
+    ) -> Iterator[str]:
+        """Generate the main completion function for current command in chunks.
+
+        Args:
+            backend: "nested" generates one zsh function for each level of sub-commands,
+                "table" generates data tables and a generic dispatcher, which is smaller
+                and faster to load for very large command trees.
+            split: If True, functions of nested sub-commands are autoloaded instead of
+                defined inline, see `autoload_functions`. Only used by "nested" backend.
+            dedup: If True, identical option blocks and sub-trees are emitted once, see
+                `iter_main_functions`. Only used by "nested" backend.
+        """
+        assert backend in ("nested", "table"), f"Unknown backend: {backend}"
+        if backend == "table":
+            yield "\n".join(self.shell_source_used_by_options(recursive=True)) + "\n"
+            yield from iter_table_completion_function(self)
+            return
+
         depth = self.command_depth()
         if depth == 0:  # no sub-commands, simplest case
-            return self.generate_non_subcommand_completion()
+            yield self.generate_non_subcommand_completion()
+            return
+
+        yield "\n".join(self.shell_source_used_by_options(recursive=True)) + "\n"
+        if split:
+            yield self.generate_split_function(dedup=dedup)
         else:
-            shell_source = self.shell_source_used_by_options(recursive=True)
-            shell_source = "\n".join(shell_source)
-            main_function = self.generate_main_function()
-            return f"{shell_source}\n{main_function}"
-
-    def complete_source(self, as_file: bool = False, sort_completion: bool = True) -> str:
-        """Generate the completion source code for current command."""
-        completion_code = self.generate_completion_function()
+            for idx, (_, source) in enumerate(self.iter_main_functions(dedup=dedup)):
+                yield f"\n{source}" if idx else source
+
+    def generate_completion_function(
+        self, backend: str = "nested", split: bool = False, dedup: bool = False
+    ) -> str:
+        """Generate the main completion function for current command.
+
+        See `iter_completion_function` for the arguments.
+        """
+        return "".join(
+            self.iter_completion_function(backend=backend, split=split, dedup=dedup)
+        )
+
+    def iter_source(
+        self,
+        as_file: bool = False,
+        sort_completion: bool = True,
+        backend: str = "nested",
+        split: bool = False,
+        dedup: bool = False,
+    ) -> Iterator[str]:
+        """Generate the completion source code for current command in chunks.
+
+        Large command trees are rendered one function at a time, instead of holding the
+        whole script in memory.
+        """
         if as_file:
             sort_flag = "true" if sort_completion else "false"
             compdef_code = f"compdef _{self.name} {self.name}"
             sort_code = f"zstyle ':completion:*:{self.name}:*' sort {sort_flag}"
-            completion_code = f"#compdef {self.name}\n{compdef_code}\n{sort_code}\n\n{completion_code}\n\n_{self.name}"  # noqa
+            yield f"#compdef {self.name}\n{compdef_code}\n{sort_code}\n\n"
 
-        return completion_code
+        yield from self.iter_completion_function(backend=backend, split=split, dedup=dedup)
+        if as_file:
+            yield f"\n\n_{self.name}"
+
+    def complete_source(
+        self,
+        as_file: bool = False,
+        sort_completion: bool = True,
+        backend: str = "nested",
+        split: bool = False,
+        dedup: bool = False,
+    ) -> str:
+        """Generate the completion source code for current command.
+
+        The source is cached with the fingerprint of the tree, and reused while the
+        fingerprint is unchanged. Python files of completions are written either way.
+        """
+        options = (as_file, sort_completion, backend, split, dedup)
+        fingerprint = self.fingerprint()
+        cache = self._source_cache
+        if cache is not None and cache[:2] == (options, fingerprint):
+            for completion in cache[3]:  # writes the python file like on a render
+                completion.action_source()
+            return cache[2]
+
+        source = "".join(self.iter_source(
+            as_file=as_file, sort_completion=sort_completion, backend=backend, split=split,
+            dedup=dedup,
+        ))
+        completions = [x for x in self.python_completions() if not x.shell_embed]
+        self._source_cache = (options, fingerprint, source, completions)
+        return source
+
+    def write_source(
+        self,
+        file_obj: IO[str] | str,
+        sort_completion: bool = True,
+        backend: str = "nested",
+        split: bool = False,
+        dedup: bool = False,
+    ) -> bool:
+        """Stream the completion file of current command.
+
+        Args:
+            file_obj: A writable text file object, or the path of the file. A path is written
+                to a temporary file and atomically renamed, and only if the content changed.
+            sort_completion, backend, split, dedup: See `completion_entry`.
+
+        Returns:
+            True if the file is written.
+        """
+        chunks = self.iter_source(
+            as_file=True, sort_completion=sort_completion, backend=backend, split=split,
+            dedup=dedup,
+        )
+        if isinstance(file_obj, str):
+            return write_chunks(file_obj, chunks)
+        for chunk in chunks:
+            file_obj.write(chunk)
+        return True
 
     def completion_entry(
         self,
         output_dir: str = "~/.zsh/Completion",
         sort_completion: bool = True,
-    ):
-        """Generate completion script for a Command with sub-commands."""
-        output_dir = os.path.expanduser(output_dir)
-
-        completion_code = self.complete_source(as_file=True, sort_completion=sort_completion)
+        helper_module: bool = False,
+        backend: str = "nested",
+        split: bool = False,
+        compile_zwc: bool = False,
+        dedup: bool = False,
+    ) -> InstallReport:
+        """Generate completion script for a Command with sub-commands.
+
+        Files are written atomically and only if their content changed. A manifest in
+        every written directory tracks the files of the command, files that are no longer
+        generated, like the autoload file of a removed sub-command, are deleted.
 
-        # write to file
+        Args:
+            output_dir: Directory to write the completion file.
+            sort_completion: Whether zsh sorts the completion candidates.
+            helper_module: If True, Python completions are called from one precompiled module
+                written to output_dir instead of embedding their source.
+            backend: "nested" or "table", see `iter_completion_function`.
+            split: If True, the function of every nested sub-command is written to its own
+                `#autoload` file in output_dir, which should be in fpath. zsh then only
+                parses the sub-commands that are actually completed.
+            compile_zwc: If True, also compile the written files to `.zwc` wordcode, which
+                zsh loads faster than the source. Skipped if zsh is not available.
+            dedup: If True, option blocks and sub-trees shared by several sub-commands are
+                emitted once and called from every sub-command using them.
+
+        Returns:
+            Report of the files written, skipped and removed.
+        """
+        output_dir = os.path.expanduser(output_dir)
+        installer = Installer(output_dir, owner=self.name)
+        installers = {output_dir: installer}
+        if helper_module:
+            helper = self.use_helper_module(output_dir, write=False)
+            written = installer.write(os.path.basename(helper.file_name), helper.module_source())
+            if written or not os.path.exists(helper.bytecode_file):
+                helper.compile()
+
+        # write function files first, so that generating the source doesn't rewrite them
+        for file_name, content in self.python_files().items():
+            func_dir, name = os.path.split(file_name)
+            if func_dir not in installers:
+                installers[func_dir] = Installer(func_dir, owner=self.name)
+            installers[func_dir].write(name, content, executable=True)
+
+        for file_name, content in self.generated_files().items():
+            func_dir, name = os.path.split(file_name)
+            if func_dir not in installers:
+                installers[func_dir] = Installer(func_dir, owner=self.name)
+            installers[func_dir].write(name, content)
+
+        split = split and backend == "nested"
+        zsh_files = []
+        if split:
+            for name, content in self.autoload_functions(dedup=dedup).items():
+                installer.write(name, content)
+                zsh_files.append(os.path.join(output_dir, name))
+
+        # unchanged files are kept to avoid invalidating caches and recompiling them
         comp_file = os.path.join(output_dir, f"_{self.name}")
-        with open(comp_file, "w") as f:
-            f.write(completion_code)
-
-        print(f"Completion file created at: {comp_file}")
+        installer.write(f"_{self.name}", self.iter_source(
+            as_file=True, sort_completion=sort_completion, backend=backend, split=split,
+            dedup=dedup,
+        ))
+        zsh_files.append(comp_file)
+
+        report = InstallReport()
+        for x in installers.values():
+            report.update(x.finish())
+
+        print(f"Completion file created at: {comp_file} ({report.summary()})")
+        if compile_zwc:
+            if not shutil.which("zsh"):
+                print("zsh not found, skip compiling completion files.")
+            else:
+                try:
+                    compiled = zsh_compile(zsh_files)
+                except subprocess.CalledProcessError as e:
+                    print(f"Failed to compile completion files: {e}", file=sys.stderr)
+                else:
+                    if compiled:
+                        print(f"Compiled wordcode at: {', '.join(compiled)}")
+                    else:
+                        print("Wordcode is up to date.")
         print(f"Please add `compdef _{self.name} {self.name}` to your zsh config.")
+        return report
 
     def __eq__(self, other) -> bool:
+        """Commands are equal if all attributes are equal, sub-commands in any order.
+
+        Commands with equal cached fingerprints are equal without comparing their trees.
+        """
         def sort_cmd(cmds: list[Command]) -> list[Command]:
             return sorted(cmds, key=lambda cmd: cmd.name)
 
         if not isinstance(other, Command):
             return False
-        for attr in vars(self):
-            self_val = getattr(self, attr)
-            other_val = getattr(other, attr)
-            if attr == "sub_commands":
-                if sort_cmd(self_val) != sort_cmd(other_val):
+        stack = [(self, other)]  # not recursive, trees can be deeper than the recursion limit
+        while stack:
+            left, right = stack.pop()
+            fingerprint = left._cached_fingerprint()
+            if left is right or fingerprint and fingerprint == right._cached_fingerprint():
+                continue
+            for attr in (x.name for x in fields(left)):
+                if attr.startswith("_"):  # private caches
+                    continue
+                left_val = getattr(left, attr)
+                right_val = getattr(right, attr)
+                if attr == "sub_commands":
+                    if len(left_val) != len(right_val):
+                        return False
+                    stack.extend(zip(sort_cmd(left_val), sort_cmd(right_val)))
+                elif left_val != right_val:
                     return False
-            elif self_val != other_val:
-                return False
         return True
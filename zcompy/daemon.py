@@ -0,0 +1,287 @@
+"""Long-lived completion server that keeps registered Python completers in memory.
+
+Generated zsh functions connect to the daemon through ``zsh/net/socket`` and
+fall back to running the completion function with ``python3`` when the daemon
+is not available or doesn't answer in time. Every request runs in a forked child
+with the working directory and exported environment of the shell, so a hung
+completer doesn't block other requests. Start the daemon with
+``python3 -m zcompy.daemon``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import inspect
+import io
+import os
+import signal
+import socket
+import socketserver
+import textwrap
+from typing import Callable
+
+from .utils import func_key, write_completion_items, write_if_changed
+
+__all__ = [
+    "CompletionDaemon",
+    "daemon_client_source",
+    "default_daemon_dir",
+    "register_function",
+    "registered_file",
+    "registered_source",
+]
+
+_DEFAULT_DAEMON_DIR = "~/.cache/zcompy/daemon"
+_SOCKET_NAME = "daemon.sock"
+_FUNCTIONS_DIR = "functions"
+# last line of a response, so that the client can tell a complete response from a timeout
+_END_MARK = "\x1e"
+# attribute holding the output protocol of registered functions that return their items
+_BULK_ATTR = "_zcompy_bulk"
+
+
+def default_daemon_dir() -> str:
+    """Directory holding the daemon socket and registered functions."""
+    return os.path.expanduser(os.environ.get("ZCOMPY_DAEMON_DIR", _DEFAULT_DAEMON_DIR))
+
+
+def registered_source(func: Callable, bulk: bool = False, protocol: str = "describe") -> str:
+    """Source of the file registering func, see `register_function`."""
+    source = textwrap.dedent(inspect.getsource(func))
+    if bulk:
+        source += f"\n\n{func.__name__}.{_BULK_ATTR} = {protocol!r}\n"
+    return source
+
+
+def registered_file(func: Callable, daemon_dir: str | None = None) -> str:
+    """Path of the registered source of func.
+
+    The file is named by `zcompy.utils.func_key`, so that functions of the same name in
+    different CLIs don't overwrite each other.
+    """
+    daemon_dir = daemon_dir or default_daemon_dir()
+    return os.path.join(daemon_dir, _FUNCTIONS_DIR, f"{func_key(func)}.py")
+
+
+def register_function(
+    func: Callable, daemon_dir: str | None = None, bulk: bool = False, protocol: str = "describe"
+) -> str:
+    """Save the source of a completion function so that the daemon can load it.
+
+    If bulk is True, the function returns its items instead of printing them, which are
+    written in the format of protocol, see `zcompy.utils.write_completion_items`.
+
+    Returns:
+        The path of the registered source file.
+    """
+    file_name = registered_file(func, daemon_dir)
+    os.makedirs(os.path.dirname(file_name), mode=0o700, exist_ok=True)
+    write_if_changed(file_name, registered_source(func, bulk, protocol))
+    return file_name
+
+
+def daemon_client_source() -> str:
+    """zsh function that runs a registered completion function through the daemon.
+
+    ``__zcompy_daemon <func> [args...]`` prints the output of the function and
+    returns 0, or returns 1 without output if the daemon can't serve the request. The
+    request carries `$PWD` and the exported parameters of the shell. If a line of the
+    response doesn't arrive within `$ZCOMPY_DAEMON_TIMEOUT` seconds (default 2), the
+    request is given up.
+
+    A request is the number of fields on the first line, then the fields ended by NUL:
+    the working directory, the number of environment entries, the entries, the function
+    and its arguments.
+    """
+    sock_path = f"${{ZCOMPY_DAEMON_DIR:-$HOME/{_DEFAULT_DAEMON_DIR[2:]}}}/{_SOCKET_NAME}"
+    return f"""
+__zcompy_daemon() {{
+  local fd line name timeout=${{ZCOMPY_DAEMON_TIMEOUT:-2}} complete=0
+  local -a env request lines
+  zmodload zsh/net/socket 2>/dev/null || return 1
+  zsocket "{sock_path}" 2>/dev/null || return 1
+  fd=$REPLY
+  for name in ${{(k)parameters[(R)*export*]}}; do
+    env+=("$name=${{(P)name}}")
+  done
+  request=("$PWD" $#env "${{env[@]}}" "$@")
+  print -rn -u $fd -- $#request$'\\n'"${{(pj:\\0:)request}}"$'\\0'
+  if ! IFS= read -r -t $timeout -u $fd line || [[ $line != OK ]]; then
+    exec {{fd}}>&-
+    return 1
+  fi
+  while IFS= read -r -t $timeout -u $fd line; do
+    if [[ $line == $'\\x1e' ]]; then
+      complete=1
+      break
+    fi
+    lines+=("$line")
+  done
+  exec {{fd}}>&-
+  (( complete )) || return 1
+  (( $#lines )) && print -rl -- "${{lines[@]}}"
+  return 0
+}}
+"""
+
+
+def _read_request(rfile) -> list[str]:
+    """Fields of a request, see `daemon_client_source`."""
+    header = rfile.readline().strip()
+    if not header.isdigit():
+        return []
+    num_fields = int(header)
+    data = b""
+    while data.count(b"\0") < num_fields:
+        chunk = rfile.read1(65536)
+        if not chunk:
+            return []
+        data += chunk
+    return [x.decode() for x in data.split(b"\0")[:num_fields]]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Run in a forked child, so changing the directory and environment is safe."""
+
+    def handle(self):
+        daemon = self.server.completion_daemon
+        signal.alarm(daemon.timeout)  # a hung completer is killed
+        request = _read_request(self.rfile)
+        if len(request) < 3:
+            return
+        cwd, num_env, *request = request
+        env, (func_key, *args) = request[:int(num_env)], request[int(num_env):]
+        try:
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(x.split("=", 1) for x in env)
+            output = daemon.run(func_key, args)
+        except Exception as e:  # never let a broken completer kill the daemon
+            self.wfile.write(f"ERR {type(e).__name__}\n".encode())
+            return
+        if output and not output.endswith("\n"):
+            output += "\n"
+        self.wfile.write(f"OK\n{output}{_END_MARK}\n".encode())
+
+
+class _ForkingServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+
+    def service_actions(self):
+        super().service_actions()
+        # loaded in the server, so the forked children don't compile functions again
+        self.completion_daemon.preload()
+
+
+class CompletionDaemon:
+    """Serve registered completion functions on a per-user Unix socket.
+
+    Args:
+        daemon_dir: Directory of the socket and registered functions.
+        timeout: Seconds a request may run before it is killed.
+    """
+
+    def __init__(self, daemon_dir: str | None = None, timeout: int = 30):
+        self.daemon_dir = daemon_dir or default_daemon_dir()
+        self.timeout = timeout
+        self.func_dir = os.path.join(self.daemon_dir, _FUNCTIONS_DIR)
+        self.socket_path = os.path.join(self.daemon_dir, _SOCKET_NAME)
+        # function key -> (mtime of source file, loaded function)
+        self._functions: dict[str, tuple[int, Callable]] = {}
+
+    def load(self, func_key: str) -> Callable:
+        """Load a registered function by its `zcompy.utils.func_key`.
+
+        The compiled function is reused if its source is unchanged.
+        """
+        file_name = os.path.join(self.func_dir, f"{func_key}.py")
+        if os.path.dirname(os.path.abspath(file_name)) != os.path.abspath(self.func_dir):
+            raise ValueError(f"Invalid function: {func_key}")
+        mtime = os.stat(file_name).st_mtime_ns
+        cached = self._functions.get(func_key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(file_name, "r") as f:
+            code = compile(f.read(), file_name, "exec")
+        namespace = {"__name__": f"zcompy_daemon_{func_key}"}
+        exec(code, namespace)
+        func = namespace[func_key.rsplit(".", 1)[-1]]
+        self._functions[func_key] = (mtime, func)
+        return func
+
+    def preload(self):
+        """Load all registered functions."""
+        if not os.path.isdir(self.func_dir):
+            return
+        for file_name in sorted(os.listdir(self.func_dir)):
+            if file_name.endswith(".py"):
+                with contextlib.suppress(Exception):
+                    self.load(file_name[:-len(".py")])
+
+    def run(self, func_key: str, args: list[str]) -> str:
+        """Call a registered function with args and return what it prints."""
+        func = self.load(func_key)
+        num_args = func.__code__.co_argcount
+        buffer = io.StringIO()
+        with contextlib.redirect_stdout(buffer):
+            if num_args == 0:
+                result = func()
+            elif len(args) >= num_args:
+                result = func(*args[:num_args])
+            else:
+                return ""
+            protocol = getattr(func, _BULK_ATTR, None)
+            if protocol:
+                write_completion_items(result, protocol)
+        return buffer.getvalue()
+
+    def make_server(self) -> socketserver.UnixStreamServer:
+        """Bind the daemon socket, replacing a stale one left by a dead daemon.
+
+        Raises:
+            RuntimeError: If another daemon is serving on the socket.
+        """
+        os.makedirs(self.daemon_dir, mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.socket_path)
+                except ConnectionRefusedError:  # nobody is listening, the socket is stale
+                    os.unlink(self.socket_path)
+                else:
+                    probe.shutdown(socket.SHUT_RDWR)  # end the request, even if fds are shared
+                    raise RuntimeError(f"A daemon is already serving on {self.socket_path}")
+        self.preload()
+
+        server = _ForkingServer(self.socket_path, _RequestHandler)
+        server.completion_daemon = self
+        os.chmod(self.socket_path, 0o600)
+        return server
+
+    def serve_forever(self):
+        with self.make_server() as server:
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(self.socket_path)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="zcompy.daemon", description="zcompy completion daemon")
+    parser.add_argument(
+        "--dir", default=None,
+        help="Directory of socket and registered functions, default to $ZCOMPY_DAEMON_DIR.",
+    )
+    parser.add_argument(
+        "--timeout", type=int, default=30, help="Seconds a request may run before it is killed.",
+    )
+    args = parser.parse_args(argv)
+    try:
+        CompletionDaemon(args.dir, timeout=args.timeout).serve_forever()
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
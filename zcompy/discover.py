@@ -0,0 +1,221 @@
+"""Discover the console scripts of the current environment and generate their completions.
+
+The framework of a script is detected by running its entry point with ``--help`` while
+argparse, click, fire and absl are patched to capture the parser, command, component or
+flags instead of running the CLI. Every script runs in a worker process, see `batch`.
+Results are cached per (distribution, version), unchanged packages are skipped.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import sys
+from dataclasses import dataclass
+from importlib.metadata import distributions
+from typing import Any
+
+from .batch import Target, TargetResult, generate_all, import_object
+from .command import Command
+from .installer import Installer
+from .utils import write_if_changed
+
+__all__ = ["ConsoleScript", "capture_command", "console_scripts", "discover"]
+
+CACHE_NAME = ".zcompy-discover.json"
+
+
+@dataclass
+class ConsoleScript:
+    name: str
+    value: str
+    # entry point like `package.cli:main`
+    dist_name: str
+    dist_version: str
+
+    @property
+    def dist_key(self) -> str:
+        return f"{self.dist_name}=={self.dist_version}"
+
+
+def _included(dist_name: str, include: list[str] | None) -> bool:
+    return not include or any(fnmatch.fnmatch(dist_name, x) for x in include)
+
+
+def console_scripts(include: list[str] | None = None) -> list[ConsoleScript]:
+    """Console scripts of the installed distributions, sorted by name.
+
+    Args:
+        include: Glob patterns of distribution names to keep, default to all.
+    """
+    scripts = {}
+    for dist in distributions():
+        dist_name = dist.metadata["Name"]
+        if dist_name is None or not _included(dist_name, include):
+            continue
+        for entry_point in dist.entry_points:
+            if entry_point.group == "console_scripts":
+                value = entry_point.value.split("[")[0].strip()
+                scripts[entry_point.name] = ConsoleScript(
+                    entry_point.name, value, dist_name, dist.version
+                )
+    return [scripts[x] for x in sorted(scripts)]
+
+
+class _Captured(Exception):
+    """Raised by patched framework entries, carrying what the CLI is built from."""
+
+    def __init__(self, framework: str, obj: Any):
+        super().__init__(framework)
+        self.framework = framework
+        self.obj = obj
+
+
+@contextlib.contextmanager
+def _patch(obj, attr: str, replacement):
+    original = getattr(obj, attr)
+    setattr(obj, attr, replacement)
+    try:
+        yield
+    finally:
+        setattr(obj, attr, original)
+
+
+def _capture_patches(stack: contextlib.ExitStack):
+    """Patch the entries of the supported frameworks that are installed."""
+    import argparse
+
+    def capture_parser(self, *args, **kwargs):
+        raise _Captured("argparse", self)
+
+    stack.enter_context(_patch(argparse.ArgumentParser, "parse_known_args", capture_parser))
+    stack.enter_context(_patch(argparse.ArgumentParser, "parse_args", capture_parser))
+
+    with contextlib.suppress(ImportError):
+        import click.core
+
+        def capture_click(self, *args, **kwargs):
+            raise _Captured("click", self)
+
+        stack.enter_context(_patch(click.core.Command, "main", capture_click))
+
+    with contextlib.suppress(ImportError):
+        import fire
+        import fire.core
+
+        def capture_fire(component=None, *args, **kwargs):
+            raise _Captured("fire", component)
+
+        stack.enter_context(_patch(fire, "Fire", capture_fire))
+        stack.enter_context(_patch(fire.core, "Fire", capture_fire))
+
+    # absl.app defines flags on import, which could conflict with flags already defined
+    with contextlib.suppress(Exception):
+        from absl import app
+
+        def capture_absl(main, *args, **kwargs):
+            raise _Captured("absl", None)
+
+        stack.enter_context(_patch(app, "run", capture_absl))
+
+
+def capture_command(value: str, name: str) -> Command:
+    """Run the entry point `module:attr` with `--help` and convert the captured CLI.
+
+    Raises:
+        ValueError: If no supported framework is used by the entry point.
+    """
+    argv = sys.argv
+    sys.argv = [name, "--help"]
+    try:
+        with contextlib.ExitStack() as stack:
+            _capture_patches(stack)
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+            entry = import_object(value)
+            entry()
+    except _Captured as captured:
+        framework, obj = captured.framework, captured.obj
+    except SystemExit:
+        raise ValueError(f"{name} exited without using a supported CLI framework") from None
+    else:
+        raise ValueError(f"{name} returned without using a supported CLI framework")
+    finally:
+        sys.argv = argv
+
+    if framework == "argparse":
+        from .parser_command import ParserCommand
+        command = ParserCommand(obj).to_command()
+    elif framework == "click":
+        from .click_command import ClickCommand
+        command = ClickCommand(obj).to_command()
+    elif framework == "fire":
+        if obj is None:
+            raise ValueError(f"{name} calls fire.Fire without a component")
+        from .fire_command import FireCommand
+        command = FireCommand(name, obj=obj).to_command()
+    else:
+        from .absl_command import AbslFlagsCommand
+        command = AbslFlagsCommand(name).to_command()
+    command.name = name
+    return command
+
+
+def _load_cache(cache_file: str) -> dict[str, dict[str, str]]:
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def discover(
+    output_dir: str = "~/.zsh/Completion",
+    include: list[str] | None = None,
+    jobs: int | None = None,
+    timeout: float = 30,
+    compile_zwc: bool = False,
+) -> list[TargetResult]:
+    """Generate completions of the console scripts of distributions that changed.
+
+    A cache in output_dir records the scripts generated for every (distribution, version),
+    scripts generated before are skipped, failed ones are tried again. Completions of
+    scripts that are not installed anymore are removed.
+
+    Returns:
+        Results of the scripts generated in this run.
+    """
+    output_dir = os.path.expanduser(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    cache_file = os.path.join(output_dir, CACHE_NAME)
+    cache = _load_cache(cache_file)
+
+    scripts = console_scripts(include)
+    todo = [x for x in scripts if cache.get(x.dist_key, {}).get(x.name) != "ok"]
+    targets = [Target(x.value, type="entry_point", name=x.name) for x in todo]
+    results = generate_all(
+        targets, output_dir=output_dir, jobs=jobs, timeout=timeout, compile_zwc=compile_zwc
+    )
+
+    current_keys = {x.dist_key for x in scripts}
+    current_names = {x.name for x in scripts}
+    new_cache = {}
+    for key, entries in cache.items():
+        if key in current_keys or not _included(key.split("==")[0], include):
+            new_cache[key] = entries
+            continue
+        # remove completions of scripts that are gone, like uninstalled packages
+        for name, status in entries.items():
+            if status == "ok" and name not in current_names:
+                Installer(output_dir, owner=name).finish()
+
+    # failures are recorded too, but tried again on the next run
+    for script, result in zip(todo, results):
+        status = "ok" if result.error is None else result.error
+        new_cache.setdefault(script.dist_key, {})[script.name] = status
+
+    write_if_changed(cache_file, json.dumps(new_cache, indent=2, sort_keys=True) + "\n")
+    return results
@@ -0,0 +1,184 @@
+"""Dynamic completion, resolve only the sub-command being completed on every <TAB>.
+
+Instead of the whole command tree, a small zsh stub is installed. It passes the words
+before the cursor to ``python3 -m zcompy.dynamic``, which walks to the active sub-command
+and prints the completion code of that single command for the stub to eval. The size of
+the stub and the memory of the shell don't grow with the command tree, and argparse
+targets only convert the subparsers on the path being completed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import os
+import shlex
+import sys
+from typing import Callable
+
+from .batch import Target, import_object
+from .command import Command
+from .utils import write_if_changed
+
+__all__ = [
+    "completion_source",
+    "dynamic_stub",
+    "resolve_command",
+    "resolve_parser",
+    "resolve_target",
+]
+
+
+def resolve_command(
+    command: Command,
+    words: list[str],
+    load_sub_command: Callable[[Command, str], Command | None] | None = None,
+) -> tuple[Command, int]:
+    """Walk the words typed after the command name to the sub-command being completed.
+
+    Args:
+        command: Root command.
+        words: Words between the command name and the cursor.
+        load_sub_command: Function to get a sub-command of a command by name, default to
+            `Command.get_sub_command`. Used to build sub-commands on demand.
+
+    Returns:
+        The active command and its position in `$words` of zsh, 1 for the root command.
+    """
+    load_sub_command = load_sub_command or Command.get_sub_command
+    position, skip_next = 1, False
+    for idx, word in enumerate(words, 2):
+        if skip_next:
+            skip_next = False
+            continue
+        if word.startswith("-"):
+            # option values are not sub-commands, same as the `_arguments` specs
+            skip_next = "=" not in word and word in _options_with_argument(command)
+            continue
+        sub_command = load_sub_command(command, word)
+        if sub_command is not None:
+            command, position = sub_command, idx
+    return command, position
+
+
+def _options_with_argument(command: Command) -> set[str]:
+    names = set()
+    for option in command.options:
+        if option.complete_func or option.type:
+            names.update((option.names,) if isinstance(option.names, str) else option.names)
+    return names
+
+
+def resolve_parser(
+    parser: argparse.ArgumentParser, words: list[str], name: str | None = None
+) -> tuple[Command, int]:
+    """`resolve_command` for a parser, only subparsers on the path are converted."""
+    from .parser_command import ParserCommand
+
+    parser_command = ParserCommand(parser)
+    command = parser_command.to_command(recursive=False)
+    if name:
+        command.name = name
+    parsers = {id(command): parser}
+
+    def load_sub_command(cmd: Command, sub_name: str) -> Command | None:
+        subparsers = parser_command.get_subparsers(parsers[id(cmd)])
+        if sub_name not in subparsers:
+            return None
+        sub_parser, help_text = subparsers[sub_name]
+        sub_command = parser_command.create_subcommand(
+            sub_name, sub_parser, help_text, recursive=False
+        )
+        parsers[id(sub_command)] = sub_parser
+        return sub_command
+
+    return resolve_command(command, words, load_sub_command)
+
+
+def resolve_target(target: Target, words: list[str]) -> tuple[Command, int]:
+    """`resolve_command` for a batch target.
+
+    argparse targets are converted lazily, unless they are loaded from the cache.
+    """
+    if target.type != "argparse" or target.cache_dir:
+        return resolve_command(target.to_command(), words)
+    sys.path[:0] = target.python_path
+    parser = import_object(target.target)
+    parser = parser if hasattr(parser, "parse_args") else parser()
+    return resolve_parser(parser, words, name=target.name)
+
+
+def completion_source(command: Command, position: int = 1) -> str:
+    """zsh code completing the options and direct sub-commands of command.
+
+    Args:
+        command: The active command, see `resolve_command`.
+        position: Position of the command in `$words`, words before it are dropped.
+    """
+    sources = command.shell_source_used_by_options()
+    if position > 1:
+        sources.append(f'words=("${{(@)words[{position},-1]}}")\n(( CURRENT -= {position - 1} ))')
+
+    if not command.sub_commands:
+        sources.append(command.arguments_with_options())
+        return "\n".join(sources) + "\n"
+
+    sources.append(command.subcommand_completion(func_name="zcompy_dynamic").strip())
+    sources.append("local state")
+    sources.append(command.arguments_with_subcommands())
+    sources.append('[[ $state == cmds ]] && _zcompy_dynamic_subcommands')
+    return "\n".join(sources) + "\n"
+
+
+def dynamic_stub(target: Target, name: str, python: str = "python3") -> str:
+    """Content of the completion file of a target in dynamic mode."""
+    args = ["-m", "zcompy.dynamic", "--type", target.type]
+    if target.name:
+        args.extend(["--name", target.name])
+    for path in target.python_path:
+        args.extend(["--python-path", path])
+    if target.cache_dir:
+        args.extend(["--cache-dir", target.cache_dir])
+    args.append(target.target)
+    resolver = " ".join(shlex.quote(x) for x in [python, *args])
+    return f"""#compdef {name}
+
+_{name}() {{
+  local src
+  src="$({resolver} -- "${{(@)words[2,CURRENT-1]}}" 2>/dev/null)" || return 1
+  eval "$src"
+}}
+
+_{name}
+"""
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="zcompy.dynamic", description="Print the completion code of the active command.",
+    )
+    parser.add_argument("target", help="Target of the CLI, see `zcompy.batch.Target`.")
+    parser.add_argument("words", nargs="*", help="Words between the command and the cursor.")
+    parser.add_argument("--type", default="argparse", help="Type of the target.")
+    parser.add_argument("--name", default=None, help="Name of the command.")
+    parser.add_argument("--python-path", action="append", default=[])
+    parser.add_argument("--cache-dir", default=None, help="Directory of the command cache.")
+    args = parser.parse_args(argv)
+
+    target = Target(
+        args.target, type=args.type, name=args.name, python_path=args.python_path,
+        cache_dir=args.cache_dir,
+    )
+    # only the completion code is evaluated by the stub, prints of the CLI go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        command, position = resolve_target(target, args.words)
+        source = completion_source(command, position)
+        # nothing is installed in dynamic mode, files read by the active command are written
+        for file_name, content in command.generated_files().items():
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            write_if_changed(file_name, content)
+    sys.stdout.write(source)
+
+
+if __name__ == "__main__":
+    main()
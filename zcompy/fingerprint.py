@@ -0,0 +1,77 @@
+"""Stable structural hashes of command trees.
+
+Every command caches its fingerprint, computed from the fingerprints of its sub-commands,
+see `Command.fingerprint` and `Command.invalidate`.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import functools
+import hashlib
+import inspect
+from typing import Any, Callable
+
+__all__ = ["node_digest", "value_token"]
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest(func: Callable) -> str:
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        return ""
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def value_token(value: Any) -> Any:
+    """Hashable and reproducible token of an option or action value.
+
+    Functions are represented by their qualified name and the digest of their source,
+    since the source is what the generated completion runs.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return (type(value).__name__, tuple(value_token(x) for x in value))
+    if isinstance(value, dict):
+        return ("dict", tuple((value_token(k), value_token(v)) for k, v in value.items()))
+    if dataclasses.is_dataclass(value):
+        values = tuple(value_token(getattr(value, x.name)) for x in dataclasses.fields(value))
+        return (type(value).__module__, type(value).__qualname__, values)
+    if callable(value):
+        name = f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', '')}"
+        return ("callable", name, _source_digest(value))
+    return ("repr", repr(value))
+
+
+def _option_token(option) -> tuple:
+    names = (option.names,) if isinstance(option.names, str) else tuple(option.names)
+    opt_type = option.type or (option.complete_func and option.complete_func.type_hint())
+    return (
+        names, option.description, opt_type, value_token(option.complete_func),
+        option.allow_repeat,
+    )
+
+
+def _digest(token: tuple) -> str:
+    return hashlib.sha256(repr(token).encode()).hexdigest()
+
+
+def node_digest(command, children: list[str]) -> str:
+    """Fingerprint of a command from the fingerprints of its sub-commands.
+
+    The fingerprint depends on the order of options and sub-commands like the generated
+    completion.
+
+    Args:
+        command: The command to hash.
+        children: Fingerprints of the sub-commands.
+    """
+    return _digest((
+        "command", command.name, command.description,
+        tuple(_option_token(x) for x in command.options),
+        tuple(value_token(x) for x in command.positional_args),
+        value_token(command.repeat_pos_args),
+        tuple(children),
+    ))
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import ast
+import importlib.util
+import inspect
+import os
+import py_compile
+import re
+import shlex
+import sys
+import textwrap
+from dataclasses import dataclass, field
+from typing import Callable
+
+from .utils import func_key, write_completion_items, write_if_changed
+
+__all__ = ["HelperModule"]
+
+_DISPATCHER_SOURCE = """
+_FUNCTIONS = {{
+{functions}
+}}
+_BULK = {{{bulk_funcs}}}
+
+
+def _main(argv):
+    func = _FUNCTIONS[argv[0]]
+    args = argv[1:]
+    num_args = func.__code__.co_argcount
+    if num_args == 0:
+        result = func()
+    elif len(args) >= num_args:
+        result = func(*args[:num_args])
+    else:
+        return
+    if argv[0] in _BULK:
+        write_completion_items(result, _BULK[argv[0]])
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
+"""
+
+
+def imported_modules(source: str) -> set[str]:
+    """Top-level names of modules imported in the source code."""
+    modules = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.add(node.module.split(".")[0])
+    return modules
+
+
+@dataclass
+class HelperModule:
+    """One importable module that holds all Python completion functions of a command.
+
+    Generated completions run ``python3 -m <name> <func> args...``, so the functions are
+    loaded from the bytecode compiled by `write` instead of being compiled on every TAB.
+    """
+
+    name: str
+    # importable module name
+    path: str
+    # directory to write the module, it is added to PYTHONPATH of the completion
+    funcs: dict[str, Callable] = field(default_factory=dict)
+    bulk_funcs: dict[str, str] = field(default_factory=dict)
+    # output protocol of the functions returning their items, see `write_completion_items`
+
+    def __post_init__(self):
+        self.name = re.sub(r"\W", "_", self.name)
+        self.path = os.path.expanduser(self.path)
+
+    @property
+    def file_name(self) -> str:
+        return os.path.join(self.path, f"{self.name}.py")
+
+    def add(self, func: Callable, bulk: bool = False, protocol: str = "describe"):
+        """Add a completion function to the module.
+
+        Args:
+            func: The completion function.
+            bulk: If True, func returns its items instead of printing them.
+            protocol: Format to write the items of a bulk function in.
+        """
+        func_name = func.__name__
+        if self.funcs.get(func_name, func) is not func:
+            raise ValueError(f"Different completion functions share the name {func_name}.")
+        self.funcs[func_name] = func
+        if bulk:
+            self.bulk_funcs[func_name] = protocol
+
+    def function_sources(self) -> list[str]:
+        return [textwrap.dedent(inspect.getsource(func)) for func in self.funcs.values()]
+
+    def module_source(self) -> str:
+        """Source of the module, a dispatcher calls the function named by the first argument."""
+        header = '"""Completion functions generated by zcompy, do not edit."""\n\nimport sys\n'
+        functions = "\n".join(f"    {name!r}: {name}," for name in self.funcs)
+        bulk_funcs = ", ".join(f"{k!r}: {v!r}" for k, v in self.bulk_funcs.items())
+        dispatcher = _DISPATCHER_SOURCE.format(functions=functions, bulk_funcs=bulk_funcs)
+        sources = self.function_sources()
+        if self.bulk_funcs:
+            sources.append(inspect.getsource(write_completion_items))
+        return "\n\n".join([header, *sources, dispatcher.lstrip("\n")])
+
+    def python_flags(self) -> str:
+        """Interpreter flags, site-packages is skipped if functions only import stdlib."""
+        stdlib_names = getattr(sys, "stdlib_module_names", None)
+        if stdlib_names is None:  # python < 3.10
+            return ""
+        modules = set()
+        for source in self.function_sources():
+            modules |= imported_modules(source)
+        return "-S" if modules <= set(stdlib_names) else ""
+
+    @property
+    def bytecode_file(self) -> str:
+        return importlib.util.cache_from_source(self.file_name)
+
+    def compile(self):
+        """Precompile the written module to bytecode."""
+        py_compile.compile(self.file_name, cfile=self.bytecode_file, doraise=True)
+
+    def write(self) -> str:
+        """Write the module and precompile it to bytecode, return the path of the module.
+
+        An unchanged module is kept as it is and only compiled if its bytecode is missing.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        written = write_if_changed(self.file_name, self.module_source())
+        if written or not os.path.exists(self.bytecode_file):
+            self.compile()
+        print(f"Helper module created at: {self.file_name}")
+        return self.file_name
+
+    def shell_source(
+        self, func: Callable, ignore_exception: bool = False, daemon: bool = False
+    ) -> tuple[str, str]:
+        """Shell function that calls func through the module and the name of it."""
+        func_name = func.__name__
+        indent = " " * 2
+        flags = self.python_flags()
+        python = f"python3 {flags}" if flags else "python3"
+        python_path = shlex.quote(self.path) + "${PYTHONPATH:+:$PYTHONPATH}"
+        redirect_text = " 2>/dev/null" if ignore_exception else ""
+        daemon_key = shlex.quote(func_key(func))
+        daemon_text = f'{indent}__zcompy_daemon {daemon_key} "$@" && return\n' if daemon else ""
+
+        command = f'PYTHONPATH={python_path} {python} -m {self.name} {func_name} "$@"'
+        shell_code = f"""__{func_name}() {{
+{daemon_text}{indent}{command}{redirect_text}
+}}
+"""
+        return shell_code, f"__{func_name}"
@@ -0,0 +1,126 @@
+"""Incremental install of generated files into a directory.
+
+Every directory keeps a manifest of the files zcompy installed there, with the sha256 of
+their content, their mtime and size, and the command owning them. Files are only replaced
+when their content changed, so `.zcompdump`, `.zwc` and filesystem caches stay valid across
+deploys, and files a command no longer generates are removed. A file still matching its
+manifest entry isn't read again to tell if it changed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from .utils import chmod_execute, write_chunks, write_if_changed
+
+__all__ = ["InstallReport", "Installer"]
+
+MANIFEST_NAME = ".zcompy-manifest.json"
+
+
+@dataclass
+class InstallReport:
+    """Paths of the files written, skipped because unchanged, and removed by an install."""
+
+    written: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+    def update(self, other: InstallReport):
+        self.written.extend(other.written)
+        self.skipped.extend(other.skipped)
+        self.removed.extend(other.removed)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.written)} written, {len(self.skipped)} unchanged, "
+            f"{len(self.removed)} removed"
+        )
+
+
+class Installer:
+    """Install the files generated for one command into a directory.
+
+    Call `write` for every file of the command, then `finish` to remove files written
+    by a previous install of the same command but not by this one, and save the manifest.
+    """
+
+    def __init__(self, output_dir: str, owner: str):
+        self.output_dir = os.path.expanduser(output_dir)
+        self.owner = owner
+        self.manifest_file = os.path.join(self.output_dir, MANIFEST_NAME)
+        self.report = InstallReport()
+        self._installed: set[str] = set()
+        self._files = self.load_manifest()
+
+    def load_manifest(self) -> dict[str, dict[str, str]]:
+        """Manifest entries keyed by file name, an unreadable manifest is treated as empty."""
+        try:
+            with open(self.manifest_file, "r") as f:
+                return json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def write(self, name: str, content: str | Iterable[str], executable: bool = False) -> bool:
+        """Atomically write a file in the output directory if its content changed.
+
+        Args:
+            name: File name relative to the output directory.
+            content: Content of the file, or chunks of it.
+            executable: If True, the file is made executable.
+
+        Returns:
+            True if the file is written.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        file_name = os.path.join(self.output_dir, name)
+        chunks = [content] if isinstance(content, str) else content
+        digest = hashlib.sha256()
+
+        def hashed_chunks() -> Iterator[str]:
+            for chunk in chunks:
+                digest.update(chunk.encode())
+                yield chunk
+
+        entry = self._files.get(name, {})
+
+        def unchanged() -> bool:
+            # the file is the one installed before if its stat is the same as recorded
+            if entry.get("sha256") != digest.hexdigest() or not os.path.isfile(file_name):
+                return False
+            st = os.stat(file_name)
+            return entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size
+
+        written = write_chunks(file_name, hashed_chunks(), unchanged)
+        if executable:
+            chmod_execute(file_name)
+
+        st = os.stat(file_name)
+        self._installed.add(name)
+        self._files[name] = {
+            "sha256": digest.hexdigest(), "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+            "owner": self.owner,
+        }
+        (self.report.written if written else self.report.skipped).append(file_name)
+        return written
+
+    def finish(self) -> InstallReport:
+        """Remove orphaned files of the owner and save the manifest."""
+        for name, entry in list(self._files.items()):
+            if entry.get("owner") != self.owner or name in self._installed:
+                continue
+            del self._files[name]
+            file_name = os.path.join(self.output_dir, name)
+            for path in (file_name, f"{file_name}.zwc"):
+                if os.path.isfile(path):
+                    os.unlink(path)
+                    self.report.removed.append(path)
+
+        if self._files or os.path.exists(self.manifest_file):
+            manifest = {"version": 1, "files": dict(sorted(self._files.items()))}
+            write_if_changed(self.manifest_file, json.dumps(manifest, indent=2) + "\n")
+        return self.report
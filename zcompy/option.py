@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import sys
+from dataclasses import fields
 
 from .action import Action
+from .utils import slots_dataclass
 
 __all__ = ["Option"]
 
 
-@dataclass
+@slots_dataclass
 class Option:
     """Class to represent an option with its attributes."""
 
@@ -18,6 +20,13 @@ class Option:
     complete_func: Action | None = None
     allow_repeat: bool = False
 
+    def __post_init__(self):
+        # option names like `--help` repeat in every sub-command, share them
+        if isinstance(self.names, str):
+            self.names = sys.intern(self.names)
+        else:
+            self.names = type(self.names)(sys.intern(x) for x in self.names)
+
     def to_complete_argument(self) -> str:
         if isinstance(self.names, str):  # ensure tuple type
             self.names = (self.names,)
@@ -43,10 +52,27 @@ class Option:
 
         return f"'{opt_text}[{desc}]{comp_func}'"
 
+    def argument_specs(self) -> list[str]:
+        """Unquoted `_arguments` specs of this option, one for each option name.
+
+        They are the words that the shell source from `to_complete_argument` expands to.
+        """
+        names = (self.names,) if isinstance(self.names, str) else self.names
+        opt_name = sorted(names, key=len, reverse=True)  # long term first
+        prefix = "*" if self.allow_repeat else "(" + " ".join(opt_name) + ")"
+
+        comp_func = ""
+        if self.complete_func:
+            opt_type = self.type or self.complete_func.type_hint()
+            assert opt_type, "Option type must be specified if a function is provided"
+            comp_func = f":{opt_type}:{self.complete_func.action_source()}"
+
+        return [f"{prefix}{name}[{self.description}]{comp_func}" for name in opt_name]
+
     def __eq__(self, other) -> bool:
         if not isinstance(other, Option):
             return False
-        for attr_name in vars(self):
+        for attr_name in (x.name for x in fields(self)):
             self_val = getattr(self, attr_name)
             other_val = getattr(other, attr_name)
             if attr_name == "names":
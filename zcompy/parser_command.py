@@ -3,7 +3,7 @@ from __future__ import annotations
 import copy
 from argparse import Action as ParserAction
 from argparse import ArgumentParser, _AppendAction, _StoreFalseAction, _StoreTrueAction
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Callable
 
 from .action import Action, Completion
@@ -14,9 +14,18 @@ from .option import Option
 @dataclass
 class ParserCommand:
     parser: ArgumentParser
+    # completions with the same choices are shared by their options
+    _choice_completions: dict[tuple[str, ...], Completion] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
-    def to_command(self) -> Command:
-        """Convert the ArgumentParser to a Command object."""
+    def to_command(self, recursive: bool = True) -> Command:
+        """Convert the ArgumentParser to a Command object.
+
+        Args:
+            recursive: If False, sub-commands only have their names and descriptions,
+                see `zcompy.dynamic`.
+        """
         # Get the program name from the parser
         name = self.parser.prog or "command"
         # If the name looks like a script path, use a generic name
@@ -40,7 +49,12 @@ class ParserCommand:
         subparsers = self.get_subparsers(self.parser)
         if subparsers:
             for sub_name, (sub_parser, help_text) in subparsers.items():
-                sub_command = self.create_subcommand(sub_name, sub_parser, help_text)
+                if recursive:
+                    sub_command = self.create_subcommand(sub_name, sub_parser, help_text)
+                else:
+                    sub_command = Command(
+                        name=sub_name, description=sub_parser.description or help_text or "",
+                    )
                 command.add_sub_commands(sub_command)
 
         return command
@@ -78,14 +92,17 @@ class ParserCommand:
             for option_name in action.option_strings:
                 if option_name in self._option_actions:
                     action_obj = self._option_actions[option_name]
-                    # deepcopy to avoid change
+                    # deepcopy to avoid change, only the choices created here are shared
                     complete_func = copy.deepcopy(action_obj)
                     option_type = option_type or action_obj.type_hint()
                     break
 
         # check for choices or existing completion function
         if complete_func is None and action.choices:
-            complete_func = Completion(func=tuple(str(choice) for choice in action.choices))
+            choices = tuple(str(choice) for choice in action.choices)
+            complete_func = self._choice_completions.get(choices)
+            if complete_func is None:
+                complete_func = self._choice_completions[choices] = Completion(func=choices)
 
         return Option(
             names=names,
@@ -96,9 +113,14 @@ class ParserCommand:
         )
 
     def create_subcommand(
-        self, name: str, parser: ArgumentParser, help_text: str = ""
+        self, name: str, parser: ArgumentParser, help_text: str = "", recursive: bool = True
     ) -> Command:
-        """Create a sub-command from a subparser."""
+        """Create a sub-command from a subparser.
+
+        Args:
+            recursive: If False, nested sub-commands only have their names and descriptions,
+                so only the subparser being completed is converted, see `zcompy.dynamic`.
+        """
         description = parser.description or help_text or ""
         sub_command = Command(name=name, description=description)
 
@@ -115,9 +137,15 @@ class ParserCommand:
         nested_subparsers = self.get_subparsers(parser)
         if nested_subparsers:
             for nested_name, (nested_parser, nested_help_text) in nested_subparsers.items():
-                nested_subcommand = self.create_subcommand(
-                    nested_name, nested_parser, nested_help_text
-                )
+                if recursive:
+                    nested_subcommand = self.create_subcommand(
+                        nested_name, nested_parser, nested_help_text
+                    )
+                else:
+                    nested_subcommand = Command(
+                        name=nested_name,
+                        description=nested_parser.description or nested_help_text or "",
+                    )
                 sub_command.add_sub_commands(nested_subcommand)
 
         return sub_command
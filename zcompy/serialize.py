@@ -0,0 +1,250 @@
+"""Serialize command trees, so a converted CLI is loaded without importing it again.
+
+`command_to_dict` converts a tree to plain lists, dicts and strings, which can be dumped
+as JSON. Actions are stored with the import path of their class and their fields, python
+completion functions by their import path, so they must be defined at module level.
+`dumps` uses marshal, which stores a string or an action shared by many options only once.
+
+`load_cached` keeps such a dump on disk, keyed by the mtimes of the source files used to
+build the tree, and only rebuilds it when one of them changes.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import marshal
+import os
+import secrets
+import sys
+from typing import Any, Callable, Iterable
+
+from .batch import import_object
+from .command import Command
+from .option import Option
+
+__all__ = [
+    "command_from_dict",
+    "command_to_dict",
+    "dumps",
+    "load_cached",
+    "loads",
+    "value_from_data",
+    "value_to_data",
+]
+
+FORMAT_VERSION = 1
+
+
+def _import_path(obj) -> str:
+    path = f"{obj.__module__}:{obj.__qualname__}"
+    if "<" in path:  # <locals> or <lambda>
+        raise ValueError(f"{path} can't be imported, define it at module level.")
+    return path
+
+
+def value_to_data(value: Any, memo: dict[int, Any] | None = None) -> Any:
+    """Plain data of an action or a value of its fields.
+
+    Args:
+        value: The value to convert.
+        memo: Data of the dataclass objects already converted by id, objects shared in
+            the tree share their data.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, list):
+        return [value_to_data(x, memo) for x in value]
+    if isinstance(value, tuple):
+        return {"tuple": [value_to_data(x, memo) for x in value]}
+    if isinstance(value, dict):
+        items = value.items()
+        return {"dict": [[value_to_data(k, memo), value_to_data(v, memo)] for k, v in items]}
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        if memo is not None and id(value) in memo:
+            return memo[id(value)]
+        data = {
+            "class": _import_path(type(value)),
+            "fields": {
+                x.name: value_to_data(getattr(value, x.name), memo)
+                for x in dataclasses.fields(value) if x.init
+            },
+        }
+        if memo is not None:
+            memo[id(value)] = data
+        return data
+    if callable(value):
+        return {"callable": _import_path(value)}
+    raise TypeError(f"Can't serialize {value!r} of type {type(value).__name__}.")
+
+
+def value_from_data(data: Any, memo: dict[int, Any] | None = None) -> Any:
+    """Inverse of `value_to_data`, classes and functions are imported."""
+    if not isinstance(data, (list, dict)):
+        return data
+    if isinstance(data, list):
+        return [value_from_data(x, memo) for x in data]
+    if memo is not None and id(data) in memo:
+        return memo[id(data)]
+
+    if "tuple" in data:
+        value = tuple(value_from_data(x, memo) for x in data["tuple"])
+    elif "dict" in data:
+        value = {value_from_data(k, memo): value_from_data(v, memo) for k, v in data["dict"]}
+    elif "callable" in data:
+        value = import_object(data["callable"])
+    else:
+        cls = import_object(data["class"])
+        value = cls(**{k: value_from_data(v, memo) for k, v in data["fields"].items()})
+    if memo is not None:
+        memo[id(data)] = value
+    return value
+
+
+def _option_to_dict(option: Option, memo: dict[int, Any]) -> dict[str, Any]:
+    data = {"names": option.names if isinstance(option.names, str) else list(option.names)}
+    if option.description:
+        data["description"] = option.description
+    if option.type:
+        data["type"] = option.type
+    if option.complete_func is not None:
+        data["complete_func"] = value_to_data(option.complete_func, memo)
+    if option.allow_repeat:
+        data["allow_repeat"] = True
+    return data
+
+
+def _option_from_dict(data: dict[str, Any], memo: dict[int, Any]) -> Option:
+    names = data["names"]
+    return Option(
+        names if isinstance(names, str) else tuple(names),
+        description=data.get("description", ""),
+        type=data.get("type", ""),
+        complete_func=value_from_data(data.get("complete_func"), memo),
+        allow_repeat=data.get("allow_repeat", False),
+    )
+
+
+def command_to_dict(command: Command) -> dict[str, Any]:
+    """Plain data of a command tree, empty fields are omitted."""
+    memo = {}
+    root = {}
+    stack = [(command, root)]
+    while stack:
+        cmd, data = stack.pop()
+        data["name"] = cmd.name
+        if cmd.description:
+            data["description"] = cmd.description
+        if cmd.options:
+            data["options"] = [_option_to_dict(x, memo) for x in cmd.options]
+        if cmd.positional_args:
+            data["positional_args"] = [value_to_data(x, memo) for x in cmd.positional_args]
+        if cmd.repeat_pos_args is not None:
+            data["repeat_pos_args"] = value_to_data(cmd.repeat_pos_args, memo)
+        if cmd.sub_commands:
+            data["sub_commands"] = [{} for _ in cmd.sub_commands]
+            stack.extend(zip(cmd.sub_commands, data["sub_commands"]))
+    return root
+
+
+def command_from_dict(data: dict[str, Any]) -> Command:
+    """Inverse of `command_to_dict`."""
+    memo = {}
+
+    def create(cmd_data: dict[str, Any]) -> Command:
+        options = cmd_data.get("options", [])
+        positional_args = cmd_data.get("positional_args", [])
+        return Command(
+            cmd_data["name"],
+            cmd_data.get("description", ""),
+            options=[_option_from_dict(x, memo) for x in options],
+            positional_args=[value_from_data(x, memo) for x in positional_args],
+            repeat_pos_args=value_from_data(cmd_data.get("repeat_pos_args"), memo),
+        )
+
+    root = create(data)
+    stack = [(root, data)]
+    while stack:
+        cmd, cmd_data = stack.pop()
+        sub_data = cmd_data.get("sub_commands", [])
+        if sub_data:
+            sub_commands = [create(x) for x in sub_data]
+            cmd.add_sub_commands(sub_commands)
+            stack.extend(zip(sub_commands, sub_data))
+    return root
+
+
+def dumps(command: Command, sources: dict[str, tuple[int, int]] | None = None) -> bytes:
+    """Compact binary form of a command tree.
+
+    Args:
+        command: The command to dump.
+        sources: (mtime in ns, size) of the files the tree is built from, see `load_cached`.
+    """
+    return marshal.dumps((FORMAT_VERSION, sources or {}, command_to_dict(command)))
+
+
+def _load(data: bytes) -> tuple[dict[str, tuple[int, int]], dict[str, Any]]:
+    version, sources, tree = marshal.loads(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version {version}.")
+    return sources, tree
+
+
+def loads(data: bytes) -> Command:
+    """Inverse of `dumps`."""
+    return command_from_dict(_load(data)[1])
+
+
+def _file_state(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_cached(
+    cache_file: str,
+    build: Callable[[], Command],
+    modules: Iterable[str] = (),
+    files: Iterable[str] = (),
+) -> Command:
+    """Load a command tree from cache_file, or build it and update cache_file.
+
+    The cache is valid while the source files of the modules imported by build, the
+    modules given and the files given are unchanged.
+
+    Args:
+        cache_file: Path of the cache.
+        build: Function to build the command tree, like `Target.to_command`.
+        modules: Names of modules to check even if they are imported before build.
+        files: Other files the tree is built from.
+    """
+    try:
+        with open(cache_file, "rb") as f:
+            sources, tree = _load(f.read())
+        if all(_file_state(path) == tuple(state) for path, state in sources.items()):
+            return command_from_dict(tree)
+    except (OSError, EOFError, ValueError, TypeError, ImportError, AttributeError):
+        pass  # missing, broken or outdated cache
+
+    imported = set(sys.modules)
+    command = build()
+    modules = [x for x in sys.modules if x not in imported] + list(modules)
+    paths = [getattr(sys.modules.get(x), "__file__", None) for x in modules] + list(files)
+    sources = {}
+    for path in filter(None, paths):
+        state = _file_state(path)
+        if state is not None:
+            sources[path] = state
+
+    try:
+        data = dumps(command, sources)
+    except (ValueError, TypeError):  # like nested completion functions, not cacheable
+        return command
+    os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+    tmp_name = f"{cache_file}.{secrets.token_hex(4)}.tmp"
+    with open(tmp_name, "wb") as f:
+        f.write(data)
+    os.replace(tmp_name, cache_file)
+    return command
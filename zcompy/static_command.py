@@ -0,0 +1,495 @@
+"""Build a Command from the source of an argparse or click CLI without importing it.
+
+The source is parsed with `ast`, and the statically resolvable calls of argparse and
+click are replayed on real parser and click objects, so the result is the same as
+converting the live CLI with `ParserCommand`/`ClickCommand`. Only argparse and click
+themselves are imported, not the heavy dependencies of the CLI.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import importlib
+import importlib.util
+import inspect
+import os
+import sys
+from collections import ChainMap
+from dataclasses import dataclass
+from typing import Any
+
+from .command import Command
+from .parser_command import ParserCommand
+
+__all__ = ["StaticCommand", "UnresolvableError"]
+
+
+class UnresolvableError(ValueError):
+    """The CLI can't be built from its source without running it."""
+
+
+_UNKNOWN = object()  # value of a name that can't be resolved statically
+
+_BUILTINS = {
+    "int": int, "float": float, "str": str, "bool": bool, "list": list, "tuple": tuple,
+    "set": set, "dict": dict, "range": range, "sorted": sorted,
+}
+
+_CLICK_DECORATORS = {
+    "command", "group", "option", "argument", "version_option", "help_option",
+    "password_option", "confirmation_option", "pass_context", "pass_obj",
+}
+
+# keyword arguments that don't change the converted Command, dropped if not resolvable
+_ARGPARSE_DROPPABLE = {
+    "default", "metavar", "required", "const", "formatter_class", "epilog", "usage",
+    "argument_default", "parser_class", "title", "help_formatter",
+}
+_CLICK_DROPPABLE = {
+    "callback", "shell_complete", "envvar", "show_default", "show_envvar", "expose_value",
+    "is_eager", "context_settings", "prompt", "metavar", "epilog", "short_help",
+}
+
+# methods of argparse objects that are replayed, or don't change the parser
+_ARGPARSE_METHODS = {
+    "add_argument", "add_argument_group", "add_mutually_exclusive_group", "add_subparsers",
+    "add_parser",
+}
+_ARGPARSE_IGNORED = {
+    "parse_args", "parse_known_args", "parse_intermixed_args", "parse_known_intermixed_args",
+    "print_help", "print_usage", "format_help", "format_usage", "error", "exit",
+    "set_defaults", "get_default",
+}
+_ARGPARSE_ATTRS = {"required", "dest", "metavar", "title", "epilog", "usage"}
+_CLICK_IGNORED = {"main", "invoke", "make_context", "get_help", "get_usage"}
+_TRACKED_METHODS = {*_ARGPARSE_METHODS, "command", "group", "add_command"}
+
+
+def _static_type(value):
+    """Placeholder of an argparse type that can't be resolved, it converts the same."""
+    return value
+
+
+def _dummy_function(node: ast.FunctionDef):
+    """Function to apply click decorators on, with the name and docstring of node."""
+
+    def func(*args, **kwargs):
+        pass
+
+    func.__name__ = func.__qualname__ = node.name
+    func.__doc__ = ast.get_docstring(node, clean=False)
+    return func
+
+
+class _Interpreter:
+    """Replay argparse and click calls of a module on real objects."""
+
+    def __init__(self, tree: ast.Module):
+        self.tree = tree
+        self.modules: dict[str, Any] = {}
+        self.module_env: dict[str, Any] = {}
+        self.returns: dict[str, Any] = {}
+        self.parsers: list[argparse.ArgumentParser] = []
+        self.parent_parsers: list[argparse.ArgumentParser] = []
+        self.click_commands: list[Any] = []
+        self.click = None
+
+    def run(self):
+        self.run_scope(self.tree.body, self.module_env)
+        for node in self.tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self.run_function(node)
+
+    def run_function(self, node: ast.FunctionDef):
+        local_env: dict[str, Any] = {}
+        for arg in [*node.args.posonlyargs, *node.args.args, *node.args.kwonlyargs]:
+            local_env[arg.arg] = _UNKNOWN
+        for arg in (node.args.vararg, node.args.kwarg):
+            if arg is not None:
+                local_env[arg.arg] = _UNKNOWN
+        returned = self.run_scope(node.body, ChainMap(local_env, self.module_env))
+        if returned is not None:
+            self.returns[node.name] = returned
+
+    def run_scope(self, body: list[ast.stmt], env):
+        """Run the statements of a module or function, return the tracked object returned."""
+        for node in body:
+            for x in ast.walk(node):
+                if isinstance(x, ast.Name) and isinstance(x.ctx, ast.Store):
+                    env[x.id] = _UNKNOWN
+
+        returned = None
+        for node in body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                self.run_import(node, env)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self.run_function_def(node, env)
+            elif isinstance(node, ast.Assign) and len(node.targets) == 1:
+                self.run_assign(node.targets[0], node.value, env)
+            elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+                self.run_call(node.value, env)
+            elif isinstance(node, ast.Return) and isinstance(node.value, ast.Name):
+                value = env.get(node.value.id)
+                returned = value if self.is_tracked(value) else None
+            else:
+                self.check_untouched(node, env)
+        return returned
+
+    def run_import(self, node: ast.Import | ast.ImportFrom, env):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name in ("argparse", "click"):
+                    env[alias.asname or alias.name] = self.import_module(alias.name)
+        elif node.module in ("argparse", "click") and node.level == 0:
+            module = self.import_module(node.module)
+            for alias in node.names:
+                if alias.name == "*":
+                    raise UnresolvableError(f"star import of {node.module}")
+                env[alias.asname or alias.name] = getattr(module, alias.name, _UNKNOWN)
+
+    def import_module(self, name: str):
+        if name not in self.modules:
+            try:
+                self.modules[name] = importlib.import_module(name)
+            except ImportError as e:
+                raise UnresolvableError(f"{name} is not installed") from e
+            if name == "click":
+                self.click = self.modules[name]
+        return self.modules[name]
+
+    def is_tracked(self, value) -> bool:
+        tracked = (argparse.ArgumentParser, argparse._SubParsersAction, argparse._ArgumentGroup)
+        if isinstance(value, tracked):
+            return True
+        return self.click is not None and isinstance(value, self.click.Command)
+
+    def is_click_decorator(self, node: ast.expr, env) -> bool:
+        root = node.func if isinstance(node, ast.Call) else node
+        while isinstance(root, ast.Attribute):
+            root = root.value
+        if not isinstance(root, ast.Name):
+            return False
+        value = env.get(root.id)
+        if self.click is None:
+            return False
+        return value is self.click or isinstance(value, self.click.Group) or any(
+            value is getattr(self.click, x, None) for x in _CLICK_DECORATORS
+        )
+
+    def run_function_def(self, node: ast.FunctionDef, env):
+        click_decorated = [self.is_click_decorator(x, env) for x in node.decorator_list]
+        if not any(click_decorated):
+            return
+        obj = _dummy_function(node)
+        for decorator in reversed(node.decorator_list):
+            obj = self.evaluate(decorator, env, droppable=_CLICK_DROPPABLE)(obj)
+        if not isinstance(obj, self.click.Command):
+            raise UnresolvableError(f"{node.name} is not a click command")
+        self.click_commands.append(obj)
+        env[node.name] = obj
+
+    def run_assign(self, target: ast.expr, value: ast.expr, env):
+        if isinstance(target, ast.Name):
+            if isinstance(value, ast.Call) and (
+                self.is_method_call(value, env) or self.creates_parser(value, env)
+            ):
+                result = self.run_call(value, env)
+                env[target.id] = _UNKNOWN if result is None else result
+                return
+            self.check_untouched(value, env)
+            try:
+                env[target.id] = self.evaluate(value, env, droppable=_ARGPARSE_DROPPABLE)
+            except UnresolvableError:
+                env[target.id] = _UNKNOWN
+        elif isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name):
+            obj = env.get(target.value.id)
+            if not self.is_tracked(obj):
+                self.check_untouched(value, env)
+            elif target.attr in ("prog", "description"):
+                setattr(obj, target.attr, self.evaluate(value, env))
+            elif target.attr not in _ARGPARSE_ATTRS:
+                raise UnresolvableError(f"assignment of {target.attr}")
+        else:
+            self.check_untouched(target, env)
+            self.check_untouched(value, env)
+
+    def is_method_call(self, node: ast.Call, env) -> bool:
+        """If node calls a method of a tracked object, like `parser.add_argument(...)`."""
+        func = node.func
+        if not isinstance(func, ast.Attribute):
+            return False
+        if isinstance(func.value, ast.Name):
+            return self.is_tracked(env.get(func.value.id))
+        # chained call like `sub.add_parser("x").add_argument(...)`
+        return (
+            isinstance(func.value, ast.Call) and isinstance(func.value.func, ast.Attribute)
+            and func.value.func.attr in _TRACKED_METHODS and self.is_method_call(func.value, env)
+        )
+
+    def run_call(self, node: ast.Call, env):
+        """Run a call statement, return the tracked object it creates."""
+        if not self.is_method_call(node, env):
+            if isinstance(node.func, ast.Name) and self.is_tracked(env.get(node.func.id)):
+                return None  # invoking the CLI, like `cli()`
+            if self.creates_parser(node, env):
+                value = self.evaluate(node, env, droppable=_ARGPARSE_DROPPABLE)
+                return value if self.is_tracked(value) else None
+            self.check_untouched(node, env)
+            return None
+
+        value = node.func.value
+        obj = self.run_call(value, env) if isinstance(value, ast.Call) else env[value.id]
+        if obj is None:
+            raise UnresolvableError("method call on an unknown object")
+        method = node.func.attr
+        if self.click is not None and isinstance(obj, self.click.Command):
+            if method == "add_command" and isinstance(obj, self.click.Group):
+                return self.evaluate_call(node, env, func=obj.add_command)
+            elif method in _CLICK_IGNORED:
+                return None
+        elif method in _ARGPARSE_METHODS and hasattr(obj, method):
+            fallback = {"type": _static_type} if method == "add_argument" else {}
+            return self.evaluate_call(
+                node, env, _ARGPARSE_DROPPABLE, fallback, func=getattr(obj, method)
+            )
+        elif method in _ARGPARSE_IGNORED:
+            return None
+        raise UnresolvableError(f"unsupported call of {method}")
+
+    def creates_parser(self, node: ast.Call, env) -> bool:
+        func = node.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            return env.get(func.value.id) is argparse and func.attr == "ArgumentParser"
+        return isinstance(func, ast.Name) and env.get(func.id) is argparse.ArgumentParser
+
+    def check_untouched(self, node: ast.AST, env):
+        """Make sure an unsupported statement doesn't create or change tracked objects."""
+        allowed = set()
+        for x in ast.walk(node):
+            if isinstance(x, (ast.FunctionDef, ast.AsyncFunctionDef)) and any(
+                self.is_click_decorator(d, env) for d in x.decorator_list
+            ):
+                raise UnresolvableError(f"conditional definition of {x.name}")
+            if not isinstance(x, ast.Call):
+                continue
+            if self.creates_parser(x, env):
+                raise UnresolvableError("conditional creation of a parser")
+            func = x.func
+            if isinstance(func, ast.Name):
+                allowed.add(id(func))
+            elif isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+                if func.attr in _ARGPARSE_IGNORED or func.attr in _CLICK_IGNORED:
+                    allowed.add(id(func.value))
+
+        for x in ast.walk(node):
+            if isinstance(x, ast.Name) and id(x) not in allowed:
+                if self.is_tracked(env.get(x.id)):
+                    raise UnresolvableError(f"unsupported use of {x.id}")
+
+    def evaluate(self, node: ast.expr, env, droppable=frozenset(), fallback=None):
+        """Evaluate an expression made of literals and argparse/click calls."""
+        if isinstance(node, ast.Constant):
+            return node.value
+        elif isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            if any(isinstance(x, ast.Starred) for x in node.elts):
+                raise UnresolvableError("starred expression")
+            values = [self.evaluate(x, env) for x in node.elts]
+            container = {ast.List: list, ast.Tuple: tuple, ast.Set: set}[type(node)]
+            return container(values)
+        elif isinstance(node, ast.Dict):
+            if any(k is None for k in node.keys):
+                raise UnresolvableError("dict unpacking")
+            return {
+                self.evaluate(k, env): self.evaluate(v, env)
+                for k, v in zip(node.keys, node.values)
+            }
+        elif isinstance(node, ast.Name):
+            value = env.get(node.id, _BUILTINS.get(node.id, _UNKNOWN))
+            if value is _UNKNOWN:
+                raise UnresolvableError(f"unknown name {node.id}")
+            return value
+        elif isinstance(node, ast.Attribute):
+            obj = self.evaluate(node.value, env)
+            if any(obj is x for x in self.modules.values()):
+                value = getattr(obj, node.attr, _UNKNOWN)
+            elif self.is_tracked(obj) and node.attr in _TRACKED_METHODS:
+                value = getattr(obj, node.attr, _UNKNOWN)
+            else:
+                value = _UNKNOWN
+            if value is _UNKNOWN:
+                raise UnresolvableError(f"unknown attribute {node.attr}")
+            return value
+        elif isinstance(node, ast.Subscript) and not isinstance(node.slice, ast.Slice):
+            index = node.slice
+            if type(index).__name__ == "Index":  # python < 3.9
+                index = index.value
+            try:
+                return self.evaluate(node.value, env)[self.evaluate(index, env)]
+            except (LookupError, TypeError) as e:
+                raise UnresolvableError("invalid subscript") from e
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            return self.evaluate(node.left, env) + self.evaluate(node.right, env)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -self.evaluate(node.operand, env)
+        elif isinstance(node, ast.JoinedStr):
+            return "".join(self.evaluate_format(x, env) for x in node.values)
+        elif isinstance(node, ast.Call):
+            return self.evaluate_call(node, env, droppable, fallback)
+        raise UnresolvableError(f"unsupported expression {type(node).__name__}")
+
+    def evaluate_format(self, node: ast.expr, env) -> str:
+        if isinstance(node, ast.FormattedValue):
+            if node.conversion != -1 or node.format_spec is not None:
+                raise UnresolvableError("formatted value with conversion")
+            return str(self.evaluate(node.value, env))
+        return str(self.evaluate(node, env))
+
+    def evaluate_call(
+        self, node: ast.Call, env, droppable=frozenset(), fallback: dict | None = None, func=None
+    ):
+        """Evaluate a call, func is the resolved callable of node if given.
+
+        Keyword arguments in droppable are dropped if they can't be resolved, or replaced
+        by the value in fallback.
+        """
+        fallback = fallback or {}
+        if func is None:
+            func = self.evaluate(node.func, env)
+        if not self.is_safe_callable(func):
+            raise UnresolvableError(f"unsupported call of {getattr(func, '__name__', func)}")
+        if any(isinstance(x, ast.Starred) for x in node.args):
+            raise UnresolvableError("starred arguments")
+        args = [self.evaluate(x, env) for x in node.args]
+        kwargs = {}
+        for keyword in node.keywords:
+            if keyword.arg is None:
+                raise UnresolvableError("keyword unpacking")
+            try:
+                kwargs[keyword.arg] = self.evaluate(keyword.value, env)
+            except UnresolvableError:
+                if keyword.arg in fallback:
+                    kwargs[keyword.arg] = fallback[keyword.arg]
+                elif keyword.arg not in droppable:
+                    raise
+
+        value = func(*args, **kwargs)
+        if func is argparse.ArgumentParser:
+            self.parsers.append(value)
+            self.parent_parsers.extend(kwargs.get("parents", []))
+        return value
+
+    def is_safe_callable(self, func) -> bool:
+        """Only callables without side effects are evaluated."""
+        if any(func is x for x in _BUILTINS.values()):
+            return True
+        owner = getattr(func, "__self__", None)
+        if self.is_tracked(owner):  # methods are checked by run_call
+            return True
+        if self.click is not None and any(
+            func is getattr(self.click, x, None) for x in _CLICK_DECORATORS
+        ):
+            return True
+        return inspect.isclass(func) and func.__module__.split(".")[0] in self.modules
+
+    def roots(self) -> list:
+        """Parsers and click commands that are not part of another one."""
+        roots = [
+            x for x in self.parsers if not any(x is parent for parent in self.parent_parsers)
+        ]
+        sub_commands = [
+            sub for x in self.click_commands if isinstance(x, self.click.Group)
+            for sub in x.commands.values()
+        ] if self.click is not None else []
+        roots.extend(
+            x for x in self.click_commands if not any(x is sub for sub in sub_commands)
+        )
+        return roots
+
+
+def _is_cli(value) -> bool:
+    if isinstance(value, argparse.ArgumentParser):
+        return True
+    click = sys.modules.get("click")
+    return click is not None and isinstance(value, click.Command)
+
+
+@dataclass
+class StaticCommand:
+    """Build the Command of an argparse or click CLI from its source file.
+
+    .. code-block:: python
+        command = StaticCommand("tools/train.py", target="build_parser").to_command()
+    """
+
+    path: str
+    # source file of the CLI
+    target: str | None = None
+    # name of the variable holding the parser or click command, or of a function returning
+    # the parser. Default to the only parser or top-level click command of the source.
+    fallback: bool = True
+    # if True, import the source when the CLI can't be resolved statically
+
+    def __post_init__(self):
+        self.path = os.path.expanduser(self.path)
+
+    def static_cli(self):
+        """Resolve the parser or click command from the source without importing it.
+
+        Raises:
+            UnresolvableError: If the CLI is built by code that can't be resolved statically.
+        """
+        with open(self.path, "r") as f:
+            tree = ast.parse(f.read(), filename=self.path)
+        interpreter = _Interpreter(tree)
+        interpreter.run()
+
+        if self.target is not None:
+            value = interpreter.module_env.get(self.target)
+            if value is None or value is _UNKNOWN:
+                value = interpreter.returns.get(self.target)
+            if not _is_cli(value):
+                raise UnresolvableError(f"can't resolve {self.target}")
+            return value
+
+        roots = interpreter.roots()
+        if len(roots) != 1:
+            raise UnresolvableError(f"found {len(roots)} CLIs, please specify target")
+        return roots[0]
+
+    def imported_cli(self):
+        """Resolve the parser or click command by importing the source."""
+        module_name = "_zcompy_static_" + os.path.splitext(os.path.basename(self.path))[0]
+        spec = importlib.util.spec_from_file_location(module_name, self.path)
+        module = importlib.util.module_from_spec(spec)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(self.path)))
+        try:
+            spec.loader.exec_module(module)
+        finally:
+            sys.path.pop(0)
+
+        if self.target is not None:
+            value = getattr(module, self.target)
+            return value if _is_cli(value) else value()
+
+        candidates = [x for x in vars(module).values() if _is_cli(x)]
+        if len(candidates) != 1:
+            raise ValueError(f"Found {len(candidates)} CLIs in {self.path}, specify target.")
+        return candidates[0]
+
+    def resolve(self):
+        """The parser or click command of the source, imported only if needed."""
+        try:
+            return self.static_cli()
+        except UnresolvableError:
+            if not self.fallback:
+                raise
+        return self.imported_cli()
+
+    def to_command(self) -> Command:
+        cli = self.resolve()
+        if isinstance(cli, argparse.ArgumentParser):
+            return ParserCommand(cli).to_command()
+
+        from .click_command import ClickCommand
+        return ClickCommand(cli).to_command()
@@ -0,0 +1,114 @@
+"""Table-driven completion backend for very large command trees.
+
+Instead of one zsh function with a `case` statement per sub-command level, the whole
+tree is emitted as two associative arrays keyed by command path, plus one generic
+dispatcher function. Script size then grows with the data, not with generated code.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Iterator
+
+if TYPE_CHECKING:
+    from .command import Command
+
+__all__ = ["command_tables", "iter_table_completion_function", "table_completion_function"]
+
+
+def zsh_ansi_quote(text: str) -> str:
+    """Quote text as a zsh $'...' string."""
+    text = text.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n")
+    return f"$'{text}'"
+
+
+def command_specs(command: Command) -> list[str]:
+    """Unquoted `_arguments` specs of options and positional arguments of a command."""
+    specs = [spec for opt in command.options for spec in opt.argument_specs()]
+    for idx, x in enumerate(command.positional_args, 1):
+        specs.append(f"{idx}:{x.type_hint()}:{x.action_source()}")
+    if command.repeat_pos_args:
+        hint = command.repeat_pos_args.type_hint()
+        specs.append(f"*:{hint}:{command.repeat_pos_args.action_source()}")
+    return specs
+
+
+def command_tables(command: Command) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    """Flatten the command tree into spec and sub-command tables.
+
+    Keys of both tables are command paths like "git remote add".
+
+    Returns:
+        A tuple of `_arguments` specs of every command path that has any, and
+        "name:description" of sub-commands for every command path that has sub-commands.
+    """
+    specs_table, subcmds_table = {}, {}
+    stack = [(command.name, command)]
+    while stack:
+        path, cmd = stack.pop()
+        specs = command_specs(cmd)
+        if specs:
+            specs_table[path] = specs
+        if cmd.sub_commands:
+            subcmds_table[path] = [f"{x.name}:{x.description}" for x in cmd.sub_commands]
+            stack.extend((f"{path} {x.name}", x) for x in reversed(cmd.sub_commands))
+    return specs_table, subcmds_table
+
+
+def _iter_table_source(table_name: str, table: dict[str, list[str]]) -> Iterator[str]:
+    yield f"\n{table_name}=("
+    for path, values in table.items():
+        yield f"\n  {zsh_ansi_quote(path)} {zsh_ansi_quote(chr(10).join(values))}"
+    yield "\n)"
+
+
+def iter_table_completion_function(command: Command) -> Iterator[str]:
+    """Generate the data tables and the generic dispatcher of a command tree in chunks."""
+    func_name = command.name
+    var_name = re.sub(r"\W", "_", command.name)
+    specs_name, subcmds_name = f"_{var_name}_specs", f"_{var_name}_subcmds"
+    specs_table, subcmds_table = command_tables(command)
+
+    yield f"typeset -gA {specs_name} {subcmds_name}"
+    yield from _iter_table_source(specs_name, specs_table)
+    yield from _iter_table_source(subcmds_name, subcmds_table)
+
+    yield "\n"
+    yield f"""
+_{func_name}_dispatch() {{
+  local cmd_path=$1 next state
+  local -a specs subcmds
+  specs=( ${{(ps:\\n:){specs_name}[$cmd_path]}} )
+
+  if (( ! ${{+{subcmds_name}[$cmd_path]}} )); then
+    _arguments $specs
+    return
+  fi
+
+  _arguments -C $specs \\
+    '1: :->cmds' \\
+    '*:: :->args'
+
+  case $state in
+    cmds)
+      subcmds=( ${{(ps:\\n:){subcmds_name}[$cmd_path]}} )
+      _describe -t subcommands 'subcommands' subcmds
+      ;;
+    args)
+      next="$cmd_path $words[1]"
+      if (( ${{+{specs_name}[$next]}} || ${{+{subcmds_name}[$next]}} )); then
+        _{func_name}_dispatch "$next"
+      fi
+      ;;
+  esac
+}}
+
+_{func_name}() {{
+  _{func_name}_dispatch {zsh_ansi_quote(command.name)}
+}}
+"""
+
+
+def table_completion_function(command: Command) -> str:
+    """Generate the data tables and the generic dispatcher of a command tree."""
+    return "".join(iter_table_completion_function(command))
@@ -1,28 +1,71 @@
 from __future__ import annotations
 
+import dataclasses
+import filecmp
+import hashlib
 import inspect
 import os
+import secrets
 import shlex
+import shutil
 import stat
+import subprocess
+import sys
 import types
-from typing import Callable
+from typing import Callable, Iterable
 
 __all__ = [
     "chmod_execute",
+    "func_key",
     "is_lambda_func",
     "pattern_to_glob",
     "python_func_source",
     "set_shell_embed",
+    "slots_dataclass",
     "source_by_options_denpendency",
     "source_by_options_existence",
-    "zsh_completion_function"
+    "write_chunks",
+    "write_completion_items",
+    "write_if_changed",
+    "zsh_cache_helper_source",
+    "zsh_compile",
+    "zsh_completion_function",
+    "zsh_git_refs_helper_source",
 ]
 
+# output formats of completion commands, see `zsh_completion_function`
+OUTPUT_PROTOCOLS = ("lines", "describe", "tsv")
+
 
 def is_lambda_func(obj) -> bool:
     return isinstance(obj, types.LambdaType) and obj.__name__ == "<lambda>"
 
 
+def func_key(func: Callable) -> str:
+    """Name of func unique across the CLIs of the machine, like `package.module.func`.
+
+    Functions of scripts run as `__main__` are told apart by the path of the script.
+    """
+    module = func.__module__
+    if module == "__main__":
+        path = os.path.abspath(inspect.getsourcefile(func) or "")
+        module = f"__main__{hashlib.sha1(path.encode()).hexdigest()[:8]}"
+    return f"{module}.{func.__qualname__}"
+
+
+def slots_dataclass(cls=None, **kwargs):
+    """`dataclass` with `slots=True` if supported (Python 3.10+).
+
+    Instances have no `__dict__`, which saves memory for large command trees. Methods of
+    the class can't call `super()` without arguments, since the class is recreated.
+    """
+    if sys.version_info >= (3, 10):
+        kwargs["slots"] = True
+    if cls is None:
+        return lambda x: dataclasses.dataclass(x, **kwargs)
+    return dataclasses.dataclass(cls, **kwargs)
+
+
 def pattern_to_glob(pattern: str | tuple[str]) -> str:
     """Convert a pattern or tuple of patterns to a glob string."""
     if isinstance(pattern, str):
@@ -79,6 +122,11 @@ def zsh_completion_function(
     command: str,
     options_dependency: str | tuple[str, ...] | list[tuple[str, ...]] | None = None,
     exist_dependency: str | tuple[str, ...] | list[tuple[str, ...]] | None = None,
+    cache_ttl: int | None = None,
+    cache_key: str | None = None,
+    timeout_ms: int | None = None,
+    max_results: int | None = None,
+    protocol: str = "lines",
 ) -> str:
     """Generate source code of zsh completion function.
 
@@ -89,7 +137,25 @@ def zsh_completion_function(
             Default to None, which means no dependent options are required.
         exist_dependency (str | tuple[str, ...]): The options that must exist for this completion
             to be valid. Default to None.
+        cache_ttl (int): Seconds to serve the output of command from the on-disk cache.
+            Default to None, which means command runs on every completion.
+            The `__zcompy_cached` helper from `zsh_cache_helper_source` must be defined.
+        cache_key (str): Name of the cache entry, default to func_name. Dependent option
+            values are always part of the entry, so different values never share results.
+        timeout_ms (int): Latency budget of command in milliseconds. If command doesn't
+            finish in time, the last cached result is used and command keeps refreshing
+            the cache in background. Default to None, which means no limit.
+        max_results (int): If set, the word being completed (`$PREFIX`) and max_results are
+            passed to command after the dependent option values, so that command could
+            print only the matching entries. Default to None.
+        protocol (str): Output format of command, one of `OUTPUT_PROTOCOLS`.
+            "lines": `value description` lines, split by a loop over the lines.
+            "describe": `_describe` entries, read with one expansion.
+            "tsv": `value<TAB>description` lines, read with one expansion and passed to
+            `compadd -d` as arrays, the fastest for large outputs.
+            Default to "lines".
     """
+    assert protocol in OUTPUT_PROTOCOLS, f"Unknown output protocol: {protocol}"
     assignments = ""
     sources, var_names = [], []
     if options_dependency:
@@ -112,6 +178,35 @@ def zsh_completion_function(
         var_suffix = ' '.join(f'"${name}"' for name in var_names)
         command = f"{command} {var_suffix}"
 
+    if max_results is not None:
+        command = f'{command} "$PREFIX" {max_results}'
+
+    if cache_ttl is not None or timeout_ms is not None:
+        key = shlex.quote(cache_key or func_name)
+        timeout_flag = f"-t {timeout_ms} " if timeout_ms is not None else ""
+        command = f"__zcompy_cached {timeout_flag}{cache_ttl or 0} {key} {command}"
+
+    if protocol == "describe":
+        return f"""
+{func_name}() {{
+  local -a choices
+{assignments}
+  choices=(${{(f)"$({command})"}})
+  _describe -t choices 'choices' choices
+}}
+"""
+    if protocol == "tsv":
+        return f"""
+{func_name}() {{
+  local -a lines values displays expl
+{assignments}
+  lines=(${{(f)"$({command})"}})
+  values=("${{(@)lines%%$'\\t'*}}")
+  displays=("${{(@)lines/$'\\t'/ -- }}")
+  _wanted choices expl 'choices' compadd -l -d displays -a values
+}}
+"""
+
     shell_template = """
 {func_name}() {{
   local -a choices
@@ -131,13 +226,224 @@ def zsh_completion_function(
     return shell_source
 
 
-def python_func_source(func: Callable) -> str:
-    """Generate source code of a Python function that can be executed as script."""
+def zsh_cache_helper_source() -> str:
+    """zsh function that serves command output from a per-user cache directory.
+
+    ``__zcompy_cached [-t timeout_ms] <ttl> <key> <command> [args...]`` runs the command
+    only when the entry of key and args is older than ttl seconds. With ``-t``, the command
+    refreshes the entry in background and the last cached result (or nothing) is served if
+    it doesn't finish in timeout_ms. Entries are stored under ``$ZCOMPY_CACHE_DIR``, default
+    to ``$XDG_CACHE_HOME/zcompy``. Expired entries of key are removed when one is refreshed.
+    """
+    return """
+__zcompy_cached() {
+  local timeout=0 ttl key raw arg char key_file cache_file tmp lock deadline age count=0
+  local -a fresh running expired
+  if [[ $1 == -t ]]; then
+    timeout=$2
+    shift 2
+  fi
+  ttl=$1 key=$2
+  shift 2
+  raw=$key
+  for arg in "${@:2}"; do
+    raw+=$'\\0'$arg
+  done
+  # escape everything but [[:alnum:]._-], so that every entry maps to a distinct file
+  for char in ${(s::)raw}; do
+    if [[ $char == [[:alnum:]._-] ]]; then
+      cache_file+=$char
+    else
+      cache_file+="%$(( [##16] #char ))_"
+    fi
+    (( ++count == ${#key} )) && key_file=$cache_file
+  done
+  if (( ${#cache_file} > 200 )); then
+    "$@"
+    return
+  fi
+  cache_file="${ZCOMPY_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/zcompy}/$cache_file"
+  fresh=( $cache_file(N.ms-$ttl) )
+  if (( ! $#fresh )); then
+    tmp=$cache_file.$$.$RANDOM
+    mkdir -p ${cache_file:h} 2>/dev/null
+    # expired entries of other args of key (like every typed prefix) would pile up,
+    # they are removed on refresh. Stale entries are kept a day to serve timeouts.
+    (( age = timeout && ttl < 86400 ? 86400 : ttl ))
+    expired=( ${cache_file:h}/$key_file(|%0_*)(N.ms+$age) )
+    rm -f -- ${expired:#${(b)cache_file}}
+    if (( timeout )); then
+      # refresh in background, a refresh started less than a minute ago is reused
+      lock=$cache_file.lock
+      running=( $lock(N.mm-1) )
+      if (( ! $#running )); then
+        : >| $lock
+        {
+          if "$@" >| $tmp; then
+            mv -f $tmp $cache_file
+          else
+            rm -f $tmp
+          fi
+          rm -f $lock
+        } >/dev/null 2>&1 </dev/null &!
+      fi
+      if zmodload zsh/datetime zsh/zselect 2>/dev/null; then
+        deadline=$(( EPOCHREALTIME + timeout / 1000.0 ))
+        while [[ -e $lock ]] && (( EPOCHREALTIME < deadline )); do
+          zselect -t 1
+        done
+      fi
+    elif "$@" >| $tmp; then
+      mv -f $tmp $cache_file
+    else
+      rm -f $tmp
+    fi
+  fi
+  [[ -s $cache_file ]] && print -r -- "$(<$cache_file)"
+}
+"""
+
+
+def zsh_git_refs_helper_source() -> str:
+    """zsh functions that read the refs of the current git repository without running git.
+
+    ``__zcompy_git_dir`` sets ``reply`` to the git dir and the common dir of the repository.
+    ``__zcompy_git_refs <namespace>...`` sets ``reply`` to the full names of the refs under
+    the namespaces like ``refs/heads``. They are cached in the shell, and ``git for-each-ref``
+    runs only when the mtimes of HEAD, packed-refs or the directories of the namespaces change.
+    ``__zcompy_git_rev <ref>`` sets ``REPLY`` to the sha of ref, or to a stamp of packed-refs
+    if ref is packed, so that REPLY changes whenever ref moves, and leaves ``reply`` of
+    ``__zcompy_git_dir``. It fails for revisions like ``HEAD~2`` which can't be resolved from
+    the files of refs.
+    """
+    return r"""
+__zcompy_git_dir() {
+  local dir=$PWD git_dir common_dir
+  reply=()
+  if [[ -n $GIT_DIR ]]; then
+    git_dir=${GIT_DIR:a}
+  else
+    while [[ ! -e $dir/.git ]]; do
+      [[ $dir == / ]] && return 1
+      dir=${dir:h}
+    done
+    git_dir=$dir/.git
+    if [[ -f $git_dir ]]; then
+      # linked worktree or submodule
+      git_dir=${$(<$git_dir)#gitdir: }
+      [[ $git_dir == /* ]] || git_dir=$dir/$git_dir
+    fi
+  fi
+  common_dir=$git_dir
+  if [[ -f $git_dir/commondir ]]; then
+    common_dir=$(<$git_dir/commondir)
+    [[ $common_dir == /* ]] || common_dir=$git_dir/$common_dir
+  fi
+  reply=( $git_dir $common_dir )
+}
+
+__zcompy_git_refs() {
+  local git_dir common_dir key stamp
+  local -a files mtimes
+  __zcompy_git_dir || return 1
+  git_dir=$reply[1] common_dir=$reply[2]
+  reply=()
+  zmodload -F zsh/stat b:zstat && zmodload zsh/datetime || return 1
+  files=( $git_dir/HEAD(N) $common_dir/packed-refs(N) $common_dir/${^@}{,/**/*}(N/) )
+  zstat -A mtimes +mtime -- $files 2>/dev/null
+  key="$git_dir $*" stamp="$files $mtimes"
+  typeset -gA __zcompy_git_refs_stamps __zcompy_git_refs_cache
+  if [[ ${__zcompy_git_refs_stamps[$key]} != "$stamp" ]]; then
+    __zcompy_git_refs_cache[$key]=$(
+      git --git-dir=$git_dir for-each-ref --format='%(refname)' "$@" 2>/dev/null
+    )
+    # mtimes are in seconds, a change later in the same second would be missed
+    (( ${${(On)mtimes}[1]:-0} < EPOCHSECONDS )) || stamp=
+    __zcompy_git_refs_stamps[$key]=$stamp
+  fi
+  reply=( ${(f)__zcompy_git_refs_cache[$key]} )
+}
+
+__zcompy_git_rev() {
+  local ref=$1 name file line
+  local -A st
+  REPLY=
+  [[ $ref != -* ]] || return 1
+  __zcompy_git_dir || return 1
+  if [[ $ref == [[:xdigit:]](#c40) ]]; then
+    REPLY=$ref
+    return 0
+  fi
+  # follow symbolic refs like HEAD, with the lookup order of `git rev-parse`
+  repeat 5; do
+    line=
+    for name in $ref refs/$ref refs/tags/$ref refs/heads/$ref refs/remotes/$ref \
+        refs/remotes/$ref/HEAD; do
+      file=$reply[2]/$name
+      [[ $name == (|*_)HEAD ]] && file=$reply[1]/$name
+      if [[ -f $file ]]; then
+        line=$(<$file)
+        break
+      fi
+    done
+    if [[ $line == "ref: "* ]]; then
+      ref=${line#ref: }
+    elif [[ -n $line ]]; then
+      REPLY=$line
+      return 0
+    else
+      break
+    fi
+  done
+  # packed refs only change when packed-refs is replaced
+  [[ $ref != *[[:space:]~^:?*[\]* && $ref != *@\{* ]] || return 1
+  zmodload -F zsh/stat b:zstat && zmodload zsh/datetime || return 1
+  zstat -H st -- $reply[2]/packed-refs 2>/dev/null || return 1
+  (( st[mtime] < EPOCHSECONDS )) || return 1
+  REPLY="$reply[2] $ref $st[inode] $st[mtime]"
+}
+"""
+
+
+def write_completion_items(items, protocol="describe"):
+    """Write completion items to stdout in one write.
+
+    Items are strings or (value, description) pairs, like the items returned or yielded by
+    a bulk completion function. They are written in the format of protocol, see
+    `zsh_completion_function`. The source of this function is embedded in scripts.
+    """
+    import sys
+
+    sep = {"lines": " ", "describe": ":", "tsv": "\t"}[protocol]
+    lines = []
+    for item in items:
+        value, desc = (item, "") if isinstance(item, str) else item
+        line = str(value)
+        if protocol == "describe":
+            line = line.replace(":", "\\:")
+        if desc:
+            line += sep + " ".join(str(desc).split())
+        lines.append(line + "\n")
+    sys.stdout.write("".join(lines))
+
+
+def python_func_source(func: Callable, bulk: bool = False, protocol: str = "describe") -> str:
+    """Generate source code of a Python function that can be executed as script.
+
+    If bulk is True, the items returned by the function are written by
+    `write_completion_items` in the format of protocol.
+    """
     func_name = func.__name__
     func_source = inspect.getsource(func)
     num_args = func.__code__.co_argcount
+    if bulk:
+        writer_source = inspect.getsource(write_completion_items)
+        func_source = f"{func_source}\n\n{writer_source}"
+        call = f'write_completion_items({func_name}({{}}), "{protocol}")'
+    else:
+        call = f"{func_name}({{}})"
     if num_args == 0:
-        full_source = f"{func_source}\n{func_name}()"
+        full_source = f"{func_source}\n{call.format('')}"
     else:
         args_source = ", ".join([f"sys.argv[{i}]" for i in range(1, num_args + 1)])
         full_source = f"""
@@ -146,17 +452,27 @@ import sys
 {func_source}
 
 if len(sys.argv) > {num_args}:
-    {func_name}({args_source})
+    {call.format(args_source)}
 """
     return full_source
 
 
-def python_func_as_shell_source(func: Callable, ignore_exception: bool = False) -> tuple[str, str]:
+def python_func_as_shell_source(
+    func: Callable,
+    ignore_exception: bool = False,
+    daemon: bool = False,
+    bulk: bool = False,
+    protocol: str = "describe",
+) -> tuple[str, str]:
     """Generate shell code that embeds a Python function.
 
     Args:
         func (Callable): The Python function to embed.
         ignore_exception (bool): If True, exceptions will be redirected to /dev/null.
+        daemon (bool): If True, ask the zcompy daemon first and only run the embedded
+            source when the daemon is not available.
+        bulk (bool): If True, the items returned by the function are written at once in
+            the format of protocol, see `write_completion_items`.
 
     Returns:
         A tuple containing the shell code and the function name.
@@ -164,12 +480,14 @@ def python_func_as_shell_source(func: Callable, ignore_exception: bool = False)
     indent = " " * 2  # shell indent
     func_name = func.__name__
     num_args = func.__code__.co_argcount
-    full_source = python_func_source(func)
+    full_source = python_func_source(func, bulk, protocol)
     redirect_text = " 2>/dev/null" if ignore_exception else ""
+    daemon_key = shlex.quote(func_key(func))
+    daemon_text = f'{indent}__zcompy_daemon {daemon_key} "$@" && return\n' if daemon else ""
 
     if num_args == 0:
         shell_code = f"""__{func_name}() {{
-{indent}python3 -c \\
+{daemon_text}{indent}python3 -c \\
 {shlex.quote(full_source)}
 }}{redirect_text}
 """
@@ -179,7 +497,7 @@ def python_func_as_shell_source(func: Callable, ignore_exception: bool = False)
         shell_args = " ".join(f'"$arg{i}_value"' for i in range(1, num_args + 1))
 
         shell_code = f"""__{func_name}() {{
-{assignment}
+{daemon_text}{assignment}
 {indent}python3 -c \\
 {shlex.quote(full_source)} {shell_args} 2>/dev/null
 }}{redirect_text}
@@ -194,5 +512,74 @@ def chmod_execute(filename):
     os.chmod(filename, st.st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
 
 
+def write_chunks(
+    file_name: str, chunks: Iterable[str], unchanged: Callable[[], bool] | None = None
+) -> bool:
+    """Stream chunks to a temporary file, then atomically rename it to file_name.
+
+    The existing file is kept if the content is unchanged, so are its mtime and anything
+    cached by it. Readers never see a partially written file.
+
+    Args:
+        file_name: Path of the file.
+        chunks: Content of the file.
+        unchanged: Called after all chunks are streamed, if it returns True, the existing
+            file is known to be unchanged and kept without reading it again.
+
+    Returns:
+        True if the file is written.
+    """
+    dir_name, base_name = os.path.split(file_name)
+    tmp_name = os.path.join(dir_name, f".{base_name}.{secrets.token_hex(4)}.tmp")
+    try:
+        with open(tmp_name, "x") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        if unchanged is not None and unchanged():
+            os.unlink(tmp_name)
+            return False
+        if os.path.isfile(file_name) and filecmp.cmp(tmp_name, file_name, shallow=False):
+            os.unlink(tmp_name)
+            return False
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    return True
+
+
+def write_if_changed(file_name: str, content: str) -> bool:
+    """Write content to file only if it differs, so that the mtime of an unchanged file is kept.
+
+    Returns:
+        True if the file is written.
+    """
+    return write_chunks(file_name, [content])
+
+
+def zsh_compile(file_names: list[str]) -> list[str]:
+    """Compile zsh scripts to `.zwc` wordcode next to them with `zcompile`.
+
+    A `.zwc` file newer than its source is up to date and isn't compiled again.
+    Nothing is compiled if zsh is not available.
+
+    Returns:
+        The `.zwc` files compiled.
+    """
+    zsh = shutil.which("zsh")
+    if zsh is None:
+        return []
+
+    outdated = [
+        x for x in file_names
+        if not os.path.exists(f"{x}.zwc") or os.path.getmtime(f"{x}.zwc") < os.path.getmtime(x)
+    ]
+    if outdated:
+        script = 'for f in "$@"; do zcompile -Uz "$f" || exit 1; done'
+        subprocess.run([zsh, "-f", "-c", script, "zsh", *outdated], check=True)
+    return [f"{x}.zwc" for x in outdated]
+
+
 def set_shell_embed(value: bool = True):
     os.environ["ZCOMPY_SHELL_EMBED"] = "1" if value else "0"